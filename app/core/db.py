@@ -8,8 +8,8 @@ from app.models.user import UserModel
 from app.models.user import ProjectModel
 from app.models.user import RoleModel 
 from app.models.user import UserProjectRole
-from app.models.pre_processing import ExternalDBModel, GeneratedQuery
-from app.models.post_processing import Dashboard
+from app.models.pre_processing import ExternalDBModel, GeneratedQuery, ExternalDBReplica, SchemaVersion, ExternalDBDateRange, ExternalDBTableStats, ExternalDBColumnStats, SchemaCatalog, CatalogTable, CatalogColumn, CatalogForeignKey
+from app.models.post_processing import Dashboard, QueryExecutionLog, DashboardMaterialization, DashboardSnapshot, QuerySeriesState
 
 engine = create_engine(
     url= settings.DB_URI,
@@ -1,3 +1,4 @@
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -13,8 +14,127 @@ class Settings(BaseSettings):
     LLM_URI: str
     ENCRYPTION_KEY: str
 
+    # LLM service client
+    LLM_TIMEOUT_QUERIES_SECONDS: float = 120.0  # Query generation for a new external DB
+    LLM_TIMEOUT_NLQ_SECONDS: float = 30.0  # NL-to-SQL
+    LLM_TIMEOUT_TIME_QUERIES_SECONDS: float = 30.0  # Time window rewrites
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    LLM_HTTP2: bool = False  # Needs the h2 package (httpx[http2])
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    LLM_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    LLM_RETRIES: int = 2  # Extra attempts on connection errors, 429, 502 and 503
+    LLM_RETRY_BACKOFF_SECONDS: float = 0.5
+    LLM_RETRY_BACKOFF_MAX_SECONDS: float = 8.0
+    LLM_BREAKER_FAILURES: int = 5  # Consecutive failures that open the circuit (0 disables)
+    LLM_BREAKER_RESET_SECONDS: float = 30.0
+
+    # External database connection pooling
+    EXTERNAL_DB_POOL_SIZE: int = 5
+    EXTERNAL_DB_MAX_OVERFLOW: int = 5
+    EXTERNAL_DB_POOL_RECYCLE: int = 300
+    EXTERNAL_DB_MAX_ENGINES: int = 50
+    EXTERNAL_DB_ENGINE_IDLE_SECONDS: int = 900
+    EXTERNAL_DB_POOL_OVERRIDES: Dict[str, Dict[str, int]] = {}
+    EXTERNAL_DB_ASYNC_ENABLED: bool = True
+
+    # Read replicas
+    REPLICA_HEALTH_CHECK_SECONDS: int = 15
+    REPLICA_MAX_LAG_SECONDS: float = 30.0
+    REPLICA_LIST_TTL_SECONDS: int = 60
+    REPLICA_STRICT: bool = False  # Never fall back to the primary for chart reads of DBs with replicas
+    REPLICA_STRICT_DB_IDS: List[str] = []  # Same, for selected external DBs only
+
+    # Schema introspection
+    SCHEMA_INTROSPECTION_SCHEMAS: List[str] = []  # Empty: every non-system schema (PostgreSQL), the connected database (MySQL)
+    INTROSPECTION_MAX_WORKERS: int = 2  # Introspections running at once
+    INTROSPECTION_PARALLELISM: int = 4  # Connections per introspection, each reading a group of schemas
+    JOB_TTL_SECONDS: int = 3600  # How long finished background jobs can still be polled
+    JOB_EVENTS_POLL_SECONDS: float = 0.5  # How often job event streams check for changes
+    JOB_EVENTS_HEARTBEAT_SECONDS: float = 15  # Keep-alive comment interval on idle job event streams
+
+    # Date range profiling of external databases
+    DATE_PROFILE_ENABLED: bool = True
+    DATE_PROFILE_PARALLELISM: int = 4  # Connections probing tables at once, per external DB
+    DATE_PROFILE_TIMEOUT_MS: int = 5000  # Per table probe
+    DATE_PROFILE_SAMPLE_PERCENT: float = 1.0  # TABLESAMPLE SYSTEM retry when the exact probe times out (PostgreSQL)
+    DATE_PROFILE_MAX_TABLES: int = 200
+    DATE_PROFILE_DEFAULT_DAYS: int = 183  # Window used when no dates could be profiled
+
+    # Column statistics of external databases
+    STATS_SAMPLE_ROWS: int = 10000  # Rows read per table when the catalog has no statistics
+    STATS_TIMEOUT_MS: int = 10000  # Per table
+    STATS_PARALLELISM: int = 4
+    STATS_MAX_AGE_SECONDS: int = 86400  # Unchanged tables are re-profiled after this long
+    STATS_CACHE_TTL_SECONDS: int = 300
+
+    # Schema catalog
+    SCHEMA_CATALOG_CACHE_ENTRIES: int = 32  # Parsed schemas kept in memory
+
+    # Dashboard chart execution
+    DASHBOARD_MAX_WORKERS: int = 16
+    EXTERNAL_DB_MAX_CONCURRENT_QUERIES: int = 5
+    DASHBOARD_PIPELINE_ENABLED: bool = True  # Pipeline consistent batches on psycopg 3 connections
+
+    # Query guardrails
+    QUERY_STATEMENT_TIMEOUT_MS: int = 30000
+    QUERY_EXPLAIN_ENABLED: bool = False
+    QUERY_MAX_EXPLAIN_COST: Optional[float] = None
+    QUERY_EXPENSIVE_ACTION: str = "reject"  # "reject" or "queue"
+    QUERY_EXPENSIVE_CONCURRENCY: int = 1
+    QUERY_MAX_ROWS: Optional[int] = None  # Rows read per chart query; longer results are cut and flagged "truncated"
+    QUERY_LOG_OUTCOMES: bool = True
+    QUERY_MAX_SCAN_ROWS: Optional[int] = None  # Reject queries EXPLAIN expects to return more rows (needs QUERY_EXPLAIN_ENABLED)
+
+    # External query result cache
+    QUERY_CACHE_ENABLED: bool = True
+    QUERY_CACHE_TTL_SECONDS: int = 300
+    QUERY_CACHE_MAX_ENTRIES: int = 1000
+    QUERY_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    QUERY_CACHE_MAX_ENTRY_BYTES: int = 16 * 1024 * 1024
+    QUERY_CACHE_SHARED_PATH: Optional[str] = None
+    QUERY_CACHE_SHARED_MAX_BYTES: int = 1024 * 1024 * 1024
+
+    # Streaming query results
+    QUERY_STREAM_CHUNK_SIZE: int = 5000
+
+    # Chart downsampling (0 disables)
+    CHART_MAX_POINTS: int = 2000
+
+    # Dashboard snapshot materialization
+    MATERIALIZATION_ENABLED: bool = True
+    MATERIALIZATION_POLL_SECONDS: int = 30
+    MATERIALIZATION_DEFAULT_INTERVAL_SECONDS: int = 900
+    MATERIALIZATION_VIEW_THRESHOLD: Optional[int] = None
+    MATERIALIZATION_MAX_CONCURRENT: int = 2
+    SNAPSHOT_KEEP_VERSIONS: int = 5
+
+    # Time-window rewriting of time-based queries (needs sqlglot, else the LLM service rebinds them)
+    TIME_WINDOW_REWRITE_ENABLED: bool = True
+
+    # Incremental refresh of time-based queries
+    INCREMENTAL_REFRESH_ENABLED: bool = True
+    INCREMENTAL_OVERLAP_SECONDS: int = 86400  # Re-read this much before the last bucket for late-arriving rows
+    INCREMENTAL_FULL_REFRESH_SECONDS: int = 604800  # Periodic full re-read to reconcile corrections
+
+    # LLM query generation
+    QUERY_GENERATION_MAX_CONCURRENT: int = 4  # Generation jobs calling the LLM service at once
+
+    # NL-to-SQL schema context
+    NLQ_SCHEMA_PRUNING_ENABLED: bool = True
+    NLQ_SCHEMA_TOP_K: int = 8  # Best matching tables sent, before join-path tables are added
+    NLQ_SCHEMA_TOKEN_BUDGET: int = 4000  # Approximate token limit for db_schema (0 disables)
+    NLQ_SCHEMA_INDEX_CACHE_ENTRIES: int = 64
+    NLQ_SCHEMA_HINTS_TTL_SECONDS: int = 600  # How long an index keeps its past-query hints before being rebuilt
+
+    # NL-to-SQL response cache, per external DB
+    NLQ_CACHE_ENABLED: bool = True
+    NLQ_CACHE_TTL_SECONDS: int = 3600
+    NLQ_CACHE_MAX_ENTRIES_PER_TENANT: int = 500
+    NLQ_CACHE_MAX_TENANTS: int = 1000
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
 
-settings = Settings(_env_file=".env", _env_file_encoding="utf-8")
\ No newline at end of file
+settings = Settings(_env_file=".env", _env_file_encoding="utf-8")
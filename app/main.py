@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 from app.routes.user import router as user_router
@@ -6,13 +8,34 @@ from app.routes.post_processing import router as post_processing_router
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from app.core.logging_config import LoggingConfig
+from app.utils.engine_registry import engine_registry, async_engine_registry
+from app.services.materialization import run_materialization_worker
+from app.utils.llm_client import llm_client
+from app.core.settings import settings
 import logging
 
 LoggingConfig.apply()
 
 logger = logging.getLogger("app")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await llm_client.start()
+    stop_workers = asyncio.Event()
+    workers = []
+    if settings.MATERIALIZATION_ENABLED:
+        workers.append(asyncio.create_task(run_materialization_worker(stop_workers)))
+
+    yield
+
+    stop_workers.set()
+    await asyncio.gather(*workers, return_exceptions=True)
+    # Close pooled connections to external databases on shutdown
+    engine_registry.dispose_all()
+    await async_engine_registry.aclose()
+    await llm_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # ✅ Override OpenAPI Schema for Correct Swagger UI
 def custom_openapi():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, ForeignKey, DateTime, func, Table
+from sqlalchemy import Column, String, ForeignKey, DateTime, func, Table, Text, Double, Integer, Boolean
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 from app.core.base import Base
@@ -29,4 +29,56 @@ class Dashboard(Base):
 
     queries = relationship("GeneratedQuery", secondary="dashboard_query_association", back_populates="dashboards", overlaps="dashboard_query_links")
 
-    dashboard_query_links = relationship("DashboardQueryAssociation", back_populates="dashboard", cascade="all, delete-orphan", overlaps="queries")
\ No newline at end of file
+    dashboard_query_links = relationship("DashboardQueryAssociation", back_populates="dashboard", cascade="all, delete-orphan", overlaps="queries")
+
+class QueryExecutionLog(Base):
+    __tablename__ = "query_execution_log"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    external_db_id = Column(UUID, ForeignKey("external_db.id", ondelete="CASCADE"), nullable=False, index=True)
+    query_id = Column(UUID, ForeignKey("generated_queries.id", ondelete="SET NULL"), nullable=True)
+    query_fingerprint = Column(String(64), nullable=False, index=True)
+    query_text = Column(Text, nullable=False)
+    status = Column(String, nullable=False)
+    duration_ms = Column(Double, nullable=True)
+    estimated_cost = Column(Double, nullable=True)
+    row_count = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class DashboardMaterialization(Base):
+    __tablename__ = "dashboard_materialization"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    dashboard_id = Column(UUID, ForeignKey("dashboard.id", ondelete="CASCADE"), nullable=False, unique=True)
+    enabled = Column(Boolean, nullable=False, default=False)
+    refresh_interval_seconds = Column(Integer, nullable=True)
+    view_count = Column(Integer, nullable=False, default=0)
+    last_viewed_at = Column(DateTime, nullable=True)
+    last_refreshed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class DashboardSnapshot(Base):
+    __tablename__ = "dashboard_snapshot"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    dashboard_id = Column(UUID, ForeignKey("dashboard.id", ondelete="CASCADE"), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    payload = Column(Text, nullable=False)
+    duration_ms = Column(Double, nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class QuerySeriesState(Base):
+    __tablename__ = "query_series_state"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    query_id = Column(UUID, ForeignKey("generated_queries.id", ondelete="CASCADE"), nullable=False, unique=True)
+    query_fingerprint = Column(String(64), nullable=False)
+    columns = Column(Text, nullable=False)
+    rows = Column(Text, nullable=False)
+    max_label_seen = Column(String, nullable=False)
+    full_refreshed_at = Column(DateTime, nullable=False)
+    refreshed_at = Column(DateTime, nullable=False)
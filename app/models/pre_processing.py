@@ -1,6 +1,6 @@
 from uuid import uuid4
-from sqlalchemy import Column, String, ForeignKey, DateTime, func, Text, Double, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, ForeignKey, DateTime, func, Text, Double, Boolean, Integer, BigInteger, LargeBinary
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.dialects.postgresql import UUID
 from app.core.base import Base
 
@@ -12,7 +12,7 @@ class ExternalDBModel(Base):
     connection_string = Column(String, nullable=False)
     domain = Column(String, nullable=True)
     db_metadata = Column(Text, nullable=True)
-    schema_structure = Column(Text, nullable=False)
+    schema_structure = deferred(Column(Text, nullable=False))  # Superseded by the schema catalog, see SchemaCatalog
     database_provider = Column(Text, nullable=True) 
     min_date = Column(DateTime, nullable= True)
     max_date = Column(DateTime, nullable= True)
@@ -32,6 +32,137 @@ class ExternalDBModel(Base):
         cascade="all, delete-orphan"
     )
 
+    replicas = relationship("ExternalDBReplica", back_populates="external_db", cascade="all, delete-orphan")
+
+    schema_versions = relationship("SchemaVersion", back_populates="external_db", cascade="all, delete-orphan")
+
+    date_ranges = relationship("ExternalDBDateRange", back_populates="external_db", cascade="all, delete-orphan")
+
+    table_stats = relationship("ExternalDBTableStats", back_populates="external_db", cascade="all, delete-orphan")
+
+    column_stats = relationship("ExternalDBColumnStats", back_populates="external_db", cascade="all, delete-orphan")
+
+    schema_catalog = relationship("SchemaCatalog", back_populates="external_db", cascade="all, delete-orphan", uselist=False)
+
+    catalog_tables = relationship("CatalogTable", back_populates="external_db", cascade="all, delete-orphan")
+
+class ExternalDBReplica(Base):
+    __tablename__ = 'external_db_replica'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    external_db_id = Column(UUID, ForeignKey('external_db.id', ondelete="CASCADE"), nullable=False, index=True)
+    connection_string = Column(String, nullable=False)
+    max_lag_seconds = Column(Double, nullable=True)
+    enabled = Column(Boolean, nullable=False, default=True)
+    created_at= Column(DateTime, nullable= False, server_default=func.now())
+
+    external_db = relationship("ExternalDBModel", back_populates="replicas")
+
+class SchemaVersion(Base):
+    __tablename__ = 'external_db_schema_version'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    external_db_id = Column(UUID, ForeignKey('external_db.id', ondelete="CASCADE"), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    schema_hash = Column(String(64), nullable=False)
+    table_fingerprints = Column(Text, nullable=False)
+    diff = Column(Text, nullable=False)
+    generated_domain = Column(String, nullable=True)  # Domain queries were generated for against this version
+    created_at= Column(DateTime, nullable= False, server_default=func.now())
+
+    external_db = relationship("ExternalDBModel", back_populates="schema_versions")
+
+class ExternalDBDateRange(Base):
+    __tablename__ = 'external_db_date_range'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    external_db_id = Column(UUID, ForeignKey('external_db.id', ondelete="CASCADE"), nullable=False, index=True)
+    table_name = Column(String, nullable=False)
+    column_name = Column(String, nullable=False)
+    min_value = Column(DateTime, nullable=False)
+    max_value = Column(DateTime, nullable=False)
+    sampled = Column(Boolean, nullable=False, default=False)  # Read from a TABLESAMPLE, so only approximate
+    profiled_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    external_db = relationship("ExternalDBModel", back_populates="date_ranges")
+
+class ExternalDBTableStats(Base):
+    __tablename__ = 'external_db_table_stats'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    external_db_id = Column(UUID, ForeignKey('external_db.id', ondelete="CASCADE"), nullable=False, index=True)
+    table_name = Column(String, nullable=False)
+    row_count = Column(BigInteger, nullable=True)
+    fingerprint = Column(String, nullable=True)  # Table fingerprint the statistics were collected for
+    sampled = Column(Boolean, nullable=False, default=False)
+    collected_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    external_db = relationship("ExternalDBModel", back_populates="table_stats")
+
+class ExternalDBColumnStats(Base):
+    __tablename__ = 'external_db_column_stats'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    external_db_id = Column(UUID, ForeignKey('external_db.id', ondelete="CASCADE"), nullable=False, index=True)
+    table_name = Column(String, nullable=False)
+    column_name = Column(String, nullable=False)
+    distinct_count = Column(Double, nullable=True)
+    null_fraction = Column(Double, nullable=True)
+    min_value = Column(Text, nullable=True)
+    max_value = Column(Text, nullable=True)
+
+    external_db = relationship("ExternalDBModel", back_populates="column_stats")
+
+class SchemaCatalog(Base):
+    __tablename__ = 'external_db_schema_catalog'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    external_db_id = Column(UUID, ForeignKey('external_db.id', ondelete="CASCADE"), nullable=False, unique=True)
+    content_hash = Column(String(64), nullable=False)  # sha256 of the uncompressed payload
+    payload = deferred(Column(LargeBinary, nullable=False))  # zlib-compressed compact JSON of the whole schema
+    raw_bytes = Column(Integer, nullable=False)
+    table_count = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    external_db = relationship("ExternalDBModel", back_populates="schema_catalog")
+
+class CatalogTable(Base):
+    __tablename__ = 'external_db_catalog_table'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    external_db_id = Column(UUID, ForeignKey('external_db.id', ondelete="CASCADE"), nullable=False, index=True)
+    name = Column(String, nullable=False)
+    position = Column(Integer, nullable=False)
+    fingerprint = Column(String(64), nullable=False)
+    primary_key_name = Column(String, nullable=True)
+
+    external_db = relationship("ExternalDBModel", back_populates="catalog_tables")
+    columns = relationship("CatalogColumn", back_populates="table", cascade="all, delete-orphan", order_by="CatalogColumn.position")
+    foreign_keys = relationship("CatalogForeignKey", back_populates="table", cascade="all, delete-orphan", order_by="CatalogForeignKey.position")
+
+class CatalogColumn(Base):
+    __tablename__ = 'external_db_catalog_column'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    table_id = Column(UUID, ForeignKey('external_db_catalog_table.id', ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    name = Column(String, nullable=False)
+    data_type = Column(String, nullable=False)
+    primary_key_position = Column(Integer, nullable=True)
+
+    table = relationship("CatalogTable", back_populates="columns")
+
+class CatalogForeignKey(Base):
+    __tablename__ = 'external_db_catalog_foreign_key'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    table_id = Column(UUID, ForeignKey('external_db_catalog_table.id', ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    column_name = Column(String, nullable=False)
+    referenced_table = Column(String, nullable=False)
+
+    table = relationship("CatalogTable", back_populates="foreign_keys")
+
 class GeneratedQuery(Base):
     __tablename__ = 'generated_queries'
 
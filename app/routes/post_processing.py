@@ -1,16 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Query, Request, BackgroundTasks
 from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from app.models.pre_processing import ExternalDBModel, GeneratedQuery
 from app.models.post_processing import Dashboard
-from app.services.post_processing import process_time_based_queries,execute_external_query, get_paginated_queries, create_or_get_dashboard, add_queries_to_dashboard, fetch_dashboard_chart_data, remove_queries_from_dashboard, delete_dashboard
+from app.services.post_processing import process_time_based_queries,execute_external_query_async, load_saved_query, stream_external_query, get_paginated_queries, create_or_get_dashboard, add_queries_to_dashboard, fetch_dashboard_chart_data, fetch_dashboard_chart_data_async, remove_queries_from_dashboard, delete_dashboard, get_expensive_queries
+from app.services.materialization import configure_materialization, record_dashboard_view, get_latest_snapshot, refresh_dashboard_snapshot, rows_to_columnar, snapshot_serves
 from app.core.db import get_db
+from app.utils.result_cache import result_cache
+from app.utils.concurrency import cancel_on_disconnect, iterate_until_disconnect
+from app.utils.response_formats import negotiate_format, columnar_json_response, arrow_response, dashboard_arrow_response, ARROW, COLUMNAR, ROWS
 from app.utils.auth_dependencies import get_current_user, get_user_project_role
-from app.schemas import ExecuteQueryRequest,TimeBasedUpdateRequest,TimeBasedQueriesUpdateResponse,DashboardSchema, CurrentUser, CreateDefaultDashboardRequest, AddQueriesToDashboardRequest, DashboardResponse, DashboardQueryDeleteRequest
+from app.schemas import ExecuteQueryRequest,TimeBasedUpdateRequest,TimeBasedQueriesUpdateResponse,DashboardSchema, CurrentUser, CreateDefaultDashboardRequest, AddQueriesToDashboardRequest, DashboardResponse, DashboardQueryDeleteRequest, DashboardMaterializationRequest
 import logging
 from app.core.settings import settings
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 
 
@@ -20,26 +26,65 @@ router = APIRouter(prefix="/execute-query", tags=["External Database"])
 logger = logging.getLogger("app")
 
 @router.post("/")
-def execute_query(
-    data: ExecuteQueryRequest, db: Session = Depends(get_db)
+async def execute_query(
+    data: ExecuteQueryRequest, request: Request, db: Session = Depends(get_db), accept: Optional[str] = Header(None)
 ):
+    """
+    Execute a saved query. The response format follows the Accept header: row-oriented JSON
+    by default, columnar JSON or Arrow IPC on request, or NDJSON when `stream` is set.
+    The query is cancelled if the client disconnects before it finishes.
+    """
     print(data)
-    external_db = db.query(ExternalDBModel).filter(ExternalDBModel.id == data.external_db_id).first()
-    if not external_db:
-        raise HTTPException(status_code=404, detail="External database not found")
+    external_db, generated_query = await run_in_threadpool(load_saved_query, db, data.external_db_id, data.query_id)
 
-    generated_query = db.query(GeneratedQuery).filter(GeneratedQuery.id == data.query_id).first()
-    if not generated_query:
-        raise HTTPException(status_code=404, detail="Query not found")
-
-    result = execute_external_query(external_db, generated_query.query_text)
+    if data.stream:
+        meta = {
+            "id": str(generated_query.id),
+            "chartType": generated_query.chart_type,
+            "report": generated_query.explanation
+        }
+        stream = stream_external_query(external_db, generated_query.query_text, meta=meta, query_id=generated_query.id)
+        try:
+            # Run the query and emit the header eagerly so SQL errors still surface as an HTTP error
+            header = await run_in_threadpool(next, stream)
+        except Exception as e:
+            stream.close()
+            logger.error(f"Streaming query {generated_query.id} failed: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"Error executing query: {str(e)}")
+        return StreamingResponse(iterate_until_disconnect(request, [header], stream), media_type="application/x-ndjson")
+
+    response_format = negotiate_format(accept)
+    result = await cancel_on_disconnect(request, execute_external_query_async(
+        external_db, generated_query.query_text, max_points=data.max_points,
+        columnar=response_format != ROWS, query_id=generated_query.id
+    ))
+    if response_format == ARROW:
+        return arrow_response(result["data"], metadata={
+            "x_axis": result["x_axis"],
+            "y_axis": result["y_axis"],
+            "id": str(generated_query.id),
+            "chartType": generated_query.chart_type,
+            "report": generated_query.explanation,
+            "truncated": result.get("truncated", False)
+        })
+    if response_format == COLUMNAR:
+        return columnar_json_response({
+            "result": result["data"],
+            "x_axis": result["x_axis"],
+            "y_axis": result["y_axis"],
+            "id": str(generated_query.id),
+            "chartType": generated_query.chart_type,
+            "report": generated_query.explanation,
+            "truncated": result.get("truncated", False)
+        })
     return {
         "result": result["data"],
         "x_axis": result["x_axis"],
         "y_axis": result["y_axis"],
         "id": generated_query.id,
         "chartType": generated_query.chart_type,
-        "report": generated_query.explanation
+        "report": generated_query.explanation,
+        "truncated": result.get("truncated", False)
         }
 
 @router.get("/")
@@ -85,6 +130,26 @@ def get_existing_or_initial_queries(
         "user_generated": user_generated
     }
 
+@router.get("/cache/stats")
+def get_query_cache_stats(current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Hit/miss counters and occupancy of the external query result cache.
+    """
+    return result_cache.stats()
+
+@router.get("/guardrails/expensive")
+def get_expensive_query_report(
+    external_db_id: UUID,
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Recorded execution outcomes per query for an external DB: durations, EXPLAIN costs,
+    timeouts, rejections and row-cap truncations, slowest first.
+    """
+    return {"queries": get_expensive_queries(db, external_db_id, limit)}
+
 @router.get("/load-more")
 def load_more_queries(external_db_id: str, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     user_id = current_user.user_id
@@ -225,22 +290,90 @@ def get_user_dashboards(
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
     
 @router.get("/dashboard/chart-data")
-def get_dashboard_chart_data(
+async def get_dashboard_chart_data(
     dashboard_id: UUID, 
+    request: Request,
+    background_tasks: BackgroundTasks,
+    max_points: Optional[int] = Query(None, ge=0),
+    snapshot: bool = False,
+    refresh: bool = False,
+    consistent: bool = False,
     db: Session = Depends(get_db), 
-    current_user=Depends(get_current_user)
+    current_user=Depends(get_current_user),
+    accept: Optional[str] = Header(None)
 ):
     """
     Fetch chart data for a given dashboard.
+    `max_points` caps the points per chart (0 returns every row). Columnar JSON and Arrow IPC
+    are served when requested through the Accept header.
+    With `snapshot`, the latest materialized snapshot is returned (with its age) when one exists and
+    matches `max_points`;
+    `refresh` schedules a background refresh; one is also scheduled when no snapshot exists yet.
+    With `consistent`, all charts are read from one database snapshot in a single batch.
     """
     try:
-        return fetch_dashboard_chart_data(db, dashboard_id)
+        response_format = negotiate_format(accept)
+        # Session work runs in the threadpool; only external queries are awaited on the event loop
+        await run_in_threadpool(record_dashboard_view, db, dashboard_id)
+
+        chart_data = await run_in_threadpool(get_latest_snapshot, db, dashboard_id) if snapshot else None
+        if refresh or (snapshot and chart_data is None):
+            background_tasks.add_task(refresh_dashboard_snapshot, dashboard_id)
+        if chart_data is not None and not snapshot_serves(chart_data, max_points):
+            chart_data = None  # Stored at another point cap; read live instead
+
+        if chart_data is not None:
+            if response_format != ROWS:
+                chart_data = rows_to_columnar(chart_data)
+        elif consistent:
+            chart_data = await cancel_on_disconnect(request, run_in_threadpool(
+                fetch_dashboard_chart_data, db, dashboard_id, max_points=max_points, columnar=response_format != ROWS, consistent=True
+            ))
+        else:
+            chart_data = await cancel_on_disconnect(request, fetch_dashboard_chart_data_async(
+                db, dashboard_id, max_points=max_points, columnar=response_format != ROWS
+            ))
+
+        if response_format == COLUMNAR:
+            return columnar_json_response(chart_data)
+        if response_format == ARROW:
+            return dashboard_arrow_response(chart_data)
+        return chart_data
     except HTTPException as e:
         logger.error(f"HTTP Error: {e.detail}")
         raise
     except Exception as e:
         logger.exception(f"Unexpected error while fetching chart data for dashboard {dashboard_id}")
         raise HTTPException(status_code=500, detail="Internal server error.")
+
+@router.put("/dashboard/materialization")
+def set_dashboard_materialization(
+    data: DashboardMaterializationRequest,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """
+    Enable or disable scheduled snapshot refreshes for a dashboard.
+    """
+    config = configure_materialization(db, data.dashboard_id, data.enabled, data.refresh_interval_seconds)
+    return {
+        "dashboard_id": str(data.dashboard_id),
+        "enabled": config.enabled,
+        "refresh_interval_seconds": config.refresh_interval_seconds,
+        "last_refreshed_at": config.last_refreshed_at
+    }
+
+@router.post("/dashboard/snapshot/refresh", status_code=status.HTTP_202_ACCEPTED)
+def trigger_dashboard_snapshot_refresh(
+    dashboard_id: UUID,
+    background_tasks: BackgroundTasks,
+    current_user=Depends(get_current_user)
+):
+    """
+    Refresh a dashboard's snapshot in the background.
+    """
+    background_tasks.add_task(refresh_dashboard_snapshot, dashboard_id)
+    return {"message": "Snapshot refresh scheduled", "dashboard_id": str(dashboard_id)}
     
 @router.delete("/dashboard/delete-queries")
 def remove_queries(
@@ -282,4 +415,4 @@ def delete_dashboard_endpoint(
         raise
     except Exception as e:
         logger.exception(f"Unexpected error while deleting dashboard {dashboard_id}")
-        raise HTTPException(status_code=500, detail="Internal server error.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error.")
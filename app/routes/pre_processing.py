@@ -1,30 +1,50 @@
 import httpx
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status,Body
+from fastapi import APIRouter, Depends, HTTPException, status,Body, BackgroundTasks
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.schemas import ExternalDBCreateRequest, ExternalDBResponse, CurrentUser, UpdateDBRequest,ExternalDBCreateChatRequest
-from app.services.pre_processing import create_or_update_external_db, update_record, post_to_llm, save_query_to_db
+from starlette.concurrency import run_in_threadpool
+from uuid import UUID
+from app.schemas import ExternalDBCreateRequest, ExternalDBResponse, JobAcceptedResponse, CurrentUser, UpdateDBRequest,ExternalDBCreateChatRequest, ExternalDBReplicaCreateRequest, ExternalDBReplicaResponse
+from app.services.pre_processing import create_or_update_external_db, generate_queries, current_queries, run_query_generation_job
 from app.services.pre_processing import process_nl_to_sql_query,post_to_nlq_llm,save_nl_sql_query
+from app.services.pre_processing import nl_sql_cache_key, cached_nl_sql_query, cache_nl_sql_query, stream_nl_to_sql
+from app.services.pre_processing import add_external_db_replica, list_external_db_replicas, remove_external_db_replica, run_external_db_job
+from app.services.pre_processing import refresh_external_db_schema, run_schema_refresh_job, list_date_ranges
+from app.services.statistics import refresh_column_statistics, run_statistics_job, get_column_statistics
+from app.utils.jobs import job_registry
+from app.utils.serialization import dumps_event
 from app.utils.auth_dependencies import get_current_user
 from app.core.db import get_db
 from app.core.settings import settings
 
 router = APIRouter(prefix="/external-db", tags=["External Database"])
 
+# Documents the body of endpoints that hand their work to a background job
+JOB_ACCEPTED = {status.HTTP_202_ACCEPTED: {"model": JobAcceptedResponse, "description": "Job started; poll GET /external-db/jobs/{job_id}"}}
+
 logger = logging.getLogger("app")
 
 
-@router.post("/", response_model=ExternalDBResponse, status_code=status.HTTP_201_CREATED)
+@router.post("/", response_model=ExternalDBResponse, status_code=status.HTTP_201_CREATED, responses=JOB_ACCEPTED)
 async def create_external_db(
     data: ExternalDBCreateRequest,
+    background_tasks: BackgroundTasks,
+    wait: bool = True,
     db: Session = Depends(get_db),
     current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     API to connect to an external database, retrieve schema, and store it in the internal database.
+    With `wait=false` the introspection runs in the background and a job id is returned right away;
+    poll GET /external-db/jobs/{job_id} for progress and the resulting db_entry_id.
     """
     logger.info("Initiating external DB creation for user: %s", current_user.user_id)
+    if not wait:
+        job = job_registry.create("external_db_introspection", user_id=current_user.user_id)
+        background_tasks.add_task(run_external_db_job, job.id, data, current_user)
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"job_id": job.id, "status": job.status})
     try:
         result = await create_or_update_external_db(data, db, current_user)
         logger.info("Successfully created/updated external DB for user: %s", current_user.user_id)
@@ -42,26 +62,44 @@ async def create_external_db(
         logger.exception("Unexpected error during external DB creation for user: %s", current_user.user_id)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error processing external DB: {str(e)}")
 
-@router.patch("/", status_code=status.HTTP_202_ACCEPTED)
+@router.patch("/", status_code=status.HTTP_202_ACCEPTED, responses=JOB_ACCEPTED)
 async def update_record_and_call_llm(
     data: UpdateDBRequest,
+    background_tasks: BackgroundTasks,
+    wait: bool = False,
     db: Session = Depends(get_db),
     current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     API to update external DB model and call LLM service for processing.
+    Generation runs as a background job: poll GET /external-db/jobs/{job_id} or stream
+    GET /external-db/jobs/{job_id}/events. Resubmitting while a job runs for the same external DB
+    in this process returns that job, or 409 if the domain or `force` differ. With `wait=true`
+    the queries are generated within the request.
     """
     logger.info("Updating record and calling LLM for user: %s", current_user.user_id)
-    base_uri = settings.LLM_URI
-    url = f"{base_uri}/queries/"
+    current = await run_in_threadpool(current_queries, data, db)
+    if current:
+        return current
+    if not wait:
+        params = {"domain": data.domain, "force": data.force}
+        job, created = job_registry.create_or_join("query_generation", key=data.db_entry_id, params=params, user_id=current_user.user_id)
+        if created:
+            background_tasks.add_task(run_query_generation_job, job.id, data, current_user)
+        elif job.params != params:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Query generation job {job.id} is already running for this external DB with different parameters."
+            )
+        else:
+            logger.info("Joining running query generation job %s for external DB %s.", job.id, data.db_entry_id)
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"job_id": job.id, "status": job.status})
     try:
-        saved_data = await update_record(data, db, current_user)
-        logger.debug("Record updated successfully for user: %s, data: %s", current_user.user_id, saved_data)
-        llm_response = await post_to_llm(url, saved_data)
-        logger.debug("Received response from LLM for user: %s, response: %s", current_user.user_id, llm_response)
-        response = await save_query_to_db(queries=llm_response, db=db, db_entry_id=data.db_entry_id, user_id=current_user.user_id)
+        response = await generate_queries(data, db, current_user)
         logger.info("Successfully saved LLM query to DB for user: %s", current_user.user_id)
         return response
+    except HTTPException:
+        raise
     except httpx.HTTPStatusError as e:
         logger.error("LLM service returned an error for user: %s - %s", current_user.user_id, e.response.text)
         raise HTTPException(status_code=e.response.status_code, detail=f"LLM service returned an error: {e.response.text}")
@@ -75,6 +113,68 @@ async def update_record_and_call_llm(
         logger.exception("Unexpected error during record update and LLM call for user: %s", current_user.user_id)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
+@router.post("/{external_db_id}/refresh-schema", responses=JOB_ACCEPTED)
+async def refresh_schema(
+    external_db_id: UUID,
+    background_tasks: BackgroundTasks,
+    wait: bool = True,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Refresh an external DB's stored schema, re-introspecting only tables that changed.
+    Returns whether the schema changed, its current version and the table diff.
+    With `wait=false` it runs as a background job, see GET /external-db/jobs/{job_id}.
+    """
+    if not wait:
+        job, created = job_registry.create_or_join("schema_refresh", key=str(external_db_id), user_id=current_user.user_id)
+        if created:
+            background_tasks.add_task(run_schema_refresh_job, job.id, external_db_id)
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"job_id": job.id, "status": job.status})
+    return await refresh_external_db_schema(external_db_id, db)
+
+@router.get("/{external_db_id}/date-ranges")
+def get_date_ranges(
+    external_db_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Profiled min/max of every date and timestamp column of an external DB.
+    """
+    return list_date_ranges(external_db_id, db)
+
+@router.get("/{external_db_id}/statistics")
+def get_statistics(
+    external_db_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Profiled row counts and per-column distinct counts, null fractions and min/max of an external DB.
+    """
+    return get_column_statistics(external_db_id, db)
+
+@router.post("/{external_db_id}/statistics/refresh", responses=JOB_ACCEPTED)
+async def refresh_statistics(
+    external_db_id: UUID,
+    background_tasks: BackgroundTasks,
+    wait: bool = True,
+    force: bool = False,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Collect column statistics for tables that changed or whose statistics are stale (all with `force`).
+    With `wait=false` it runs as a background job, see GET /external-db/jobs/{job_id}.
+    """
+    if not wait:
+        job, created = job_registry.create_or_join("column_statistics", key=str(external_db_id), user_id=current_user.user_id)
+        if created:
+            background_tasks.add_task(run_statistics_job, job.id, external_db_id, force)
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"job_id": job.id, "status": job.status})
+    return await refresh_column_statistics(external_db_id, db, force)
+
 @router.post("/nl-to-sql", status_code=status.HTTP_200_OK)
 async def convert_nl_to_sql(data: ExternalDBCreateChatRequest = Body(...), db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
         base_uri = settings.LLM_URI
@@ -86,11 +186,24 @@ async def convert_nl_to_sql(data: ExternalDBCreateChatRequest = Body(...), db: S
             logger.info("Received NL query: %s", data.nl_query)
             nlq_data, db_entry_id = await process_nl_to_sql_query(data, db, current_user)
             logger.info("Processed NL to SQL Query, Data: %s, DB Entry ID: %s", nlq_data, db_entry_id)
+
+            # The same question against the same schema reuses the saved query instead of asking the LLM again
+            cache_key = await run_in_threadpool(nl_sql_cache_key, db, db_entry_id, data.nl_query, nlq_data["db_type"])
+            cached = await run_in_threadpool(cached_nl_sql_query, db, db_entry_id, cache_key)
+            if cached:
+                return {
+                    "status": "success",
+                    "sql_query": cached["sql_response"],
+                    "save_status": {"status": "success", "message": "SQL query reused from cache", "query_id": cached["query_id"]},
+                    "cached": True
+                }
+
             sql_response = await post_to_nlq_llm(url, nlq_data)
             # logger.info("Received SQL response: %s", sql_response)
 
             save_result = await save_nl_sql_query(sql_response, db, db_entry_id, user_id)        
             logger.info("Save result: %s", save_result)
+            cache_nl_sql_query(db_entry_id, cache_key, sql_response, save_result)
 
             return {
                 "status": "success",
@@ -114,4 +227,93 @@ async def convert_nl_to_sql(data: ExternalDBCreateChatRequest = Body(...), db: S
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error processing NL to SQL request: {str(e)}"
-            )
\ No newline at end of file
+            )
+
+@router.post("/nl-to-sql/stream")
+async def stream_nl_to_sql_events(
+    data: ExternalDBCreateChatRequest = Body(...),
+    execute: bool = False,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Server-sent events variant of /nl-to-sql: streams the SQL while the LLM service produces it,
+    then the explanation and chart type, and saves the query at the end. With `execute=true`
+    the finished SQL is run right away and its result sent as a final event.
+    """
+    url = f"{settings.LLM_URI}/api/nlq/convert_nl_to_sql"
+    logger.info("Received NL query to stream: %s", data.nl_query)
+    nlq_data, db_entry_id = await process_nl_to_sql_query(data, db, current_user)
+    cache_key = await run_in_threadpool(nl_sql_cache_key, db, db_entry_id, data.nl_query, nlq_data["db_type"])
+    cached = await run_in_threadpool(cached_nl_sql_query, db, db_entry_id, cache_key)
+    return StreamingResponse(
+        stream_nl_to_sql(url, nlq_data, db_entry_id, current_user.user_id, cache_key, cached, execute),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/replicas", response_model=ExternalDBReplicaResponse, status_code=status.HTTP_201_CREATED)
+def create_external_db_replica(
+    data: ExternalDBReplicaCreateRequest,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Register a read replica; chart queries of the external DB are then routed to its replicas.
+    """
+    return add_external_db_replica(data, db)
+
+@router.get("/{external_db_id}/replicas")
+def get_external_db_replicas(
+    external_db_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    List an external DB's read replicas with their health, lag and in-flight requests.
+    """
+    return list_external_db_replicas(external_db_id, db)
+
+@router.delete("/replicas/{replica_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_external_db_replica(
+    replica_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Remove a read replica and close its pooled connections.
+    """
+    remove_external_db_replica(replica_id, db)
+
+@router.get("/jobs/{job_id}")
+def get_job_status(
+    job_id: str,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Status and progress of a background external DB job started or joined by the current user;
+    other users get 404. Jobs live in the API process that started them, so with several workers
+    a job is only found (and resubmissions only deduplicated) on that worker.
+    """
+    job = job_registry.get(job_id, current_user.user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Server-sent events with the job's status on every change; the stream ends once the job finishes.
+    Only the users who started or joined the job can follow it, on the worker that runs it.
+    """
+    if not job_registry.get(job_id, current_user.user_id):
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def events():
+        async for state in job_registry.watch(job_id, settings.JOB_EVENTS_POLL_SECONDS, settings.JOB_EVENTS_HEARTBEAT_SECONDS):
+            yield b": keep-alive\n\n" if state is None else dumps_event(state, event=state["status"])
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
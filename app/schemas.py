@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, Any, List
 from uuid import UUID
 from datetime import datetime
@@ -41,11 +41,24 @@ class ExternalDBCreateRequest(BaseModel):
 class ExternalDBResponse(BaseModel):
     db_entry_id: UUID
 
+class JobAcceptedResponse(BaseModel):
+    job_id: str
+    status: str
+
+class ExternalDBReplicaCreateRequest(BaseModel):
+    external_db_id: UUID
+    connection_string: str
+    max_lag_seconds: Optional[float] = None
+
+class ExternalDBReplicaResponse(BaseModel):
+    replica_id: UUID
+
 class UpdateDBRequest(BaseModel):
     project_id: str
     db_entry_id: str
     domain: str
     api_key: Optional[str] =None
+    force: bool = False  # Regenerate queries even if the schema and domain did not change
 
 class CurrentUser(BaseModel):
     user_id: UUID
@@ -63,6 +76,8 @@ class ExternalDBCreateChatRequest(BaseModel):
 class ExecuteQueryRequest(BaseModel):
     external_db_id: UUID
     query_id: UUID
+    stream: bool = False
+    max_points: Optional[int] = Field(None, ge=0)
     
 @dataclass
 class QueryWithId(BaseModel):
@@ -119,6 +134,11 @@ class DashboardResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class DashboardMaterializationRequest(BaseModel):
+    dashboard_id: UUID
+    enabled: bool = True
+    refresh_interval_seconds: Optional[int] = None
+
 class DashboardQueryDeleteRequest(BaseModel):
     dashboard_id: UUID
     query_ids: list[UUID]
\ No newline at end of file
@@ -0,0 +1,137 @@
+import json
+import logging
+import math
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from sqlalchemy.orm import Session
+from app.core.settings import settings
+from app.models.post_processing import QuerySeriesState
+from app.utils.query_guard import row_cap
+from app.utils.result_cache import sql_fingerprint
+from app.utils.serialization import json_default
+from app.utils.time_window import raise_lower_bound
+
+logger = logging.getLogger("app")
+
+# A row limit keeps a moving set of buckets, and a window relative to the current time drops old ones;
+# neither can be patched with a delta. Matches in literals or identifiers only cost a full refresh.
+_NOT_INCREMENTAL = re.compile(
+    r"\b(LIMIT|TOP|FETCH\s+(FIRST|NEXT)|OFFSET"
+    r"|NOW|CURRENT_DATE|CURRENT_TIME|CURRENT_TIMESTAMP|LOCALTIME|LOCALTIMESTAMP|CURDATE|CURTIME"
+    r"|SYSDATE|SYSDATETIME|GETDATE|GETUTCDATE|UTC_DATE|UTC_TIMESTAMP|UNIX_TIMESTAMP|TODAY)\b",
+    re.IGNORECASE,
+)
+
+
+def is_time_label(value) -> bool:
+    return isinstance(value, (date, datetime))
+
+
+def encode_label(value) -> str:
+    return value.isoformat()
+
+
+def decode_label(value: str):
+    if len(value) == 10:
+        return date.fromisoformat(value)
+    return datetime.fromisoformat(value)
+
+
+def delta_statement(query: str, db_type: str, since) -> Optional[str]:
+    """
+    The query narrowed to rows at or after `since` by raising its lower date bound (see
+    raise_lower_bound), so the scan only covers the delta window. None when it cannot be narrowed
+    and has to be read in full.
+    """
+    return raise_lower_bound(query, db_type, since)
+
+
+def load_series_states(db: Session, query_ids: List[UUID]) -> Dict[str, dict]:
+    """
+    Stored series of the given queries as plain dicts, keyed by query id, so they can be
+    handed to worker threads without sharing the session.
+    """
+    if not query_ids:
+        return {}
+    states = db.query(QuerySeriesState).filter(QuerySeriesState.query_id.in_(query_ids)).all()
+    return {
+        str(state.query_id): {
+            "fingerprint": state.query_fingerprint,
+            "columns": json.loads(state.columns),
+            "rows": [(decode_label(row[0]), *row[1:]) for row in json.loads(state.rows)],
+            "max_label_seen": decode_label(state.max_label_seen),
+            "full_refreshed_at": state.full_refreshed_at,
+        }
+        for state in states
+    }
+
+
+def is_incremental_query(query: str) -> bool:
+    """
+    Whether a query's result can be kept up to date by re-reading only its latest buckets:
+    not when it is row-limited or its window is relative to the current time.
+    """
+    return _NOT_INCREMENTAL.search(query) is None
+
+
+def delta_since(state: Optional[dict], query: str) -> Optional[Any]:
+    """
+    Lower bound of the delta window for a stored series, or None when a full refresh is needed
+    (no state yet, the SQL changed, the query cannot be refreshed incrementally, or the periodic
+    full refresh is due). For date buckets the overlap is rounded up to whole days.
+    """
+    if not state or state["fingerprint"] != sql_fingerprint(query) or not is_incremental_query(query):
+        return None
+    full_every = settings.INCREMENTAL_FULL_REFRESH_SECONDS
+    if full_every and datetime.utcnow() - state["full_refreshed_at"] >= timedelta(seconds=full_every):
+        return None
+    last = state["max_label_seen"]
+    overlap = settings.INCREMENTAL_OVERLAP_SECONDS
+    if isinstance(last, datetime):
+        return last - timedelta(seconds=overlap)
+    # date - timedelta drops the seconds, which would leave a sub-day overlap at nothing
+    return last - timedelta(days=math.ceil(overlap / 86400))
+
+
+def merge_rows(stored: List[tuple], delta: List[tuple], since) -> List[tuple]:
+    """
+    Replace every stored bucket at or after `since` with the delta, keeping the series' sort direction.
+    Buckets are labelled by their start, so a delta bucket before `since` was only partly read and
+    the stored one is kept instead.
+    """
+    descending = len(stored) > 1 and stored[0][0] > stored[-1][0]
+    merged = [row for row in stored if row[0] < since] + [row for row in delta if row[0] >= since]
+    merged.sort(key=lambda row: row[0], reverse=descending)
+    return merged
+
+
+def is_incremental_series(rows: List[tuple]) -> bool:
+    """
+    Only series whose first column is a date/time can be refreshed incrementally.
+    A series that hit the row cap is not stored, since it is already incomplete.
+    """
+    cap = row_cap()
+    if not rows or (cap is not None and len(rows) >= cap):
+        return False
+    return all(is_time_label(row[0]) for row in rows)
+
+
+def save_series_state(db: Session, query_id: UUID, query: str, columns: List[str], rows: List[tuple], full: bool) -> None:
+    now = datetime.utcnow()
+    state = db.query(QuerySeriesState).filter(QuerySeriesState.query_id == query_id).first()
+    if not state:
+        state = QuerySeriesState(query_id=query_id)
+        db.add(state)
+    state.query_fingerprint = sql_fingerprint(query)
+    state.columns = json.dumps(columns)
+    state.rows = json.dumps(rows, default=json_default)
+    state.max_label_seen = encode_label(max(row[0] for row in rows))
+    state.refreshed_at = now
+    if full or state.full_refreshed_at is None:
+        state.full_refreshed_at = now
+
+
+def clear_series_state(db: Session, query_id: UUID) -> None:
+    db.query(QuerySeriesState).filter(QuerySeriesState.query_id == query_id).delete(synchronize_session=False)
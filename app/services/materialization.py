@@ -0,0 +1,284 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from uuid import UUID
+from fastapi import HTTPException
+from sqlalchemy import or_, func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.core.base import Base
+from app.core.db import SessionLocal, engine
+from app.core.settings import settings
+from app.models.post_processing import Dashboard, DashboardMaterialization, DashboardSnapshot
+from app.services.post_processing import fetch_dashboard_chart_data, load_dashboard_queries
+from app.utils.result_cache import result_cache
+from app.utils.serialization import dumps_json
+
+logger = logging.getLogger("app")
+
+# Dashboards with a refresh currently running in this worker
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def get_or_create_materialization(db: Session, dashboard_id: UUID) -> DashboardMaterialization:
+    config = db.query(DashboardMaterialization).filter(DashboardMaterialization.dashboard_id == dashboard_id).first()
+    if not config:
+        try:
+            with db.begin_nested():
+                config = DashboardMaterialization(dashboard_id=dashboard_id, enabled=False, view_count=0)
+                db.add(config)
+        except IntegrityError:
+            # Another request created it first (dashboard_id is unique)
+            config = db.query(DashboardMaterialization).filter(DashboardMaterialization.dashboard_id == dashboard_id).one()
+    return config
+
+
+def configure_materialization(db: Session, dashboard_id: UUID, enabled: bool, refresh_interval_seconds: Optional[int]):
+    """
+    Opt a dashboard in or out of scheduled snapshot refreshes.
+    """
+    try:
+        dashboard = db.query(Dashboard).filter(Dashboard.id == dashboard_id).first()
+        if not dashboard:
+            raise HTTPException(status_code=404, detail="Dashboard not found.")
+
+        config = get_or_create_materialization(db, dashboard_id)
+        config.enabled = enabled
+        config.refresh_interval_seconds = refresh_interval_seconds
+        db.commit()
+        db.refresh(config)
+        logger.info(f"Materialization for dashboard {dashboard_id} set to enabled={enabled}, interval={refresh_interval_seconds}.")
+        return config
+    except HTTPException:
+        raise
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Database error while configuring materialization: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error occurred.")
+
+
+def record_dashboard_view(db: Session, dashboard_id: UUID) -> None:
+    """
+    Count a dashboard view; dashboards over MATERIALIZATION_VIEW_THRESHOLD are refreshed automatically.
+    """
+    try:
+        if not _count_view(db, dashboard_id):
+            get_or_create_materialization(db, dashboard_id)
+            _count_view(db, dashboard_id)
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.warning(f"Failed to record view for dashboard {dashboard_id}: {str(e)}")
+
+
+def _count_view(db: Session, dashboard_id: UUID) -> int:
+    # Incremented in the database, so concurrent views are all counted
+    return (
+        db.query(DashboardMaterialization)
+        .filter(DashboardMaterialization.dashboard_id == dashboard_id)
+        .update(
+            {
+                DashboardMaterialization.view_count: DashboardMaterialization.view_count + 1,
+                DashboardMaterialization.last_viewed_at: datetime.utcnow(),
+            },
+            synchronize_session=False,
+        )
+    )
+
+
+def snapshot_serves(chart_data: dict, max_points: Optional[int]) -> bool:
+    """
+    Whether a snapshot, stored with the default CHART_MAX_POINTS, holds exactly what a live read
+    with `max_points` (None for the default, 0 for every row) would return.
+    """
+    if max_points is None or max_points == settings.CHART_MAX_POINTS:
+        return True
+    for chart in chart_data.get("chart_data", []):
+        points = len(chart.get("result") or [])
+        # A series at the default cap may have been downsampled from more rows
+        downsampled = bool(settings.CHART_MAX_POINTS) and points >= settings.CHART_MAX_POINTS
+        if downsampled or (max_points and points > max_points):
+            return False
+    return True
+
+
+def get_latest_snapshot(db: Session, dashboard_id: UUID) -> Optional[dict]:
+    """
+    Latest stored snapshot for a dashboard with its version and age, or None.
+    """
+    snapshot = (
+        db.query(DashboardSnapshot)
+        .filter(DashboardSnapshot.dashboard_id == dashboard_id)
+        .order_by(DashboardSnapshot.version.desc())
+        .first()
+    )
+    if not snapshot:
+        return None
+
+    payload = json.loads(snapshot.payload)
+    payload["snapshot"] = {
+        "version": snapshot.version,
+        "created_at": snapshot.created_at.isoformat(),
+        "age_seconds": max((datetime.utcnow() - snapshot.created_at).total_seconds(), 0.0),
+    }
+    return payload
+
+
+def refresh_dashboard_snapshot(dashboard_id: UUID) -> Optional[int]:
+    """
+    Run a dashboard's queries live and store the result as a new snapshot version.
+    Time-based queries are refreshed incrementally. Runs on its own session so it can be called from background workers.
+
+    :return: The new snapshot version, or None if the dashboard could not be refreshed.
+    """
+    key = str(dashboard_id)
+    with _refreshing_lock:
+        if key in _refreshing:
+            logger.debug(f"Refresh for dashboard {dashboard_id} already running.")
+            return None
+        _refreshing.add(key)
+
+    db = SessionLocal()
+    started = time.monotonic()
+    try:
+        # Drop cached results so the snapshot reflects the database right now
+        _, queries, external_db = load_dashboard_queries(db, dashboard_id)
+        for query in queries:
+            result_cache.invalidate_query(external_db.id, query.query_text)
+
+        chart_data = fetch_dashboard_chart_data(db, dashboard_id, incremental=True)
+
+        latest_version = (
+            db.query(func.max(DashboardSnapshot.version))
+            .filter(DashboardSnapshot.dashboard_id == dashboard_id)
+            .scalar()
+        ) or 0
+        snapshot = DashboardSnapshot(
+            dashboard_id=dashboard_id,
+            version=latest_version + 1,
+            payload=dumps_json(chart_data).decode("utf-8"),
+            duration_ms=(time.monotonic() - started) * 1000,
+            created_at=datetime.utcnow(),
+        )
+        db.add(snapshot)
+
+        config = get_or_create_materialization(db, dashboard_id)
+        config.last_refreshed_at = datetime.utcnow()
+
+        # Keep only the most recent versions
+        stale = (
+            db.query(DashboardSnapshot.id)
+            .filter(
+                DashboardSnapshot.dashboard_id == dashboard_id,
+                DashboardSnapshot.version <= snapshot.version - settings.SNAPSHOT_KEEP_VERSIONS,
+            )
+            .all()
+        )
+        if stale:
+            db.query(DashboardSnapshot).filter(DashboardSnapshot.id.in_([row.id for row in stale])).delete(synchronize_session=False)
+
+        db.commit()
+        logger.info(f"Stored snapshot v{snapshot.version} for dashboard {dashboard_id} in {snapshot.duration_ms:.0f} ms.")
+        return snapshot.version
+    except HTTPException as e:
+        db.rollback()
+        logger.warning(f"Skipping snapshot for dashboard {dashboard_id}: {e.detail}")
+        return None
+    except Exception as e:
+        db.rollback()
+        logger.exception(f"Snapshot refresh failed for dashboard {dashboard_id}")
+        return None
+    finally:
+        db.close()
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def claim_due_dashboards(db: Session) -> list:
+    """
+    Select dashboards whose snapshot is due and claim them by stamping last_refreshed_at.
+    The conditional update makes sure only one worker process picks up each dashboard.
+    """
+    now = datetime.utcnow()
+    selected = [DashboardMaterialization.enabled == True]
+    if settings.MATERIALIZATION_VIEW_THRESHOLD:
+        selected.append(DashboardMaterialization.view_count >= settings.MATERIALIZATION_VIEW_THRESHOLD)
+
+    candidates = db.query(DashboardMaterialization).filter(or_(*selected)).all()
+
+    claimed = []
+    for config in candidates:
+        interval = config.refresh_interval_seconds or settings.MATERIALIZATION_DEFAULT_INTERVAL_SECONDS
+        cutoff = now - timedelta(seconds=interval)
+        if config.last_refreshed_at and config.last_refreshed_at > cutoff:
+            continue
+        updated = (
+            db.query(DashboardMaterialization)
+            .filter(
+                DashboardMaterialization.id == config.id,
+                or_(
+                    DashboardMaterialization.last_refreshed_at == None,
+                    DashboardMaterialization.last_refreshed_at <= cutoff,
+                ),
+            )
+            .update({DashboardMaterialization.last_refreshed_at: now}, synchronize_session=False)
+        )
+        if updated:
+            claimed.append(config.dashboard_id)
+    db.commit()
+    return claimed
+
+
+async def run_materialization_worker(stop: asyncio.Event) -> None:
+    """
+    Background loop that refreshes due dashboard snapshots until `stop` is set.
+    """
+    await run_in_threadpool(Base.metadata.create_all, engine)
+    semaphore = asyncio.Semaphore(settings.MATERIALIZATION_MAX_CONCURRENT)
+    logger.info("Dashboard materialization worker started.")
+
+    async def refresh(dashboard_id):
+        async with semaphore:
+            await run_in_threadpool(refresh_dashboard_snapshot, dashboard_id)
+
+    while not stop.is_set():
+        try:
+            db = SessionLocal()
+            try:
+                due = await run_in_threadpool(claim_due_dashboards, db)
+            finally:
+                db.close()
+            if due:
+                logger.info(f"Refreshing {len(due)} dashboard snapshot(s).")
+                await asyncio.gather(*(refresh(dashboard_id) for dashboard_id in due))
+        except Exception:
+            logger.exception("Dashboard materialization cycle failed")
+
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.MATERIALIZATION_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+    logger.info("Dashboard materialization worker stopped.")
+
+
+def rows_to_columnar(chart_data: dict) -> dict:
+    """
+    Convert a row-oriented dashboard payload (as stored in snapshots) to the columnar layout.
+    """
+    charts = []
+    for chart in chart_data.get("chart_data", []):
+        points = chart["result"]
+        charts.append({
+            **chart,
+            "result": {
+                "label": [point["label"] for point in points],
+                "value": [point["value"] for point in points],
+            },
+        })
+    return {**chart_data, "chart_data": charts}
@@ -1,67 +1,388 @@
 
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import asyncio
 import logging
 import httpx
 import json
-from sqlalchemy import text
-from app.models.pre_processing import ExternalDBModel,GeneratedQuery
-from app.models.post_processing import Dashboard, DashboardQueryAssociation
+from sqlalchemy import text, func, case
+from app.models.pre_processing import ExternalDBModel,GeneratedQuery, ExternalDBDateRange
+from app.models.post_processing import Dashboard, DashboardQueryAssociation, QueryExecutionLog
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
 from app.utils.schema_structure import get_external_db_session
 from app.utils.auth_dependencies import get_user_project_role
-from app.schemas import TimeBasedQueriesUpdateRequest, TimeBasedQueriesUpdateResponse, QueryWithId
+from app.utils.concurrency import KeyedSemaphore
+from app.utils.engine_registry import async_engine_registry, supports_async
+from app.utils.result_cache import result_cache
+from app.utils.replica_router import replica_router
+from app.utils.serialization import dumps_line
+from app.utils.downsampling import downsample
+from app.utils.single_flight import SingleFlight, AsyncSingleFlight
+from app.utils.query_guard import guarded, guarded_async, fetch_capped, fetch_capped_async, capped_statement, CappedRows, CAPPED_EXECUTION_OPTIONS, client_timeout, row_cap, snapshot_statements, timeout_statements, explain_statement, QueryOutcome, TRUNCATED
+from app.services.incremental import load_series_states, delta_since, delta_statement, merge_rows, is_incremental_series, save_series_state, clear_series_state
+from app.core.settings import settings
+from app.utils.llm_client import llm_client, CircuitOpenError
+from app.utils.time_window import rewrite_time_window, rebind_text
+from app.schemas import TimeBasedQueriesUpdateRequest, TimeBasedQueriesUpdateResponse, QueryWithId, QueryDateUpdateResponse
 from uuid import UUID
 from datetime import date
 
 logger = logging.getLogger("app")
 
-def execute_external_query(external_db: ExternalDBModel, query: str):
+# Shared pool for running dashboard charts concurrently; each external DB is additionally
+# capped so a single dashboard cannot flood a customer database. Sync and async queries share the cap.
+chart_executor = ThreadPoolExecutor(max_workers=settings.DASHBOARD_MAX_WORKERS, thread_name_prefix="chart")
+external_db_limiter = KeyedSemaphore(settings.EXTERNAL_DB_MAX_CONCURRENT_QUERIES)
+
+# Identical concurrent queries (same external DB, SQL fingerprint and date window) share one execution
+query_flights = SingleFlight()
+async_query_flights = AsyncSingleFlight()
+
+def execute_external_query(external_db: ExternalDBModel, query: str, max_points: Optional[int] = None, columnar: bool = False, query_id: Optional[UUID] = None):
     """
     Executes a SQL query on the external database.
 
+    Results are served from the query result cache when an entry exists for the same
+    external DB, SQL fingerprint and date window.
+
     :param external_db: ExternalDBModel instance with connection info.
     :param query: SQL query string.
+    :param max_points: Downsample the series to at most this many points (defaults to CHART_MAX_POINTS, 0 disables).
+    :param columnar: Return {"label": [...], "value": [...]} instead of a list of points.
+    :param query_id: GeneratedQuery id, recorded with the execution outcome.
     :return: Query results
     """
-    session, engine = get_external_db_session(external_db)
     try:
-        print(query)
-        result = session.execute(text(query))
-        data = result.fetchall()  # Fetch all results
-        response = [dict(row._mapping) for row in data]  # Convert result to dictionary
-        return transform_data_dynamic(response)
+        columns, rows = get_external_rows(external_db, query, query_id)
+        return transform_rows(columns, rows, max_points=max_points, columnar=columnar)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def get_external_rows(external_db: ExternalDBModel, query: str, query_id: Optional[UUID] = None) -> Tuple[List[str], List[tuple]]:
+    """
+    Returns the column names and row tuples of a query, going through the result cache.
+    Concurrent misses for the same cache key are coalesced into a single execution.
+    """
+    cache_key = result_cache.make_key(external_db, query)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    def run():
+        columns, rows = fetch_external_rows(external_db, query, query_id)
+        result_cache.set(cache_key, (columns, rows))
+        return columns, rows
+
+    return query_flights.do(cache_key, run)
+
+
+async def execute_external_query_async(external_db: ExternalDBModel, query: str, max_points: Optional[int] = None, columnar: bool = False, query_id: Optional[UUID] = None):
+    """
+    Async variant of execute_external_query.
+
+    Runs on SQLAlchemy's async engine (asyncpg / aiomysql) when the driver is available, so an
+    in-flight query holds no threadpool thread and is cancelled on the server once every request
+    waiting on it (see single-flight coalescing) is cancelled. Falls back to the sync path in the
+    threadpool otherwise.
+    """
+    if not supports_async(external_db):
+        return await run_in_threadpool(execute_external_query, external_db, query, max_points, columnar, query_id)
+
+    try:
+        cache_key = result_cache.make_key(external_db, query)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            columns, rows = cached
+        else:
+            async def run():
+                fetched = await fetch_external_rows_async(external_db, query, query_id)
+                result_cache.set(cache_key, fetched)
+                return fetched
+
+            columns, rows = await async_query_flights.do(cache_key, run)
+        return await run_in_threadpool(transform_rows, columns, rows, max_points, columnar)
+    except asyncio.CancelledError:
+        logger.info(f"Query on external DB {external_db.id} cancelled.")
+        raise
     except Exception as e:
         return {"error": str(e)}
+
+
+async def fetch_external_rows_async(external_db: ExternalDBModel, query: str, query_id: Optional[UUID] = None) -> Tuple[List[str], List[tuple]]:
+    """
+    Runs a SQL query on the external database's async engine and returns its column names and row tuples.
+    The query runs under the guardrails (statement timeout, cost admission, row cap); past the
+    client-side deadline the task is cancelled, which cancels the statement on the server.
+    """
+    async with external_db_limiter.acquire_async(str(external_db.id)):
+        # Picking a replica may run a blocking health check
+        target = await run_in_threadpool(replica_router.acquire, external_db)
+        error = None
+        try:
+            engine = async_engine_registry.get_engine_for(target.key, target.encrypted_dsn)
+            async with engine.connect() as connection:
+                async with guarded_async(connection, engine.dialect.name, external_db.id, query, query_id) as outcome:
+                    async def capped():
+                        result = await connection.stream(text(capped_statement(engine.dialect.name, query)))
+                        return list(result.keys()), await fetch_capped_async(result)
+
+                    columns, rows = await asyncio.wait_for(capped(), timeout=client_timeout())
+                    outcome.row_count = len(rows)
+                    if rows.truncated:
+                        outcome.status = TRUNCATED
+                    return columns, rows
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            replica_router.release(target, error)
+
+
+def fetch_external_rows(external_db: ExternalDBModel, query: str, query_id: Optional[UUID] = None) -> Tuple[List[str], List[tuple]]:
+    """
+    Runs a SQL query on the external database and returns its column names and row tuples.
+    The query runs under the guardrails (statement timeout, cost admission, row cap) and is
+    routed to a read replica when the database has healthy ones (see replica_router).
+    """
+    with external_db_limiter.acquire(str(external_db.id)), replica_router.route(external_db) as target:
+        session, engine = get_external_db_session(external_db, target)
+        try:
+            print(query)
+            with guarded(session, engine.dialect.name, external_db.id, query, query_id) as outcome:
+                result = session.execute(text(capped_statement(engine.dialect.name, query)), execution_options=CAPPED_EXECUTION_OPTIONS)
+                columns = list(result.keys())
+                rows = fetch_capped(result)  # Fetch results up to the row cap
+                outcome.row_count = len(rows)
+                if rows.truncated:
+                    outcome.status = TRUNCATED
+                return columns, rows
+        finally:
+            session.close()  # Return the connection to the pool
+
+
+def fetch_time_series_rows(external_db: ExternalDBModel, query: str, state: Optional[dict], query_id: Optional[UUID] = None) -> Tuple[List[str], List[tuple], bool]:
+    """
+    Rows of a time-based query, reading only the delta window when a stored series exists.
+
+    The delta covers `max_date_seen` minus INCREMENTAL_OVERLAP_SECONDS onwards, read by raising the
+    query's lower date bound on its base time column, and replaces those buckets in the stored
+    series. Anything that prevents an incremental read (no or stale state, changed SQL, no lower
+    bound to raise, a LIMIT, window function or window relative to now, a delta hitting the row cap,
+    a failing delta query) falls back to a full read.
+
+    :return: (columns, rows, full) where `full` tells whether the whole range was read.
+    """
+    since = delta_since(state, query)
+    delta_query = delta_statement(query, external_db.database_provider, since) if since is not None else None
+    if since is not None and delta_query is None:
+        logger.info(f"Query {query_id} has no lower date bound to narrow, running a full refresh.")
+    if delta_query is not None:
+        try:
+            _, delta = fetch_external_rows(external_db, delta_query, query_id)
+            cap = row_cap()
+            if cap is None or len(delta) < cap:
+                return state["columns"], merge_rows(state["rows"], delta, since), False
+            logger.info(f"Delta for query {query_id} hit the row cap, running a full refresh.")
+        except Exception as e:
+            logger.warning(f"Incremental refresh failed for query {query_id}, running a full refresh: {str(e)}")
+
+    columns, rows = fetch_external_rows(external_db, query, query_id)
+    return columns, rows, True
+
+
+def store_time_series(db: Session, external_db: ExternalDBModel, query: GeneratedQuery, columns: List[str], rows: List[tuple], full: bool) -> None:
+    """
+    Keep the refreshed series for the next incremental run and seed the result cache with it.
+    """
+    if is_incremental_series(rows):
+        save_series_state(db, query.id, query.query_text, columns, rows, full)
+    else:
+        clear_series_state(db, query.id)
+    result_cache.set(result_cache.make_key(external_db, query.query_text), (columns, rows))
+
+
+def fetch_consistent_rows(external_db: ExternalDBModel, queries: List[GeneratedQuery]) -> List[Any]:
+    """
+    Runs a batch of queries in one read-only REPEATABLE READ transaction on a single pooled
+    connection, so every chart reads the same snapshot and the batch pays for one checkout.
+
+    On psycopg 3 connections the statements are pipelined (see fetch_pipelined_rows) unless
+    EXPLAIN admission is on; otherwise they run one after another, each inside a savepoint on
+    PostgreSQL so a failing chart does not abort the others.
+
+    :return: Per query, in order, either (columns, rows) or the exception it raised.
+    """
+    with external_db_limiter.acquire(str(external_db.id)), replica_router.route(external_db) as target:
+        session, engine = get_external_db_session(external_db, target)
+        dialect = engine.dialect.name
+        try:
+            for statement in snapshot_statements(dialect):
+                session.execute(text(statement))
+
+            if (
+                settings.DASHBOARD_PIPELINE_ENABLED
+                and engine.dialect.driver == "psycopg"
+                and explain_statement(dialect, queries[0].query_text) is None
+            ):
+                try:
+                    return fetch_pipelined_rows(session, dialect, external_db, queries)
+                except Exception as e:
+                    logger.warning(f"Pipelined batch on external DB {external_db.id} failed, running it statement by statement: {str(e)}")
+                    session.rollback()
+                    for statement in snapshot_statements(dialect):
+                        session.execute(text(statement))
+
+            results = []
+            for query in queries:
+                try:
+                    with session.begin_nested() if dialect == "postgresql" else nullcontext():
+                        with guarded(session, dialect, external_db.id, query.query_text, query.id) as outcome:
+                            result = session.execute(text(capped_statement(dialect, query.query_text)), execution_options=CAPPED_EXECUTION_OPTIONS)
+                            columns = list(result.keys())
+                            rows = fetch_capped(result)
+                            outcome.row_count = len(rows)
+                            if rows.truncated:
+                                outcome.status = TRUNCATED
+                    results.append((columns, rows))
+                except Exception as e:
+                    results.append(e)
+            return results
+        finally:
+            session.close()  # Ends the read-only transaction and returns the connection to the pool
+
+
+def fetch_pipelined_rows(session: Session, dialect: str, external_db: ExternalDBModel, queries: List[GeneratedQuery]) -> List[tuple]:
+    """
+    Sends every statement through psycopg 3's pipeline mode before reading any result, so the
+    batch costs roughly one round trip. Any failing statement aborts the whole pipeline and raises.
+    Pipelines cannot use server-side cursors, so each result is received in full before the row cap applies.
+    """
+    for statement in timeout_statements(dialect):
+        session.execute(text(statement))
+
+    connection = session.connection().connection.driver_connection
+    outcomes = [QueryOutcome(external_db.id, query.query_text, query.id) for query in queries]
+    cap = row_cap()
+    try:
+        results = []
+        with connection.pipeline():
+            cursors = []
+            for query in queries:
+                cursor = connection.cursor()
+                cursor.execute(query.query_text)
+                cursors.append(cursor)
+            for cursor, outcome in zip(cursors, outcomes):
+                fetched = [tuple(row) for row in (cursor.fetchall() if cap is None else cursor.fetchmany(cap + 1))]
+                rows = CappedRows(fetched[:cap] if cap is not None else fetched, cap is not None and len(fetched) > cap)
+                if rows.truncated:
+                    outcome.status = TRUNCATED
+                outcome.row_count = len(rows)
+                results.append(([column.name for column in cursor.description], rows))
+        return results
+    except Exception as e:
+        for outcome in outcomes:
+            if outcome.row_count is None:
+                outcome.failed(e)
+        raise
     finally:
-        session.close()  # Close session after use
-        engine.dispose() 
+        for outcome in outcomes:
+            outcome.finish()
 
 
+def stream_external_query(external_db: ExternalDBModel, query: str, meta: Optional[dict] = None, chunk_size: Optional[int] = None, query_id: Optional[UUID] = None) -> Iterator[bytes]:
+    """
+    Executes a SQL query on the external database and yields the result as NDJSON.
 
-def transform_data_dynamic(data):
+    Rows are read through a server-side cursor in batches of `chunk_size`, so memory stays
+    bounded regardless of result size. The first line carries the detected axes (merged with
+    `meta`), every following line is a {"label", "value"} point. Streamed results bypass
+    the result cache and the row cap, but not the statement timeout or cost admission.
+    """
+    chunk_size = chunk_size or settings.QUERY_STREAM_CHUNK_SIZE
+    with external_db_limiter.acquire(str(external_db.id)), replica_router.route(external_db) as target:
+        session, engine = get_external_db_session(external_db, target)
+        try:
+            with guarded(session, engine.dialect.name, external_db.id, query, query_id) as outcome:
+                result = session.execute(
+                    text(query),
+                    execution_options={"stream_results": True, "yield_per": chunk_size}
+                )
+                columns = list(result.keys())
+                if len(columns) < 2:
+                    raise ValueError("Data must contain at least two fields (one for label and one for value).")
+
+                yield dumps_line({**(meta or {}), "x_axis": columns[0], "y_axis": columns[1]})
+
+                outcome.row_count = 0
+                for partition in result.partitions():
+                    outcome.row_count += len(partition)
+                    yield b"".join(dumps_line({"label": str(row[0]), "value": row[1]}) for row in partition)
+        finally:
+            session.close()  # Return the connection to the pool
+
+
+def transform_data_dynamic(data, max_points: Optional[int] = None):
     """
     Transforms an array of dictionaries into the required format by dynamically detecting fields.
     Also returns the detected x-axis and y-axis labels.
 
     :param data: List of dictionaries with unknown key names
+    :param max_points: Target point count; None uses CHART_MAX_POINTS, 0 disables downsampling.
     :return: Dictionary containing transformed data and axis labels
     """
     if not data:
         return {"data": [], "x_axis": None, "y_axis": None}
 
     keys = list(data[0].keys())
+    return transform_rows(keys, [tuple(item.values()) for item in data], max_points=max_points)
+
+
+def transform_rows(columns: List[str], rows: List[tuple], max_points: Optional[int] = None, columnar: bool = False):
+    """
+    Transforms cursor rows into chart points, using the first column as label and the second as value.
+
+    Series longer than `max_points` are downsampled (LTTB for numeric/time x-axes, top-N plus
+    "Other" for categorical ones) before labels are stringified. With `columnar`, data is
+    returned as one list per field instead of one dict per point.
+
+    :param columns: Column names as reported by the cursor
+    :param rows: Row tuples
+    :param max_points: Target point count; None uses CHART_MAX_POINTS, 0 disables downsampling.
+    :param columnar: Build {"label": [...], "value": [...]} directly from the rows
+    :return: Dictionary containing transformed data and axis labels, and `truncated` when the
+        rows were cut short by the row cap
+    """
+    if not rows:
+        return {"data": {"label": [], "value": []} if columnar else [], "x_axis": None, "y_axis": None}
 
-    if len(keys) < 2:
+    if len(columns) < 2:
         raise ValueError("Data must contain at least two fields (one for label and one for value).")
 
-    x_axis = keys[0]  # First key for x-axis
-    y_axis = keys[1]  # Second key for y-axis
+    x_axis = columns[0]  # First column for x-axis
+    y_axis = columns[1]  # Second column for y-axis
+
+    if max_points is None:
+        max_points = settings.CHART_MAX_POINTS
+
+    points = downsample([(row[0], row[1]) for row in rows], max_points)
 
-    transformed_data = [{"label": str(item[x_axis]), "value": item[y_axis]} for item in data]
+    if columnar:
+        transformed_data = {
+            "label": [str(label) for label, _ in points],
+            "value": [value for _, value in points]
+        }
+    else:
+        transformed_data = [{"label": str(label), "value": value} for label, value in points]
 
-    return {"data": transformed_data, "x_axis": x_axis, "y_axis": y_axis}
+    transformed = {"data": transformed_data, "x_axis": x_axis, "y_axis": y_axis}
+    if getattr(rows, "truncated", False):
+        transformed["truncated"] = True  # Only the first QUERY_MAX_ROWS rows were read
+    return transformed
 
 async def process_time_based_queries(
     db: Session,
@@ -92,38 +413,20 @@ async def process_time_based_queries(
         if not queries:
             raise HTTPException(status_code=404, detail="No time-based queries found for this dashboard.")
 
-        # query_list = [QueryWithId(query_id=str(q.id), query=q.query_text, explanation=q.explanation) for q in queries]
-        query_list = [{"query_id": str(q.id), "query": q.query_text, "explanation": q.explanation} for q in queries]
-
         min_date = min_date.isoformat() if isinstance(min_date, date) else str(min_date)
         max_date = max_date.isoformat() if isinstance(max_date, date) else str(max_date)
 
-        request_data = TimeBasedQueriesUpdateRequest(
-            queries=query_list,
-            # queries=[QueryWithId(**query) for query in query_list],  # Convert dicts back to Pydantic models
-            min_date=min_date,
-            max_date=max_date,
-            db_type=db_type  
+        # Queries whose date predicates can be rebound locally skip the LLM round trip
+        local_updates, remaining = rebind_time_windows(db, external_db, queries, min_date, max_date)
+        llm_updates = []
+        if remaining:
+            llm_updates = await rebind_time_windows_with_llm(remaining, min_date, max_date, db_type, llm_url)
+        logger.info(
+            f"Rebound {len(local_updates)} of {len(queries)} time-based queries of dashboard {dashboard_id} locally, "
+            f"{len(remaining)} through the LLM service."
         )
 
-        logger.info(f"Sending JSON Payload to LLM: {json.dumps(request_data.model_dump(), indent=2)}")
-
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                llm_url,
-                json=request_data.model_dump(),
-            )
-            try:
-                response.raise_for_status()
-                response_json = response.json()
-                if not response_json:
-                    raise ValueError("Empty response from LLM")
-                logger.info(f"LLM Response: {json.dumps(response_json, indent=2)}")
-            except Exception as e:
-                logger.error(f"Failed to parse LLM response: {str(e)}")
-                raise HTTPException(status_code=500, detail="Invalid response from LLM service.")
-
-        updated_queries_response = TimeBasedQueriesUpdateResponse(**response_json)
+        updated_queries_response = TimeBasedQueriesUpdateResponse(updated_queries=local_updates + llm_updates)
         await update_queries_in_db(db, updated_queries_response.updated_queries)
 
 
@@ -140,12 +443,73 @@ async def process_time_based_queries(
         raise HTTPException(status_code=500, detail=f"Error processing time-based queries: {str(e)}")
 
 
+def rebind_time_windows(db: Session, external_db: ExternalDBModel, queries: List[GeneratedQuery], min_date: str, max_date: str) -> Tuple[List[QueryDateUpdateResponse], List[GeneratedQuery]]:
+    """
+    Rebind the date predicates of time-based queries to [min_date, max_date] with the SQL parser.
+    The profiled date columns of the external DB are taken as its time columns.
+
+    :return: The updates for the queries that were rebound, and the queries left for the LLM service.
+    """
+    if not settings.TIME_WINDOW_REWRITE_ENABLED:
+        return [], queries
+    time_columns = {
+        column_name for column_name, in db.query(ExternalDBDateRange.column_name).filter(
+            ExternalDBDateRange.external_db_id == external_db.id
+        ).all()
+    }
+    updates, remaining = [], []
+    for query in queries:
+        rewrite = rewrite_time_window(query.query_text, external_db.database_provider, min_date, max_date, time_columns)
+        if rewrite is None:
+            remaining.append(query)
+            continue
+        rewritten, replaced = rewrite
+        updates.append(QueryDateUpdateResponse(
+            query_id=query.id,
+            original_query=query.query_text,
+            updated_query=rewritten,
+            original_explanation=query.explanation,
+            updated_explanation=rebind_text(query.explanation, replaced),
+            success=True
+        ))
+    return updates, remaining
+
+
+async def rebind_time_windows_with_llm(queries: List[GeneratedQuery], min_date: str, max_date: str, db_type: str, llm_url: str) -> List[QueryDateUpdateResponse]:
+    query_list = [{"query_id": str(q.id), "query": q.query_text, "explanation": q.explanation} for q in queries]
+    request_data = TimeBasedQueriesUpdateRequest(
+        queries=query_list,
+        min_date=min_date,
+        max_date=max_date,
+        db_type=db_type
+    )
+
+    logger.info(f"Sending JSON Payload to LLM: {json.dumps(request_data.model_dump(), indent=2)}")
+
+    try:
+        response = await llm_client.post(llm_url, request_data.model_dump(), timeout=settings.LLM_TIMEOUT_TIME_QUERIES_SECONDS)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        response.raise_for_status()
+        response_json = response.json()
+        if not response_json:
+            raise ValueError("Empty response from LLM")
+        logger.info(f"LLM Response: {json.dumps(response_json, indent=2)}")
+    except Exception as e:
+        logger.error(f"Failed to parse LLM response: {str(e)}")
+        raise HTTPException(status_code=500, detail="Invalid response from LLM service.")
+
+    return TimeBasedQueriesUpdateResponse(**response_json).updated_queries
+
+
 async def update_queries_in_db(db: Session, updated_queries):
     for updated_query in updated_queries:
         query_entry = db.query(GeneratedQuery).filter(GeneratedQuery.id == (updated_query.query_id)).first()
         
         if query_entry:
             if updated_query.success:
+                result_cache.invalidate_query(query_entry.external_db_id, query_entry.query_text)
                 query_entry.query_text = updated_query.updated_query
                 query_entry.explanation = updated_query.updated_explanation
                 db.commit()
@@ -320,43 +684,115 @@ def add_queries_to_dashboard(db: Session, dashboard: Dashboard, query_ids: list[
     except Exception as e:  # Catch any unexpected errors
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-def fetch_dashboard_chart_data(db: Session, dashboard_id: UUID):
+def load_saved_query(db: Session, external_db_id: UUID, query_id: UUID) -> Tuple[ExternalDBModel, GeneratedQuery]:
+    """
+    Load a saved query and the external database it runs on, raising 404 if either is missing.
+    """
+    external_db = db.query(ExternalDBModel).filter(ExternalDBModel.id == external_db_id).first()
+    if not external_db:
+        raise HTTPException(status_code=404, detail="External database not found")
+
+    generated_query = db.query(GeneratedQuery).filter(GeneratedQuery.id == query_id).first()
+    if not generated_query:
+        raise HTTPException(status_code=404, detail="Query not found")
+
+    return external_db, generated_query
+
+
+def load_dashboard_queries(db: Session, dashboard_id: UUID) -> Tuple[Dashboard, List[GeneratedQuery], ExternalDBModel]:
+    """
+    Load a dashboard, its queries and its external database, raising HTTP errors if any is missing.
+    """
+    # 🔹 Fetch the dashboard
+    dashboard = db.query(Dashboard).filter(Dashboard.id == dashboard_id).first()
+    if not dashboard:
+        raise HTTPException(status_code=404, detail="Dashboard not found.")
+
+    # 🔹 Fetch related queries
+    queries = dashboard.queries
+    if not queries:
+        raise HTTPException(status_code=400, detail="No queries found for this dashboard.")
+
+    external_db = db.query(ExternalDBModel).filter(ExternalDBModel.id == dashboard.external_db_id).first()
+    if not external_db:
+        raise HTTPException(status_code=400, detail="External database not found.")
+
+    return dashboard, queries, external_db
+
+
+def build_chart_entry(query: GeneratedQuery, result: dict) -> dict:
+    return {
+        "query_id": str(query.id),
+        "query_text": query.explanation,
+        "result": result["data"],
+        "x_axis": result["x_axis"],
+        "y_axis": result["y_axis"],
+        "chart_type": query.chart_type,
+        "truncated": result.get("truncated", False)
+    }
+
+
+def fetch_dashboard_chart_data(db: Session, dashboard_id: UUID, max_points: Optional[int] = None, columnar: bool = False, incremental: bool = False, consistent: bool = False):
     """
     Fetch queries for a given dashboard, execute them, and return the results.
+    Each chart series is downsampled to `max_points` and, with `columnar`, returned as
+    per-field lists (see transform_rows). With `incremental`, time-based queries only read
+    the buckets newer than their stored series (see fetch_time_series_rows). With `consistent`,
+    all charts run as one batch on a single snapshot (see fetch_consistent_rows) and bypass the cache.
     """
     try:
-        # 🔹 Fetch the dashboard
-        dashboard = db.query(Dashboard).filter(Dashboard.id == dashboard_id).first()
-        if not dashboard:
-            raise HTTPException(status_code=404, detail="Dashboard not found.")
+        dashboard, queries, external_db = load_dashboard_queries(db, dashboard_id)
+
+        if consistent:
+            chart_data = []
+            for query, fetched in zip(queries, fetch_consistent_rows(external_db, queries)):
+                try:
+                    if isinstance(fetched, Exception):
+                        raise fetched
+                    columns, rows = fetched
+                    chart_data.append(build_chart_entry(query, transform_rows(columns, rows, max_points=max_points, columnar=columnar)))
+                except Exception as e:
+                    logger.error(f"Query execution failed for query {query.id}: {str(e)}")
+                    continue
+            return {
+                "dashboard_id": str(dashboard.id),
+                "chart_data": chart_data,
+                "consistent": True
+            }
+
+        incremental = incremental and settings.INCREMENTAL_REFRESH_ENABLED
+        time_series = {query.id for query in queries if incremental and query.is_time_based}
+        states = load_series_states(db, list(time_series))
+
+        # 🔹 Execute Queries concurrently, then collect results in dashboard order
+        futures = [
+            (query, chart_executor.submit(fetch_time_series_rows, external_db, query.query_text, states.get(str(query.id)), query.id))
+            if query.id in time_series else
+            (query, chart_executor.submit(execute_external_query, external_db, query.query_text, max_points, columnar, query.id))
+            for query in queries
+        ]
 
-        # 🔹 Fetch related queries
-        queries = dashboard.queries
-        if not queries:
-            raise HTTPException(status_code=400, detail="No queries found for this dashboard.")
-
-        # 🔹 Execute Queries and Collect Results
         chart_data = []
-        for query in queries:
-            external_db = db.query(ExternalDBModel).filter(ExternalDBModel.id == dashboard.external_db_id).first()
-            if not external_db:
-                raise HTTPException(status_code=400, detail="External database not found.")
-
+        for query, future in futures:
             try:
-                # Execute the query on the external DB
-                result = execute_external_query(external_db, query.query_text)
-                chart_data.append({
-                    "query_id": str(query.id),
-                    "query_text": query.explanation,
-                    "result": result["data"],
-                    "x_axis": result["x_axis"],
-                    "y_axis": result["y_axis"],
-                    "chart_type": query.chart_type
-                })
+                if query.id in time_series:
+                    columns, rows, full = future.result()
+                    store_time_series(db, external_db, query, columns, rows, full)
+                    result = transform_rows(columns, rows, max_points=max_points, columnar=columnar)
+                else:
+                    result = future.result()
+                chart_data.append(build_chart_entry(query, result))
             except Exception as e:
                 logger.error(f"Query execution failed for query {query.id}: {str(e)}")
                 continue 
 
+        if time_series:
+            try:
+                db.commit()
+            except SQLAlchemyError as e:
+                db.rollback()
+                logger.warning(f"Failed to store time series state for dashboard {dashboard_id}: {str(e)}")
+
         return {
             "dashboard_id": str(dashboard.id),
             "chart_data": chart_data
@@ -368,6 +804,42 @@ def fetch_dashboard_chart_data(db: Session, dashboard_id: UUID):
     except Exception as e:
         logger.exception(f"Unexpected error in fetch_dashboard_chart_data for dashboard {dashboard_id}")
         raise HTTPException(status_code=500, detail="Error fetching chart data.")
+
+
+async def fetch_dashboard_chart_data_async(db: Session, dashboard_id: UUID, max_points: Optional[int] = None, columnar: bool = False):
+    """
+    Async variant of fetch_dashboard_chart_data: charts run as concurrent tasks on the event loop,
+    still capped per external DB, and are all cancelled together if the request is cancelled.
+    """
+    try:
+        # Metadata reads go through the threadpool so they never block the event loop
+        dashboard, queries, external_db = await run_in_threadpool(load_dashboard_queries, db, dashboard_id)
+
+        results = await asyncio.gather(
+            *(execute_external_query_async(external_db, query.query_text, max_points, columnar, query.id) for query in queries)
+        )
+
+        chart_data = []
+        for query, result in zip(queries, results):
+            try:
+                chart_data.append(build_chart_entry(query, result))
+            except Exception as e:
+                logger.error(f"Query execution failed for query {query.id}: {str(e)}")
+                continue
+
+        return {
+            "dashboard_id": str(dashboard.id),
+            "chart_data": chart_data
+        }
+
+    except HTTPException as e:
+        logger.warning(f"Dashboard Fetch Warning: {e.detail}")
+        raise
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.exception(f"Unexpected error in fetch_dashboard_chart_data_async for dashboard {dashboard_id}")
+        raise HTTPException(status_code=500, detail="Error fetching chart data.")
     
 def remove_queries_from_dashboard(db: Session, dashboard_id: UUID, query_ids: list[UUID]):
     """
@@ -418,3 +890,31 @@ def delete_dashboard(db: Session, dashboard_id: UUID):
     except Exception as e:
         logger.exception(f"Unexpected error in delete_dashboard for dashboard {dashboard_id}")
         raise HTTPException(status_code=500, detail="Error deleting dashboard.")
+
+def get_expensive_queries(db: Session, external_db_id: UUID, limit: int = 20):
+    """
+    Summarize recorded executions per SQL fingerprint for an external DB, most expensive first.
+    """
+    try:
+        rows = (
+            db.query(
+                QueryExecutionLog.query_fingerprint,
+                func.max(QueryExecutionLog.query_text).label("query_text"),
+                func.count(QueryExecutionLog.id).label("executions"),
+                func.avg(QueryExecutionLog.duration_ms).label("avg_duration_ms"),
+                func.max(QueryExecutionLog.duration_ms).label("max_duration_ms"),
+                func.max(QueryExecutionLog.estimated_cost).label("max_estimated_cost"),
+                func.sum(case((QueryExecutionLog.status == "timeout", 1), else_=0)).label("timeouts"),
+                func.sum(case((QueryExecutionLog.status == "rejected", 1), else_=0)).label("rejections"),
+                func.sum(case((QueryExecutionLog.status == "truncated", 1), else_=0)).label("truncations"),
+            )
+            .filter(QueryExecutionLog.external_db_id == external_db_id)
+            .group_by(QueryExecutionLog.query_fingerprint)
+            .order_by(func.avg(QueryExecutionLog.duration_ms).desc())
+            .limit(limit)
+            .all()
+        )
+        return [dict(row._mapping) for row in rows]
+    except SQLAlchemyError as e:
+        logger.error(f"Database error while summarizing query executions: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error occurred.")
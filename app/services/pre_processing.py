@@ -1,33 +1,117 @@
+import asyncio
 import httpx
 import json
 from urllib.parse import quote_plus, urlparse
 from fastapi import HTTPException, status
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
-from app.models.pre_processing import ExternalDBModel, GeneratedQuery
+from starlette.concurrency import run_in_threadpool
+from app.models.pre_processing import ExternalDBModel, GeneratedQuery, ExternalDBReplica, ExternalDBDateRange
 from app.models.user import UserProjectRole, RoleModel
-from app.utils.schema_structure import get_schema_structure
+from app.utils.schema_structure import build_schema_structure_async
+from app.services.schema_versions import previous_introspection, record_schema_version, latest_schema_version
+from app.services.schema_versions import generation_is_current, mark_queries_generated, list_generated_queries
+from app.utils.jobs import job_registry
+from app.core.db import SessionLocal
 from app.utils.crypt import encrypt_string, decrypt_string
-from app.schemas import ExternalDBCreateRequest, ExternalDBResponse, CurrentUser, UpdateDBRequest,NLQResponse, ExternalDBCreateChatRequest
+from app.utils.engine_registry import engine_registry, async_engine_registry
+from app.utils.result_cache import result_cache
+from app.utils.replica_router import replica_router
+from app.utils.schema_retrieval import SchemaIndex, compact_json, prune_schema, schema_index_cache
+from app.core.settings import settings
+from app.utils.llm_client import llm_client, CircuitOpenError
+from app.utils.llm_stream import StreamedJSONFields
+from app.utils.serialization import dumps_event
+from app.services.statistics import data_profile
+from app.services.post_processing import execute_external_query_async
+from app.services.schema_catalog import store_catalog, load_schema, load_schema_json, schema_content_hash
+from app.utils.nlq_cache import nlq_cache, normalize_question
+from app.schemas import ExternalDBCreateRequest, ExternalDBResponse, CurrentUser, UpdateDBRequest,NLQResponse, ExternalDBCreateChatRequest, ExternalDBReplicaCreateRequest, ExternalDBReplicaResponse
 from datetime import datetime
+from typing import AsyncIterator, Callable, Optional
 from uuid import UUID
 import logging
 
 logger = logging.getLogger("app")
 
-async def create_or_update_external_db(data: ExternalDBCreateRequest, db: Session, current_user: CurrentUser):
+# Caps generation calls to the LLM service across every external DB
+generation_limiter = asyncio.Semaphore(settings.QUERY_GENERATION_MAX_CONCURRENT)
+
+# Fields of an NL-to-SQL answer streamed to the client, in the order the LLM service sends them
+_NLQ_STREAM_FIELDS = ["sql_query", "explanation", "chart_type"]
+
+def assign_project_role(db: Session, data: ExternalDBCreateRequest, user_id) -> UserProjectRole:
+    """
+    Give the user the requested role in the project and commit it.
+    """
+    new_user_project_role = UserProjectRole(
+        user_id=user_id,
+        project_id=data.project_id,
+        role_id=data.role
+    )
+    db.add(new_user_project_role)
+    db.commit()
+    db.refresh(new_user_project_role)
+    return new_user_project_role
+
+def save_external_db(db: Session, data: ExternalDBCreateRequest, user_project_role_id, schema_structure: dict, fingerprints, diff, date_ranges) -> ExternalDBModel:
+    """
+    Store the introspected external DB for a project role, creating or updating its entry,
+    and drop cached engines and results when the connection string changed.
+    """
+    db_entry = db.query(ExternalDBModel).filter_by(user_project_role_id=user_project_role_id).first()
+    connection_changed = False
+
+    if db_entry:
+        connection_changed = decrypt_string(db_entry.connection_string) != data.connection_string
+        db_entry.connection_string = encrypt_string(data.connection_string)
+        db_entry.domain = data.domain if data.domain else None
+        db_entry.database_provider = data.db_type
+        db_entry.min_date = parse_date(schema_structure["min_date"])
+        db_entry.max_date = parse_date(schema_structure["max_date"])
+        logger.info(f"Updated existing external DB entry for project role {user_project_role_id}.")
+    else:
+        db_entry = ExternalDBModel(
+            user_project_role_id=user_project_role_id,
+            connection_string=encrypt_string(data.connection_string),
+            domain=data.domain if data.domain else None,
+            database_provider=data.db_type,
+            schema_structure="{}",
+            min_date=parse_date(schema_structure["min_date"]),
+            max_date=parse_date(schema_structure["max_date"])
+        )
+        db.add(db_entry)
+        db.flush()
+        logger.info(f"Created new external DB entry for project role {user_project_role_id}.")
+
+    store_catalog(db, db_entry, schema_structure)
+    db.commit()
+    db.refresh(db_entry)
+
+    if fingerprints is not None:
+        record_schema_version(db, db_entry.id, fingerprints, diff)
+    if date_ranges is not None:
+        replace_date_ranges(db, db_entry.id, date_ranges)
+    db.commit()
+
+    if connection_changed:
+        engine_registry.invalidate(db_entry.id)
+        async_engine_registry.invalidate(db_entry.id)
+        result_cache.invalidate_db(db_entry.id)
+    return db_entry
+
+async def create_or_update_external_db(data: ExternalDBCreateRequest, db: Session, current_user: CurrentUser, progress: Optional[Callable[..., None]] = None):
+    """
+    Introspect the external database and store it for the user's project role.
+    Introspection runs on the introspection pool; `progress` receives its progress(done, total, stage) updates.
+    Session work runs in the threadpool to keep the event loop free.
+    """
     user_id = current_user.user_id
     logger.info(f"User {user_id} is attempting to create or update an external DB for project {data.project_id}.")
 
     try:
-        new_user_project_role = UserProjectRole(
-            user_id=user_id,
-            project_id=data.project_id,
-            role_id=data.role
-        )
-        db.add(new_user_project_role)
-        db.commit()
-        db.refresh(new_user_project_role)
+        new_user_project_role = await run_in_threadpool(assign_project_role, db, data, user_id)
         logger.info(f"Assigned role {data.role} to user {user_id} for project {data.project_id}.")
 
         if not new_user_project_role:
@@ -38,7 +122,7 @@ async def create_or_update_external_db(data: ExternalDBCreateRequest, db: Sessio
             parsed_url = urlparse(data.connection_string)
             encoded_password = quote_plus(parsed_url.password) if parsed_url else ""
             connection_string = f"{parsed_url.scheme}://{parsed_url.username}:{encoded_password}@{parsed_url.hostname}{':' + str(parsed_url.port) if parsed_url.port else ''}{parsed_url.path}?{parsed_url.query}"
-            schema_structure = get_schema_structure(connection_string, data.db_type)
+            schema_structure, fingerprints, diff = await build_schema_structure_async(connection_string, data.db_type, progress)
             logger.info(f"Retrieved schema structure for database type {data.db_type}.")
         else:
             db_type = data.db_type.lower()
@@ -50,60 +134,173 @@ async def create_or_update_external_db(data: ExternalDBCreateRequest, db: Sessio
             if db_type == "postgres":
                 reconstructed_conn_string = f"postgresql://{username}:{password}@{host}/{db_name}"
                 logger.debug(f"Reconstructed PostgreSQL connection string: {reconstructed_conn_string}")
-                schema_structure = get_schema_structure(reconstructed_conn_string, db_type)
+                schema_structure, fingerprints, diff = await build_schema_structure_async(reconstructed_conn_string, db_type, progress)
             elif db_type == "mysql":
                 reconstructed_conn_string = f"mysql+pymysql://{username}:{password}@{host}/{db_name}"
                 logger.debug(f"Reconstructed MySQL connection string: {reconstructed_conn_string}")
-                schema_structure = get_schema_structure(reconstructed_conn_string, db_type)
+                schema_structure, fingerprints, diff = await build_schema_structure_async(reconstructed_conn_string, db_type, progress)
             else:
                 logger.error(f"Unsupported database type: {data.db_type}")
                 raise HTTPException(status_code=400, detail="Unsupported database type.")
 
-        db_entry = db.query(ExternalDBModel).filter_by(user_project_role_id=new_user_project_role.id).first()
-
-        if db_entry:
-            db_entry.connection_string = encrypt_string(data.connection_string)
-            db_entry.domain = data.domain if data.domain else None
-            db_entry.database_provider = data.db_type
-            db_entry.schema_structure = json.dumps(schema_structure)
-            db_entry.min_date = schema_structure["min_date"]
-            db_entry.max_date = schema_structure["max_date"]
-            logger.info(f"Updated existing external DB entry for user {user_id}.")
-        else:
-            db_entry = ExternalDBModel(
-                user_project_role_id=new_user_project_role.id,
-                connection_string=encrypt_string(data.connection_string),
-                domain=data.domain if data.domain else None,
-                database_provider=data.db_type,
-                schema_structure=json.dumps(schema_structure),
-                min_date=schema_structure["min_date"],
-                max_date=schema_structure["max_date"]
-            )
-            db.add(db_entry)
-            logger.info(f"Created new external DB entry for user {user_id}.")
-
-        db.commit()
-        db.refresh(db_entry)
+        date_ranges = schema_structure.pop("date_ranges", None)
+        db_entry = await run_in_threadpool(
+            save_external_db, db, data, new_user_project_role.id, schema_structure, fingerprints, diff, date_ranges
+        )
 
         return ExternalDBResponse(
             db_entry_id=db_entry.id
         )
 
     except IntegrityError as e:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         logger.error(f"Database constraint violation: {str(e)}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Database constraint violation.")
 
     except HTTPException as http_exc:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         logger.error(f"HTTP exception occurred: {str(http_exc)}")
         raise http_exc
 
     except Exception as e:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         logger.error(f"Unexpected error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error processing external DB: {str(e)}")
     
+async def run_external_db_job(job_id: str, data: ExternalDBCreateRequest, current_user: CurrentUser):
+    """
+    Background variant of create_or_update_external_db that reports through the job registry.
+    Runs after the response is sent, so it uses its own session.
+    """
+    db = SessionLocal()
+    try:
+        job_registry.progress(job_id, stage="connecting")
+        result = await create_or_update_external_db(
+            data, db, current_user,
+            progress=lambda done, total, stage: job_registry.progress(job_id, done, total, stage)
+        )
+        job_registry.succeed(job_id, {"db_entry_id": str(result.db_entry_id)})
+    except HTTPException as e:
+        job_registry.fail(job_id, str(e.detail))
+    except Exception as e:
+        logger.exception(f"External DB job {job_id} failed")
+        job_registry.fail(job_id, str(e))
+    finally:
+        db.close()
+
+def parse_date(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+def load_refresh_source(db: Session, external_db_id: UUID):
+    """
+    The external DB entry to refresh and its stored (schema_info, fingerprints), if any.
+    """
+    db_entry = db.query(ExternalDBModel).filter(ExternalDBModel.id == external_db_id).first()
+    if not db_entry:
+        raise HTTPException(status_code=404, detail="External DB not found.")
+    return db_entry, previous_introspection(db, db_entry)
+
+def save_refreshed_schema(db: Session, db_entry: ExternalDBModel, schema_structure: dict, fingerprints, diff) -> dict:
+    """
+    Store a re-read schema and its date ranges, adding a schema version when anything changed.
+    """
+    # Data moves even when the schema does not
+    date_ranges = schema_structure.pop("date_ranges", None)
+    if date_ranges is not None:
+        replace_date_ranges(db, db_entry.id, date_ranges)
+    db_entry.min_date = parse_date(schema_structure["min_date"])
+    db_entry.max_date = parse_date(schema_structure["max_date"])
+    store_catalog(db, db_entry, schema_structure)
+
+    version = record_schema_version(db, db_entry.id, fingerprints, diff)
+    if version is None:
+        db.commit()
+        latest = latest_schema_version(db, db_entry.id)
+        logger.info(f"Schema of external DB {db_entry.id} is unchanged.")
+        return {"changed": False, "version": latest.version if latest else None}
+
+    db.commit()
+    return {"changed": True, "version": version.version, "diff": diff}
+
+async def refresh_external_db_schema(external_db_id: UUID, db: Session, progress: Optional[Callable[..., None]] = None):
+    """
+    Re-read an external DB's schema, introspecting only tables whose fingerprint changed,
+    and store a new schema version when anything did. Session work runs in the threadpool.
+    """
+    try:
+        db_entry, previous = await run_in_threadpool(load_refresh_source, db, external_db_id)
+        schema_structure, fingerprints, diff = await build_schema_structure_async(
+            decrypt_string(db_entry.connection_string), db_entry.database_provider, progress, previous
+        )
+        if fingerprints is None:
+            raise HTTPException(status_code=502, detail="Failed to introspect the external database.")
+
+        return await run_in_threadpool(save_refreshed_schema, db, db_entry, schema_structure, fingerprints, diff)
+
+    except HTTPException:
+        await run_in_threadpool(db.rollback)
+        raise
+    except SQLAlchemyError as e:
+        await run_in_threadpool(db.rollback)
+        logger.error(f"Database error while refreshing schema of external DB {external_db_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error occurred.")
+
+def replace_date_ranges(db: Session, external_db_id: UUID, date_ranges: list) -> None:
+    """
+    Swap the stored per-column date ranges of an external DB for freshly profiled ones. The caller commits.
+    """
+    db.query(ExternalDBDateRange).filter(ExternalDBDateRange.external_db_id == external_db_id).delete(synchronize_session=False)
+    now = datetime.utcnow()
+    for date_range in date_ranges:
+        db.add(ExternalDBDateRange(
+            external_db_id=external_db_id,
+            table_name=date_range["table"],
+            column_name=date_range["column"],
+            min_value=date_range["min"],
+            max_value=date_range["max"],
+            sampled=date_range["sampled"],
+            profiled_at=now
+        ))
+
+def list_date_ranges(external_db_id: UUID, db: Session) -> list:
+    db_entry = db.query(ExternalDBModel).filter(ExternalDBModel.id == external_db_id).first()
+    if not db_entry:
+        raise HTTPException(status_code=404, detail="External DB not found.")
+    date_ranges = db.query(ExternalDBDateRange).filter(
+        ExternalDBDateRange.external_db_id == external_db_id
+    ).order_by(ExternalDBDateRange.table_name, ExternalDBDateRange.column_name).all()
+    return [
+        {
+            "table": date_range.table_name,
+            "column": date_range.column_name,
+            "min": date_range.min_value.isoformat(),
+            "max": date_range.max_value.isoformat(),
+            "sampled": date_range.sampled,
+            "profiled_at": date_range.profiled_at.isoformat(),
+        }
+        for date_range in date_ranges
+    ]
+
+async def run_schema_refresh_job(job_id: str, external_db_id: UUID):
+    """
+    Background variant of refresh_external_db_schema that reports through the job registry.
+    """
+    db = SessionLocal()
+    try:
+        job_registry.progress(job_id, stage="fingerprinting")
+        result = await refresh_external_db_schema(
+            external_db_id, db,
+            progress=lambda done, total, stage: job_registry.progress(job_id, done, total, stage)
+        )
+        job_registry.succeed(job_id, result)
+    except HTTPException as e:
+        job_registry.fail(job_id, str(e.detail))
+    except Exception as e:
+        logger.exception(f"Schema refresh job {job_id} failed")
+        job_registry.fail(job_id, str(e))
+    finally:
+        db.close()
+
 async def update_record(data: UpdateDBRequest, db: Session, current_user: CurrentUser):
     """
     Updates the domain and sends the request to the LLM service.
@@ -132,7 +329,7 @@ async def update_record(data: UpdateDBRequest, db: Session, current_user: Curren
             logger.error(f"Database entry not found for db_entry_id: {data.db_entry_id}")
             raise HTTPException(status_code=404, detail="Database entry not found.")
 
-        schema_structure = db_entry.schema_structure
+        schema_structure = load_schema_json(db, db_entry)
         db_provider = db_entry.database_provider
         min_date = db_entry.min_date.isoformat() if isinstance(db_entry.min_date, datetime) else db_entry.min_date
         max_date = db_entry.max_date.isoformat() if isinstance(db_entry.max_date, datetime) else db_entry.max_date
@@ -152,6 +349,7 @@ async def update_record(data: UpdateDBRequest, db: Session, current_user: Curren
             "domain": data.domain,
             "min_date": min_date,
             "max_date": max_date,
+            "data_profile": data_profile(db, db_entry.id),
             "api_key": ""
         }
         return response
@@ -220,6 +418,63 @@ async def save_query_to_db(queries: dict, db: Session, db_entry_id: int, user_id
         db.rollback()
         logger.critical(f"Unexpected error while saving queries for db_entry_id {db_entry_id}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error saving queries: {str(e)}")
+
+def current_queries(data: UpdateDBRequest, db: Session) -> Optional[dict]:
+    """
+    Response for a generation request whose queries already exist for the current schema and domain,
+    or None if queries have to be generated.
+    """
+    if data.force or not generation_is_current(db, data.db_entry_id, data.domain):
+        return None
+    logger.info("Schema and domain unchanged for external DB %s, skipping query generation.", data.db_entry_id)
+    return {
+        "status": "success",
+        "message": "Schema unchanged, existing queries kept",
+        "queries": {"queries": list_generated_queries(db, data.db_entry_id)},
+        "skipped": True
+    }
+
+async def generate_queries(data: UpdateDBRequest, db: Session, current_user: CurrentUser, progress: Optional[Callable[..., None]] = None):
+    """
+    Update the domain, ask the LLM service for queries and store them. At most
+    QUERY_GENERATION_MAX_CONCURRENT generations call the LLM service at once; unless `force` is set,
+    nothing is regenerated when queries for this schema version and domain already exist.
+    """
+    report = progress or (lambda done, total, stage: None)
+    report(0, 3, "queued")
+    async with generation_limiter:
+        # Re-checked once running, so a resubmitted request queued behind the first one is a no-op
+        current = await run_in_threadpool(current_queries, data, db)
+        if current:
+            return current
+        saved_data = await update_record(data, db, current_user)
+        report(1, 3, "generating queries")
+        llm_response = await post_to_llm(f"{settings.LLM_URI}/queries/", saved_data)
+        report(2, 3, "saving queries")
+        response = await save_query_to_db(queries=llm_response, db=db, db_entry_id=data.db_entry_id, user_id=current_user.user_id)
+        await run_in_threadpool(mark_queries_generated, db, data.db_entry_id, data.domain)
+    report(3, 3, "saved queries")
+    logger.info("Saved generated queries for external DB %s.", data.db_entry_id)
+    return response
+
+async def run_query_generation_job(job_id: str, data: UpdateDBRequest, current_user: CurrentUser):
+    """
+    Background variant of generate_queries that reports through the job registry.
+    """
+    db = SessionLocal()
+    try:
+        result = await generate_queries(
+            data, db, current_user,
+            progress=lambda done, total, stage: job_registry.progress(job_id, done, total, stage)
+        )
+        job_registry.succeed(job_id, result)
+    except HTTPException as e:
+        job_registry.fail(job_id, str(e.detail))
+    except Exception as e:
+        logger.exception(f"Query generation job {job_id} failed")
+        job_registry.fail(job_id, str(e))
+    finally:
+        db.close()
         
 async def process_nl_to_sql_query(data: ExternalDBCreateChatRequest, db: Session, current_user: CurrentUser):
     """
@@ -259,10 +514,9 @@ async def process_nl_to_sql_query(data: ExternalDBCreateChatRequest, db: Session
             logger.error("No database connections found for user_id: %s", user_id)
             raise HTTPException(status_code=404, detail="No database connections found for this user.")
 
-        # Parse the schema structure
-        schema_structure = json.loads(db_entry.schema_structure)
-        schema_structure_string = json.dumps(schema_structure, indent=2)
-        logger.debug("Parsed schema structure: %s", schema_structure_string)
+        # Only the tables relevant to the question are sent, within the token budget
+        schema_structure_string = schema_context_for_question(db, db_entry, data.nl_query)
+        logger.debug("Schema context: %s", schema_structure_string)
 
         # Prepare the NLQ request payload
         nlq_request = {
@@ -283,6 +537,35 @@ async def process_nl_to_sql_query(data: ExternalDBCreateChatRequest, db: Session
         logger.exception("Unexpected error processing NL to SQL request for user_id: %s", user_id)
         raise HTTPException(status_code=500, detail=f"Error processing NL to SQL request: {str(e)}")
     
+def schema_context_for_question(db: Session, db_entry: ExternalDBModel, question: str) -> str:
+    """
+    Serialized db_schema for an NL-to-SQL request: the top NLQ_SCHEMA_TOP_K tables by BM25 relevance
+    to the question plus their foreign-key join paths, capped at NLQ_SCHEMA_TOKEN_BUDGET.
+    """
+    if not settings.NLQ_SCHEMA_PRUNING_ENABLED:
+        return load_schema_json(db, db_entry)
+    schema_structure = load_schema(db, db_entry)
+
+    # Rebuilt when the schema changes, and after NLQ_SCHEMA_HINTS_TTL_SECONDS to pick up new query hints
+    key = (str(db_entry.id), schema_content_hash(db, db_entry))
+    index = schema_index_cache.get(key)
+    if index is None:
+        # Only queries someone wrote or kept on a dashboard; unreviewed LLM output would echo itself
+        hints = db.query(GeneratedQuery.query_text, GeneratedQuery.explanation).filter(
+            GeneratedQuery.external_db_id == db_entry.id,
+            or_(GeneratedQuery.is_user_generated == True, GeneratedQuery.dashboards.any())
+        ).all()
+        index = SchemaIndex(schema_structure.get("tables", []), hints)
+        schema_index_cache.delete_where(lambda cached: cached[0] == key[0])
+        schema_index_cache.set(key, index)
+
+    pruned = prune_schema(schema_structure, index, question, settings.NLQ_SCHEMA_TOP_K, settings.NLQ_SCHEMA_TOKEN_BUDGET)
+    logger.info(
+        "Sending %d of %d tables as schema context for external DB %s.",
+        len(pruned["tables"]), len(schema_structure.get("tables", [])), db_entry.id
+    )
+    return compact_json(pruned)
+
 async def save_nl_sql_query(sql_response: dict, db: Session, db_entry_id: int, user_id: UUID):
     """
     Save the generated SQL query from a natural language input into the database.
@@ -344,15 +627,121 @@ async def save_nl_sql_query(sql_response: dict, db: Session, db_entry_id: int, u
         logger.exception("Unexpected error occurred while saving NL to SQL query for user_id: %s", user_id)
         raise HTTPException(status_code=500, detail=f"Error processing NL to SQL request: {str(e)}")
 
+def nl_sql_cache_key(db: Session, db_entry_id: str, nl_query: str, db_type: str) -> Optional[tuple]:
+    """
+    Response cache key of an NL question: (normalized question, schema content hash, DB type).
+    None when the cache is disabled.
+    """
+    if not settings.NLQ_CACHE_ENABLED:
+        return None
+    db_entry = db.query(ExternalDBModel).filter(ExternalDBModel.id == UUID(db_entry_id)).first()
+    if not db_entry:
+        return None
+    return normalize_question(nl_query), schema_content_hash(db, db_entry), db_type
+
+def cached_nl_sql_query(db: Session, db_entry_id: str, key: Optional[tuple]) -> Optional[dict]:
+    """
+    Cached answer to an NL question with the GeneratedQuery it was saved as, or None on a miss.
+    Entries whose query was deleted in the meantime are dropped.
+    """
+    if key is None:
+        return None
+    cached = nlq_cache.get(db_entry_id, key)
+    if cached is None:
+        return None
+    exists = db.query(GeneratedQuery.id).filter(
+        GeneratedQuery.id == UUID(cached["query_id"]),
+        GeneratedQuery.external_db_id == UUID(db_entry_id)
+    ).first()
+    if not exists:
+        nlq_cache.delete(db_entry_id, key)
+        return None
+    logger.info("NL to SQL cache hit for db_entry_id: %s, reusing query_id: %s", db_entry_id, cached["query_id"])
+    return cached
+
+def cache_nl_sql_query(db_entry_id: str, key: Optional[tuple], sql_response: dict, save_result: dict) -> None:
+    if key is not None and save_result.get("query_id"):
+        nlq_cache.set(db_entry_id, key, {"sql_response": sql_response, "query_id": save_result["query_id"]})
+
+async def stream_nl_to_sql(url: str, nlq_data: dict, db_entry_id: str, user_id: UUID, cache_key: Optional[tuple] = None, cached: Optional[dict] = None, execute: bool = False) -> AsyncIterator[bytes]:
+    """
+    Server-sent events for an NL-to-SQL request: the SQL as it arrives from the LLM service
+    (sql_query_delta), then each field once complete (sql_query, explanation, chart_type), the saved
+    GeneratedQuery (saved) and, with `execute`, the query result (result). Ends with done or error.
+    Runs after the response has started, so it uses its own session.
+    """
+    db = SessionLocal()
+    stage = "generate"
+    try:
+        if cached:
+            sql_response = cached["sql_response"]
+            for field in _NLQ_STREAM_FIELDS:
+                if field in sql_response:
+                    yield dumps_event({field: sql_response[field]}, event=field)
+            save_result = {"status": "success", "message": "SQL query reused from cache", "query_id": cached["query_id"], "cached": True}
+        else:
+            fields = StreamedJSONFields(_NLQ_STREAM_FIELDS)
+            async with llm_client.stream(url, {**nlq_data, "stream": True}, timeout=settings.LLM_TIMEOUT_NLQ_SECONDS) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise HTTPException(status_code=response.status_code, detail=f"NLQ LLM service returned an error: {response.text}")
+                async for chunk in response.aiter_text():
+                    for kind, field, value in fields.feed(chunk):
+                        yield _nlq_field_event(kind, field, value)
+            for kind, field, value in fields.finish():
+                yield _nlq_field_event(kind, field, value)
+            sql_response = fields.result()
+            save_result = await save_nl_sql_query(sql_response, db, db_entry_id, user_id)
+            cache_nl_sql_query(db_entry_id, cache_key, sql_response, save_result)
+        yield dumps_event(save_result, event="saved")
+
+        if execute:
+            stage = "execute"
+            external_db = db.query(ExternalDBModel).filter(ExternalDBModel.id == UUID(db_entry_id)).first()
+            result = await execute_external_query_async(external_db, sql_response["sql_query"], query_id=UUID(save_result["query_id"]))
+            if "error" in result:
+                raise HTTPException(status_code=400, detail=f"Error executing query: {result['error']}")
+            yield dumps_event({
+                "result": result["data"],
+                "x_axis": result["x_axis"],
+                "y_axis": result["y_axis"],
+                "id": save_result["query_id"],
+                "chartType": sql_response.get("chart_type"),
+                "report": sql_response.get("explanation"),
+                "truncated": result.get("truncated", False)
+            }, event="result")
+        yield dumps_event({"status": "success"}, event="done")
+
+    except HTTPException as e:
+        logger.warning("NL to SQL stream failed while trying to %s: %s", stage, e.detail)
+        yield dumps_event({"stage": stage, "status_code": e.status_code, "detail": e.detail}, event="error")
+    except CircuitOpenError as e:
+        yield dumps_event({"stage": stage, "status_code": 503, "detail": str(e)}, event="error")
+    except httpx.RequestError as e:
+        logger.error("Request to NLQ LLM service failed: %s", str(e))
+        yield dumps_event({"stage": stage, "status_code": 500, "detail": f"Request to NLQ LLM service failed: {str(e)}"}, event="error")
+    except Exception as e:
+        logger.exception("Unexpected error streaming NL to SQL request for db_entry_id: %s", db_entry_id)
+        yield dumps_event({"stage": stage, "status_code": 500, "detail": f"Error processing NL to SQL request: {str(e)}"}, event="error")
+    finally:
+        db.close()
+
+def _nlq_field_event(kind: str, field: str, value) -> bytes:
+    if kind == "delta":
+        return dumps_event({"text": value}, event=f"{field}_delta")
+    return dumps_event({field: value}, event=field)
+
 async def post_to_llm(url: str, data: dict):    
     """
     Send an async POST request to the LLM service.
     """
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(url, json=data)
-            response.raise_for_status()  
-            return response.json()
+        response = await llm_client.post(url, data, timeout=settings.LLM_TIMEOUT_QUERIES_SECONDS)
+        response.raise_for_status()  
+        return response.json()
+
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=f"LLM service returned an error: {e.response.text}")
@@ -366,10 +755,11 @@ async def post_to_llm(url: str, data: dict):
 async def post_to_nlq_llm(url:str, data:dict):
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url,json=data)
-            response.raise_for_status()
-            return response.json()
+        response = await llm_client.post(url, data, timeout=settings.LLM_TIMEOUT_NLQ_SECONDS)
+        response.raise_for_status()
+        return response.json()
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except httpx.HTTPStatusError as e:
         raise HTTPException(
             status_code=e.response.status_code,
@@ -386,4 +776,71 @@ async def post_to_nlq_llm(url:str, data:dict):
         raise HTTPException(
             status_code=500,
             detail=f"An unexpected error occurred: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+def add_external_db_replica(data: ExternalDBReplicaCreateRequest, db: Session) -> ExternalDBReplicaResponse:
+    """
+    Register a read-replica DSN for an external database. Stored encrypted like the primary.
+    """
+    try:
+        external_db = db.query(ExternalDBModel).filter(ExternalDBModel.id == data.external_db_id).first()
+        if not external_db:
+            raise HTTPException(status_code=404, detail="External database not found.")
+
+        replica = ExternalDBReplica(
+            external_db_id=external_db.id,
+            connection_string=encrypt_string(data.connection_string),
+            max_lag_seconds=data.max_lag_seconds
+        )
+        db.add(replica)
+        db.commit()
+        db.refresh(replica)
+        replica_router.invalidate(external_db.id)
+        logger.info(f"Added read replica {replica.id} for external DB {external_db.id}.")
+        return ExternalDBReplicaResponse(replica_id=replica.id)
+    except HTTPException:
+        raise
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Database error while adding read replica: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error occurred.")
+
+
+def list_external_db_replicas(external_db_id: UUID, db: Session) -> list:
+    """
+    Configured replicas of an external database with their current health and lag.
+    """
+    replicas = db.query(ExternalDBReplica).filter(ExternalDBReplica.external_db_id == external_db_id).all()
+    health = {entry["replica_id"]: entry for entry in replica_router.status(external_db_id)}
+    return [
+        {
+            "replica_id": str(replica.id),
+            "enabled": replica.enabled,
+            "max_lag_seconds": replica.max_lag_seconds,
+            "created_at": replica.created_at,
+            **{key: value for key, value in health.get(str(replica.id), {}).items() if key != "replica_id"}
+        }
+        for replica in replicas
+    ]
+
+
+def remove_external_db_replica(replica_id: UUID, db: Session) -> None:
+    try:
+        replica = db.query(ExternalDBReplica).filter(ExternalDBReplica.id == replica_id).first()
+        if not replica:
+            raise HTTPException(status_code=404, detail="Replica not found.")
+
+        external_db_id = replica.external_db_id
+        db.delete(replica)
+        db.commit()
+        replica_router.invalidate(external_db_id)
+        engine_registry.invalidate(f"{external_db_id}:{replica_id}")
+        async_engine_registry.invalidate(f"{external_db_id}:{replica_id}")
+        logger.info(f"Removed read replica {replica_id} of external DB {external_db_id}.")
+    except HTTPException:
+        raise
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Database error while removing read replica: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error occurred.")
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import logging
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional
+from uuid import UUID
+from sqlalchemy.orm import Session, selectinload
+from app.core.settings import settings
+from app.models.pre_processing import ExternalDBModel, SchemaCatalog, CatalogTable, CatalogColumn, CatalogForeignKey
+from app.utils.lru import TTLLRUCache
+from app.utils.schema_introspection import structure_fingerprint
+from app.utils.schema_retrieval import compact_json
+
+logger = logging.getLogger("app")
+
+# Parsed schemas keyed by (external_db_id, content_hash), so a new catalog is never served stale
+_schema_cache = TTLLRUCache(max_entries=settings.SCHEMA_CATALOG_CACHE_ENTRIES)
+
+
+# Move with the data rather than the schema; stored on ExternalDBModel and ExternalDBDateRange instead
+_DATA_BOUND_KEYS = ("min_date", "max_date", "date_ranges")
+
+
+def encode_schema(schema_info: dict) -> tuple:
+    """
+    Compact JSON of a schema, compressed, with the sha256 of the uncompressed bytes: (payload, content_hash, raw_bytes).
+    Date bounds are left out, so the hash only changes when the structure does.
+    """
+    structure = {key: value for key, value in schema_info.items() if key not in _DATA_BOUND_KEYS}
+    raw = compact_json(structure).encode("utf-8")
+    return zlib.compress(raw, 6), hashlib.sha256(raw).hexdigest(), len(raw)
+
+
+def store_catalog(db: Session, external_db: ExternalDBModel, schema_info: dict) -> str:
+    """
+    Store a freshly introspected schema as the external DB's catalog. Only tables whose structure
+    changed are rewritten in the normalized tables. The caller commits.
+
+    :return: The content hash of the stored schema.
+    """
+    payload, content_hash, raw_bytes = encode_schema(schema_info)
+    catalog = db.query(SchemaCatalog).filter(SchemaCatalog.external_db_id == external_db.id).first()
+    if catalog and catalog.content_hash == content_hash:
+        return content_hash
+
+    if not catalog:
+        catalog = SchemaCatalog(external_db_id=external_db.id)
+        db.add(catalog)
+    catalog.content_hash = content_hash
+    catalog.payload = payload
+    catalog.raw_bytes = raw_bytes
+    catalog.table_count = len(schema_info.get("tables", []))
+    catalog.updated_at = datetime.utcnow()
+
+    existing = {
+        table.name: table
+        for table in db.query(CatalogTable).filter(CatalogTable.external_db_id == external_db.id).all()
+    }
+    rewritten = 0
+    for position, table in enumerate(schema_info.get("tables", [])):
+        fingerprint = structure_fingerprint(table)
+        row = existing.pop(table["name"], None)
+        if row is not None and row.fingerprint == fingerprint:
+            row.position = position
+            continue
+        if row is not None:
+            db.delete(row)
+        db.add(_catalog_table(external_db.id, position, fingerprint, table))
+        rewritten += 1
+    for row in existing.values():
+        db.delete(row)
+
+    # The legacy blob column is kept non-null but no longer holds the schema
+    external_db.schema_structure = json.dumps({"catalog_hash": content_hash})
+    logger.info(
+        f"Stored schema catalog of external DB {external_db.id}: {catalog.table_count} tables, "
+        f"{rewritten} rewritten, {len(existing)} dropped, {raw_bytes} bytes compressed to {len(payload)}."
+    )
+    return content_hash
+
+
+def _catalog_table(external_db_id: UUID, position: int, fingerprint: str, table: dict) -> CatalogTable:
+    primary_key = table.get("primary_keys") or {}
+    key_columns = primary_key.get("constrained_columns") or []
+    return CatalogTable(
+        external_db_id=external_db_id,
+        name=table["name"],
+        position=position,
+        fingerprint=fingerprint,
+        primary_key_name=primary_key.get("name"),
+        columns=[
+            CatalogColumn(
+                position=index,
+                name=column["name"],
+                data_type=column["type"],
+                primary_key_position=key_columns.index(column["name"]) if column["name"] in key_columns else None,
+            )
+            for index, column in enumerate(table.get("columns", []))
+        ],
+        foreign_keys=[
+            CatalogForeignKey(position=index, column_name=foreign_key["column"], referenced_table=foreign_key["references"])
+            for index, foreign_key in enumerate(table.get("foreign_keys", []))
+        ],
+    )
+
+
+def catalog_hash(db: Session, external_db_id: UUID) -> Optional[str]:
+    return db.query(SchemaCatalog.content_hash).filter(SchemaCatalog.external_db_id == external_db_id).scalar()
+
+
+def schema_content_hash(db: Session, external_db: ExternalDBModel) -> str:
+    """
+    Hash identifying the external DB's current schema, also for DBs stored before the catalog existed.
+    """
+    content_hash = catalog_hash(db, external_db.id)
+    if content_hash is None:
+        content_hash = hashlib.sha256(external_db.schema_structure.encode("utf-8")).hexdigest()
+    return content_hash
+
+
+def load_schema_json(db: Session, external_db: ExternalDBModel) -> str:
+    """
+    The external DB's schema as compact JSON, without parsing it.
+    Falls back to the legacy schema_structure column for DBs stored before the catalog existed.
+    """
+    catalog = db.query(SchemaCatalog).filter(SchemaCatalog.external_db_id == external_db.id).first()
+    if not catalog:
+        return external_db.schema_structure
+    return zlib.decompress(catalog.payload).decode("utf-8")
+
+
+def load_schema(db: Session, external_db: ExternalDBModel) -> dict:
+    """
+    The external DB's schema as a dict, parsed once per catalog version and shared afterwards.
+    Treat the result as read-only.
+    """
+    content_hash = catalog_hash(db, external_db.id)
+    if content_hash is None:
+        return json.loads(external_db.schema_structure)
+    key = (str(external_db.id), content_hash)
+    schema_info = _schema_cache.get(key)
+    if schema_info is None:
+        schema_info = json.loads(load_schema_json(db, external_db))
+        _schema_cache.delete_where(lambda cached: cached[0] == key[0])
+        _schema_cache.set(key, schema_info)
+    return schema_info
+
+
+def list_catalog_tables(db: Session, external_db: ExternalDBModel) -> Dict[str, str]:
+    """
+    Names of the external DB's tables with their structure fingerprints, in catalog order.
+    """
+    rows = db.query(CatalogTable.name, CatalogTable.fingerprint).filter(
+        CatalogTable.external_db_id == external_db.id
+    ).order_by(CatalogTable.position).all()
+    if rows:
+        return {name: fingerprint for name, fingerprint in rows}
+    return {table["name"]: structure_fingerprint(table) for table in load_schema(db, external_db).get("tables", [])}
+
+
+def load_tables(db: Session, external_db: ExternalDBModel, names: List[str]) -> List[dict]:
+    """
+    Definitions of just the named tables, in catalog order, read from the normalized catalog.
+    """
+    if not names:
+        return []
+    rows = (
+        db.query(CatalogTable)
+        .options(selectinload(CatalogTable.columns), selectinload(CatalogTable.foreign_keys))
+        .filter(CatalogTable.external_db_id == external_db.id, CatalogTable.name.in_(names))
+        .order_by(CatalogTable.position)
+        .all()
+    )
+    if not rows and catalog_hash(db, external_db.id) is None:
+        wanted = set(names)
+        return [table for table in load_schema(db, external_db).get("tables", []) if table["name"] in wanted]
+    return [
+        {
+            "name": row.name,
+            "columns": [{"name": column.name, "type": column.data_type} for column in row.columns],
+            "primary_keys": {
+                "constrained_columns": [
+                    column.name
+                    for column in sorted(
+                        (column for column in row.columns if column.primary_key_position is not None),
+                        key=lambda column: column.primary_key_position
+                    )
+                ],
+                "name": row.primary_key_name,
+            },
+            "foreign_keys": [
+                {"column": foreign_key.column_name, "references": foreign_key.referenced_table}
+                for foreign_key in row.foreign_keys
+            ],
+        }
+        for row in rows
+    ]
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy.orm import Session
+from app.models.pre_processing import ExternalDBModel, GeneratedQuery, SchemaVersion
+from app.services.schema_catalog import load_schema
+
+logger = logging.getLogger("app")
+
+
+def schema_hash(fingerprints: Dict[str, str]) -> str:
+    return hashlib.sha256(json.dumps(fingerprints, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def latest_schema_version(db: Session, external_db_id: UUID) -> Optional[SchemaVersion]:
+    return (
+        db.query(SchemaVersion)
+        .filter(SchemaVersion.external_db_id == external_db_id)
+        .order_by(SchemaVersion.version.desc())
+        .first()
+    )
+
+
+def previous_introspection(db: Session, external_db: ExternalDBModel) -> Optional[Tuple[dict, Dict[str, str]]]:
+    """
+    Stored (schema_info, fingerprints) of an external DB to refresh from, or None if it was never versioned.
+    """
+    latest = latest_schema_version(db, external_db.id)
+    if not latest:
+        return None
+    return load_schema(db, external_db), json.loads(latest.table_fingerprints)
+
+
+def record_schema_version(db: Session, external_db_id: UUID, fingerprints: Dict[str, str], diff: Dict[str, List[str]]) -> Optional[SchemaVersion]:
+    """
+    Add a schema version unless the fingerprints match the latest one. The caller commits.
+
+    :return: The new version, or None if the schema did not change.
+    """
+    latest = latest_schema_version(db, external_db_id)
+    digest = schema_hash(fingerprints)
+    if latest and latest.schema_hash == digest:
+        return None
+
+    version = SchemaVersion(
+        external_db_id=external_db_id,
+        version=(latest.version + 1) if latest else 1,
+        schema_hash=digest,
+        table_fingerprints=json.dumps(fingerprints),
+        diff=json.dumps(diff),
+    )
+    db.add(version)
+    logger.info(
+        f"Schema of external DB {external_db_id} is now v{version.version}: "
+        f"{len(diff['added'])} added, {len(diff['changed'])} changed, {len(diff['removed'])} removed table(s)."
+    )
+    return version
+
+
+def generation_is_current(db: Session, external_db_id: UUID, domain: str) -> bool:
+    """
+    Whether queries were already generated for this domain against the latest schema version,
+    so the LLM does not need to be asked again.
+    """
+    latest = latest_schema_version(db, external_db_id)
+    if not latest or latest.generated_domain != domain:
+        return False
+    return db.query(GeneratedQuery.id).filter(
+        GeneratedQuery.external_db_id == external_db_id,
+        GeneratedQuery.is_user_generated == False
+    ).first() is not None
+
+
+def mark_queries_generated(db: Session, external_db_id: UUID, domain: str) -> None:
+    latest = latest_schema_version(db, external_db_id)
+    if latest:
+        latest.generated_domain = domain
+        db.commit()
+
+
+def list_generated_queries(db: Session, external_db_id: UUID) -> List[dict]:
+    queries = db.query(GeneratedQuery).filter(
+        GeneratedQuery.external_db_id == external_db_id,
+        GeneratedQuery.is_user_generated == False
+    ).all()
+    return [
+        {
+            "query": query.query_text,
+            "explanation": query.explanation,
+            "relevance": query.relevance,
+            "is_time_based": query.is_time_based,
+            "chart_type": query.chart_type,
+        }
+        for query in queries
+    ]
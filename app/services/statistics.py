@@ -0,0 +1,190 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable, Dict, List, Optional
+from uuid import UUID
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.core.db import SessionLocal
+from app.core.settings import settings
+from app.models.pre_processing import ExternalDBModel, ExternalDBTableStats, ExternalDBColumnStats, ExternalDBDateRange
+from app.services.schema_catalog import list_catalog_tables, load_tables
+from app.services.schema_versions import latest_schema_version
+from app.utils.column_stats import collect_statistics, table_sizes
+from app.utils.crypt import decrypt_string
+from app.utils.jobs import job_registry
+from app.utils.schema_structure import catalog_executor, introspection_executor
+
+logger = logging.getLogger("app")
+
+# Finest first; the finest bucket that keeps a series within CHART_MAX_POINTS is suggested
+_BUCKETS = [("day", 1), ("week", 7), ("month", 30), ("quarter", 91), ("year", 365)]
+
+
+def _collect(connection_string: str, tables: List[dict]) -> Dict[str, Optional[dict]]:
+    engine = create_engine(connection_string)
+    try:
+        return collect_statistics(engine, tables, catalog_executor)
+    finally:
+        engine.dispose()
+
+
+def stale_tables(db: Session, external_db: ExternalDBModel, force: bool = False) -> List[dict]:
+    """
+    Tables whose statistics are missing, were collected for another table fingerprint, or are
+    older than STATS_MAX_AGE_SECONDS.
+    """
+    names = list(list_catalog_tables(db, external_db))
+    if force:
+        return load_tables(db, external_db, names)
+    latest = latest_schema_version(db, external_db.id)
+    fingerprints = json.loads(latest.table_fingerprints) if latest else {}
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.STATS_MAX_AGE_SECONDS)
+    collected = {
+        stats.table_name: stats
+        for stats in db.query(ExternalDBTableStats).filter(ExternalDBTableStats.external_db_id == external_db.id).all()
+    }
+    return load_tables(db, external_db, [
+        name for name in names
+        if name not in collected
+        or collected[name].fingerprint != fingerprints.get(name)
+        or collected[name].collected_at < cutoff
+    ])
+
+
+async def refresh_column_statistics(external_db_id: UUID, db: Session, force: bool = False, progress: Optional[Callable[..., None]] = None):
+    """
+    Collect statistics for the stale tables of an external DB (all of them with `force`) and drop
+    those of tables no longer in its schema.
+    """
+    external_db = db.query(ExternalDBModel).filter(ExternalDBModel.id == external_db_id).first()
+    if not external_db:
+        raise HTTPException(status_code=404, detail="External DB not found.")
+
+    report = progress or (lambda done, total, stage: None)
+    tables = stale_tables(db, external_db, force)
+    report(0, len(tables), "collecting statistics")
+
+    loop = asyncio.get_running_loop()
+    collected = await loop.run_in_executor(
+        introspection_executor, partial(_collect, decrypt_string(external_db.connection_string), tables)
+    )
+
+    try:
+        latest = latest_schema_version(db, external_db.id)
+        fingerprints = json.loads(latest.table_fingerprints) if latest else {}
+        known = set(list_catalog_tables(db, external_db))
+        replaced = [name for name, statistics in collected.items() if statistics is not None]
+
+        for model in (ExternalDBTableStats, ExternalDBColumnStats):
+            db.query(model).filter(model.external_db_id == external_db.id, model.table_name.in_(replaced)).delete(synchronize_session=False)
+            db.query(model).filter(model.external_db_id == external_db.id, model.table_name.notin_(known)).delete(synchronize_session=False)
+
+        now = datetime.utcnow()
+        for name in replaced:
+            statistics = collected[name]
+            db.add(ExternalDBTableStats(
+                external_db_id=external_db.id,
+                table_name=name,
+                row_count=statistics["row_count"],
+                fingerprint=fingerprints.get(name),
+                sampled=statistics["sampled"],
+                collected_at=now
+            ))
+            for column, column_stats in statistics["columns"].items():
+                db.add(ExternalDBColumnStats(
+                    external_db_id=external_db.id,
+                    table_name=name,
+                    column_name=column,
+                    distinct_count=column_stats["distinct"],
+                    null_fraction=column_stats["null_fraction"],
+                    min_value=column_stats["min"],
+                    max_value=column_stats["max"]
+                ))
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Database error while storing statistics of external DB {external_db_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error occurred.")
+
+    table_sizes.invalidate(external_db.id)
+    report(len(tables), len(tables), "collected statistics")
+    logger.info(f"Collected statistics of {len(replaced)} of {len(tables)} stale table(s) for external DB {external_db_id}.")
+    return {"collected": len(replaced), "failed": len(tables) - len(replaced)}
+
+
+async def run_statistics_job(job_id: str, external_db_id: UUID, force: bool = False):
+    """
+    Background variant of refresh_column_statistics that reports through the job registry.
+    """
+    db = SessionLocal()
+    try:
+        result = await refresh_column_statistics(
+            external_db_id, db, force,
+            progress=lambda done, total, stage: job_registry.progress(job_id, done, total, stage)
+        )
+        job_registry.succeed(job_id, result)
+    except HTTPException as e:
+        job_registry.fail(job_id, str(e.detail))
+    except Exception as e:
+        logger.exception(f"Statistics job {job_id} failed")
+        job_registry.fail(job_id, str(e))
+    finally:
+        db.close()
+
+
+def get_column_statistics(external_db_id: UUID, db: Session) -> List[dict]:
+    tables = db.query(ExternalDBTableStats).filter(
+        ExternalDBTableStats.external_db_id == external_db_id
+    ).order_by(ExternalDBTableStats.table_name).all()
+    columns: Dict[str, List[dict]] = {}
+    for column in db.query(ExternalDBColumnStats).filter(ExternalDBColumnStats.external_db_id == external_db_id).all():
+        columns.setdefault(column.table_name, []).append({
+            "column": column.column_name,
+            "distinct": column.distinct_count,
+            "null_fraction": column.null_fraction,
+            "min": column.min_value,
+            "max": column.max_value,
+        })
+    return [
+        {
+            "table": table.table_name,
+            "row_count": table.row_count,
+            "sampled": table.sampled,
+            "collected_at": table.collected_at.isoformat(),
+            "columns": columns.get(table.table_name, []),
+        }
+        for table in tables
+    ]
+
+
+def suggest_time_bucket(span: timedelta, max_points: int) -> str:
+    for name, days in _BUCKETS:
+        if span.days / days <= max_points:
+            return name
+    return _BUCKETS[-1][0]
+
+
+def data_profile(db: Session, external_db_id: UUID) -> dict:
+    """
+    Hints for query generation: a time bucket per date column that keeps series within
+    CHART_MAX_POINTS, and whether categorical columns fit a chart in full or need top-N.
+    """
+    max_points = settings.CHART_MAX_POINTS or 2000
+    profile: Dict[str, dict] = {}
+    for date_range in db.query(ExternalDBDateRange).filter(ExternalDBDateRange.external_db_id == external_db_id).all():
+        profile.setdefault(date_range.table_name, {})[date_range.column_name] = {
+            "time_bucket": suggest_time_bucket(date_range.max_value - date_range.min_value, max_points)
+        }
+    for column in db.query(ExternalDBColumnStats).filter(ExternalDBColumnStats.external_db_id == external_db_id).all():
+        if column.distinct_count is None:
+            continue
+        hints = profile.setdefault(column.table_name, {}).setdefault(column.column_name, {})
+        hints["distinct"] = round(column.distinct_count)
+        if "time_bucket" not in hints:
+            hints["categories"] = "full" if column.distinct_count <= max_points else "top_n"
+    return profile
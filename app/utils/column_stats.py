@@ -0,0 +1,285 @@
+import logging
+import math
+from collections import Counter
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, text
+from app.core.settings import settings
+from app.utils.lru import TTLLRUCache
+from app.utils.query_guard import statement_timeout
+
+logger = logging.getLogger("app")
+
+_PG_ROW_COUNTS = text(
+    "SELECT n.nspname, c.relname, c.reltuples"
+    " FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace"
+    " WHERE c.relkind IN ('r', 'p') AND n.nspname IN :schemas"
+).bindparams(bindparam("schemas", expanding=True))
+
+# Bounds of the histogram approximate min/max without touching the table
+_PG_COLUMN_STATS = text(
+    "SELECT schemaname, tablename, attname, null_frac, n_distinct,"
+    " (histogram_bounds::text::text[])[1],"
+    " (histogram_bounds::text::text[])[array_length(histogram_bounds::text::text[], 1)]"
+    " FROM pg_stats WHERE schemaname IN :schemas AND NOT inherited"
+).bindparams(bindparam("schemas", expanding=True))
+
+_MYSQL_ROW_COUNTS = text(
+    "SELECT TABLE_SCHEMA, TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES"
+    " WHERE TABLE_TYPE = 'BASE TABLE' AND TABLE_SCHEMA IN :schemas"
+).bindparams(bindparam("schemas", expanding=True))
+
+_MYSQL_CARDINALITY = text(
+    "SELECT TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME, MAX(CARDINALITY) FROM information_schema.STATISTICS"
+    " WHERE SEQ_IN_INDEX = 1 AND TABLE_SCHEMA IN :schemas"
+    " GROUP BY TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME"
+).bindparams(bindparam("schemas", expanding=True))
+
+
+def _split_name(name: str, default_schema: Optional[str]) -> Tuple[Optional[str], str]:
+    if "." in name:
+        schema, table = name.split(".", 1)
+        return schema, table
+    return default_schema, name
+
+
+def _catalog_statistics(connection, dialect: str, tables: List[dict]) -> Dict[str, dict]:
+    """
+    Statistics the server already keeps (pg_stats, information_schema), keyed by table name.
+    Tables the server has no statistics for are left out.
+    """
+    if dialect == "postgresql":
+        default_schema = connection.execute(text("SELECT current_schema()")).scalar()
+    elif dialect in ("mysql", "mariadb"):
+        default_schema = connection.execute(text("SELECT DATABASE()")).scalar()
+    else:
+        return {}
+
+    names = {_split_name(table["name"], default_schema): table["name"] for table in tables}
+    params = {"schemas": sorted({schema for schema, _ in names if schema})}
+    if not params["schemas"]:
+        return {}
+
+    found: Dict[str, dict] = {}
+    if dialect == "postgresql":
+        for schema, table, reltuples in connection.execute(_PG_ROW_COUNTS, params):
+            name = names.get((schema, table))
+            # -1 (or 0 on old servers) until the table is first analyzed
+            if name is not None and reltuples and reltuples > 0:
+                found[name] = {"row_count": int(reltuples), "sampled": False, "columns": {}}
+        for schema, table, column, null_frac, n_distinct, low, high in connection.execute(_PG_COLUMN_STATS, params):
+            entry = found.get(names.get((schema, table)))
+            if entry is None:
+                continue
+            # Negative n_distinct is a fraction of the row count
+            distinct = -n_distinct * entry["row_count"] if n_distinct is not None and n_distinct < 0 else n_distinct
+            entry["columns"][column] = {"distinct": distinct, "null_fraction": null_frac, "min": low, "max": high}
+        # A table without pg_stats rows was never analyzed; sample it instead
+        return {name: entry for name, entry in found.items() if entry["columns"]}
+
+    for schema, table, table_rows in connection.execute(_MYSQL_ROW_COUNTS, params):
+        name = names.get((schema, table))
+        if name is not None and table_rows:
+            found[name] = {"row_count": int(table_rows), "sampled": False, "columns": {}}
+    for schema, table, column, cardinality in connection.execute(_MYSQL_CARDINALITY, params):
+        entry = found.get(names.get((schema, table)))
+        if entry is not None and cardinality is not None:
+            entry["columns"][column] = {"distinct": float(cardinality), "null_fraction": None, "min": None, "max": None}
+    return found
+
+
+def estimate_distinct(sample: List, total_rows: Optional[int]) -> float:
+    """
+    Distinct values of a column from a sample of it, using the GEE estimator
+    (values seen once are scaled up by sqrt(N / n), the rest counted as is).
+    """
+    counts = Counter(value for value in sample if value is not None)
+    if total_rows is None or total_rows <= len(sample):
+        return float(len(counts))
+    singletons = sum(1 for count in counts.values() if count == 1)
+    return math.sqrt(total_rows / max(len(sample), 1)) * singletons + (len(counts) - singletons)
+
+
+def _hashable(value):
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def _random_sample_clause(dialect: str, row_count: int, limit: int) -> Optional[str]:
+    """
+    Clause after the table name that keeps roughly `limit` rows picked independently of their
+    position, or None when the dialect has no way to do that cheaply.
+    """
+    fraction = min(limit * 1.1 / row_count, 1.0)
+    if dialect == "postgresql":
+        # BERNOULLI samples rows, SYSTEM whole pages (clustered values would skew distinct counts)
+        return f"TABLESAMPLE BERNOULLI ({fraction * 100:.6f})"
+    if dialect in ("mysql", "mariadb"):
+        return f"WHERE RAND() < {fraction:.8f}"
+    return None
+
+
+def _sample_statistics(connection, engine, table: dict, known: Optional[dict]) -> dict:
+    """
+    Statistics computed from a sample of about STATS_SAMPLE_ROWS rows of a table, filling in what
+    the catalog lacks. The sample is random on PostgreSQL and MySQL; elsewhere it is the first rows
+    of the table, whose distinct counts are reported as seen rather than scaled to the table.
+    """
+    quote = engine.dialect.identifier_preparer.quote
+    source = ".".join(quote(part) for part in table["name"].split(".", 1))
+    columns = [column["name"] for column in table.get("columns", [])]
+    limit = settings.STATS_SAMPLE_ROWS
+    selected = ", ".join(quote(column) for column in columns)
+
+    with connection.begin(), statement_timeout(connection, engine.dialect.name, settings.STATS_TIMEOUT_MS):
+        row_count = known["row_count"] if known else None
+        rows = None
+        if row_count is None:
+            rows = connection.execute(text(f"SELECT {selected} FROM {source} LIMIT {int(limit)}")).fetchall()
+            if len(rows) < limit:
+                row_count = len(rows)  # The whole table
+            else:
+                try:
+                    with connection.begin_nested():
+                        row_count = connection.execute(text(f"SELECT COUNT(*) FROM {source}")).scalar()
+                except Exception as e:
+                    logger.warning(f"Row count of table {table['name']} failed: {str(e)}")
+
+        sampled = row_count is None or row_count > limit
+        scale = not sampled
+        if sampled and row_count is not None:
+            clause = _random_sample_clause(engine.dialect.name, row_count, limit)
+            if clause:
+                # Capped well above the expected size, so the cap almost never truncates the sample
+                rows = connection.execute(text(f"SELECT {selected} FROM {source} {clause} LIMIT {int(limit) * 2}")).fetchall()
+                scale = True
+        if rows is None:
+            rows = connection.execute(text(f"SELECT {selected} FROM {source} LIMIT {int(limit)}")).fetchall()
+
+    statistics = {"row_count": row_count, "sampled": sampled, "columns": {}}
+    for index, column in enumerate(columns):
+        known_column = (known or {}).get("columns", {}).get(column)
+        values = [_hashable(row[index]) for row in rows]
+        present = [value for value in values if value is not None]
+        low = high = None
+        try:
+            if present:
+                low, high = min(present), max(present)
+        except TypeError:
+            pass  # Mixed or unordered types
+        if known_column and known_column["distinct"] is not None:
+            distinct = known_column["distinct"]
+        else:
+            # A prefix is not a random sample, so GEE's scaling does not apply to it
+            distinct = estimate_distinct(values, row_count if scale else None)
+        statistics["columns"][column] = {
+            "distinct": distinct,
+            "null_fraction": (len(values) - len(present)) / len(values) if values else None,
+            "min": str(low) if low is not None else None,
+            "max": str(high) if high is not None else None,
+        }
+    return statistics
+
+
+def _collect_group(engine, tables: List[dict]) -> List[Tuple[str, Optional[dict]]]:
+    results = []
+    with engine.connect() as connection:
+        try:
+            catalog = _catalog_statistics(connection, engine.dialect.name, tables)
+        except Exception as e:
+            logger.warning(f"Catalog statistics unavailable, sampling instead: {str(e)}")
+            catalog = {}
+        connection.rollback()  # Each table is sampled in its own transaction
+        for table in tables:
+            known = catalog.get(table["name"])
+            # MySQL catalogs only know row counts and indexed columns
+            complete = known is not None and all(
+                known["columns"].get(column["name"], {}).get("null_fraction") is not None
+                for column in table.get("columns", [])
+            )
+            if complete:
+                results.append((table["name"], known))
+                continue
+            try:
+                results.append((table["name"], _sample_statistics(connection, engine, table, known)))
+            except Exception as e:
+                logger.warning(f"Statistics of table {table['name']} could not be collected: {str(e)}")
+                connection.rollback()
+                results.append((table["name"], known))
+    return results
+
+
+def collect_statistics(engine, tables: List[dict], executor: Executor) -> Dict[str, Optional[dict]]:
+    """
+    Approximate row count and per-column distinct count, null fraction and min/max of the given tables.
+
+    pg_stats and information_schema are used where they cover a table; the rest is computed from a
+    bounded sample (see _sample_statistics). Tables are split over up to STATS_PARALLELISM connections.
+
+    :return: {table name: {"row_count", "sampled", "columns": {column: {"distinct", "null_fraction", "min", "max"}}}},
+        with None for tables that could not be profiled.
+    """
+    if not tables:
+        return {}
+    parallelism = max(settings.STATS_PARALLELISM, 1)
+    groups = [group for group in (tables[i::parallelism] for i in range(parallelism)) if group]
+    futures = [executor.submit(_collect_group, engine, group) for group in groups]
+    return dict(result for future in futures for result in future.result())
+
+
+class TableSizes:
+    """
+    Profiled row counts per external DB, loaded from the metadata DB and cached for STATS_CACHE_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        self._cache = TTLLRUCache(max_entries=1000, default_ttl=settings.STATS_CACHE_TTL_SECONDS)
+
+    def get(self, external_db_id) -> Dict[str, int]:
+        key = str(external_db_id)
+        sizes = self._cache.get(key)
+        if sizes is None:
+            sizes = self._load(key)
+            self._cache.set(key, sizes)
+        return sizes
+
+    def rows(self, external_db_id, table: Optional[str]) -> Optional[int]:
+        """
+        Profiled row count of a table, looked up by qualified or bare name.
+        """
+        if not table:
+            return None
+        sizes = self.get(external_db_id)
+        return sizes.get(table.lower(), sizes.get(table.split(".")[-1].lower()))
+
+    def invalidate(self, external_db_id) -> None:
+        self._cache.delete(str(external_db_id))
+
+    def _load(self, key: str) -> Dict[str, int]:
+        # Imported lazily: app.core.db pulls in every model at import time
+        from uuid import UUID
+        from app.core.db import SessionLocal
+        from app.models.pre_processing import ExternalDBTableStats
+
+        db = SessionLocal()
+        try:
+            rows = db.query(ExternalDBTableStats.table_name, ExternalDBTableStats.row_count).filter(
+                ExternalDBTableStats.external_db_id == UUID(key)
+            ).all()
+        except Exception as e:
+            logger.warning(f"Failed to load table statistics for external DB {key}: {str(e)}")
+            return {}
+        finally:
+            db.close()
+        sizes = {}
+        for name, row_count in rows:
+            if row_count is not None:
+                sizes[name.lower()] = row_count
+                sizes[name.split(".")[-1].lower()] = max(row_count, sizes.get(name.split(".")[-1].lower(), 0))
+        return sizes
+
+
+table_sizes = TableSizes()
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from collections import deque
+from typing import AsyncIterator, Awaitable, Deque, Dict, Generator, Hashable, Iterable, Tuple, TypeVar
+import anyio
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+T = TypeVar("T")
+
+
+class _SharedSemaphore:
+    """
+    A counting semaphore that threads and event-loop tasks draw from together.
+    Released permits wake one waiting thread and every waiting task; whoever gets there first wins.
+    """
+
+    def __init__(self, limit: int):
+        self._value = limit
+        self._condition = threading.Condition(threading.Lock())
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    def _try_acquire(self) -> bool:
+        if self._value > 0:
+            self._value -= 1
+            return True
+        return False
+
+    def acquire(self) -> None:
+        with self._condition:
+            while not self._try_acquire():
+                self._condition.wait()
+
+    async def acquire_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._try_acquire():
+                    return
+                waiter = (loop, loop.create_future())
+                self._waiters.append(waiter)
+            try:
+                await waiter[1]
+            finally:
+                with self._condition:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+
+    def release(self) -> None:
+        with self._condition:
+            self._value += 1
+            self._condition.notify()
+            waiters = list(self._waiters)
+            self._waiters.clear()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:  # Loop already closed
+                pass
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class KeyedSemaphore:
+    """
+    A bounded semaphore per key, used to cap concurrent work against a single resource
+    (e.g. one external database) while letting different keys run independently.
+    Sync callers (`acquire`) and async callers (`acquire_async`) share the same budget per key.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphores: Dict[Hashable, _SharedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: Hashable) -> _SharedSemaphore:
+        with self._lock:
+            semaphore = self._semaphores.get(key)
+            if semaphore is None:
+                semaphore = _SharedSemaphore(self.limit)
+                self._semaphores[key] = semaphore
+            return semaphore
+
+    @contextmanager
+    def acquire(self, key: Hashable):
+        semaphore = self._get(key)
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    @asynccontextmanager
+    async def acquire_async(self, key: Hashable):
+        semaphore = self._get(key)
+        await semaphore.acquire_async()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T], poll_interval: float = 0.5) -> T:
+    """
+    Await `awaitable`, cancelling it if the client disconnects first.
+    Cancelling an in-flight async query makes the driver cancel it on the server as well.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request.")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def iterate_until_disconnect(request: Request, head: Iterable[T], generator: Generator[T, None, None]) -> AsyncIterator[T]:
+    """
+    Yield `head`, then pull `generator` from the threadpool until it ends or the client disconnects.
+    The generator is always closed, so whatever it holds (connection slot, session, server-side cursor)
+    is released as soon as the response stops rather than whenever it is garbage collected.
+    """
+    sentinel = object()
+    try:
+        for item in head:
+            yield item
+        while not await request.is_disconnected():
+            item = await run_in_threadpool(next, generator, sentinel)
+            if item is sentinel:
+                break
+            yield item
+    finally:
+        # Starlette cancels the body iterator on disconnect; shield so the close still runs
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(generator.close)
@@ -0,0 +1,120 @@
+import logging
+import re
+from concurrent.futures import Executor
+from datetime import date, datetime
+from statistics import median_low
+from typing import List, Optional
+from sqlalchemy import text
+from app.core.settings import settings
+from app.utils.query_guard import classify_error, statement_timeout, TIMEOUT
+
+logger = logging.getLogger("app")
+
+_DATE_TYPE = re.compile(r"^\s*(date|datetime|timestamp|smalldatetime|datetime2|datetimeoffset)\b", re.IGNORECASE)
+
+# Sentinels such as 0001-01-01 or 9999-12-31 would stretch every window to centuries
+_MIN_YEAR = 1900
+_MAX_YEAR = 2100
+
+
+def date_columns(table: dict) -> List[str]:
+    return [column["name"] for column in table.get("columns", []) if _DATE_TYPE.match(column.get("type") or "")]
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        value = value.replace(tzinfo=None)
+    elif isinstance(value, date):
+        value = datetime(value.year, value.month, value.day)
+    else:
+        return None
+    return value if _MIN_YEAR <= value.year <= _MAX_YEAR else None
+
+
+def _probe_statement(engine, table_name: str, columns: List[str], sample_percent: Optional[float] = None) -> str:
+    quote = engine.dialect.identifier_preparer.quote
+    source = ".".join(quote(part) for part in table_name.split(".", 1))
+    # MIN/MAX of an indexed column is answered from the index alone on PostgreSQL and MySQL
+    aggregates = ", ".join(f"MIN({quote(column)}), MAX({quote(column)})" for column in columns)
+    statement = f"SELECT {aggregates} FROM {source}"
+    if sample_percent is not None:
+        statement += f" TABLESAMPLE SYSTEM ({float(sample_percent)})"
+    return statement
+
+
+def _probe(connection, engine, table_name: str, columns: List[str], sample_percent: Optional[float] = None) -> tuple:
+    dialect = engine.dialect.name
+    with connection.begin(), statement_timeout(connection, dialect, settings.DATE_PROFILE_TIMEOUT_MS):
+        return tuple(connection.execute(text(_probe_statement(engine, table_name, columns, sample_percent))).first())
+
+
+def _profile_group(engine, tables: List[dict]) -> List[dict]:
+    ranges = []
+    with engine.connect() as connection:
+        for table in tables:
+            columns = date_columns(table)
+            sampled = False
+            try:
+                try:
+                    row = _probe(connection, engine, table["name"], columns)
+                except Exception as e:
+                    if classify_error(e) != TIMEOUT or engine.dialect.name != "postgresql":
+                        raise
+                    # Too slow without a usable index: settle for the range of a block sample
+                    sampled = True
+                    row = _probe(connection, engine, table["name"], columns, settings.DATE_PROFILE_SAMPLE_PERCENT)
+            except Exception as e:
+                logger.warning(f"Date range probe failed for table {table['name']}: {str(e)}")
+                continue
+
+            for i, column in enumerate(columns):
+                min_value, max_value = _as_datetime(row[2 * i]), _as_datetime(row[2 * i + 1])
+                if min_value is None or max_value is None:
+                    continue
+                ranges.append({
+                    "table": table["name"],
+                    "column": column,
+                    "min": min_value,
+                    "max": max_value,
+                    "sampled": sampled,
+                })
+    return ranges
+
+
+def profile_date_ranges(engine, tables: List[dict], executor: Executor) -> List[dict]:
+    """
+    MIN/MAX of every date and timestamp column, one probe per table bounded by DATE_PROFILE_TIMEOUT_MS.
+    Tables are split over up to DATE_PROFILE_PARALLELISM connections. A probe that times out on
+    PostgreSQL is retried on a TABLESAMPLE and its range flagged as sampled.
+
+    :return: [{"table", "column", "min", "max", "sampled"}] for every column with data.
+    """
+    candidates = [table for table in tables if date_columns(table)][:settings.DATE_PROFILE_MAX_TABLES]
+    if not candidates:
+        return []
+    parallelism = max(settings.DATE_PROFILE_PARALLELISM, 1)
+    groups = [group for group in (candidates[i::parallelism] for i in range(parallelism)) if group]
+    futures = [executor.submit(_profile_group, engine, group) for group in groups]
+    ranges = [date_range for future in futures for date_range in future.result()]
+    logger.info(f"Profiled date ranges of {len(ranges)} column(s) across {len(candidates)} table(s).")
+    return ranges
+
+
+def overall_range(ranges: List[dict], now: Optional[datetime] = None) -> Optional[tuple]:
+    """
+    (min, max) window for a dashboard from the profiled columns, or None if nothing was profiled.
+
+    The window is the median of the column minimums and of the column maximums rather than their
+    union, so a single column reaching back decades (birth dates) does not stretch it. Maximums are
+    clamped to `now`, and columns holding only future dates (validity sentinels) are ignored.
+    """
+    now = now or datetime.now()
+    current = [(date_range["min"], min(date_range["max"], now)) for date_range in ranges if date_range["min"] <= now]
+    if not current:
+        return None
+    return median_low([low for low, _ in current]), median_low([high for _, high in current])
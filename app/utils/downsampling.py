@@ -0,0 +1,128 @@
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from numbers import Number
+from typing import Any, List, Optional, Tuple
+
+Point = Tuple[Any, Any]
+
+OTHER_LABEL = "Other"
+
+# ISO 8601 dates and timestamps, as drivers or JSON columns hand them back as text
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?(Z|[+-]\d{2}(:?\d{2})?)?$")
+
+
+def _is_numeric(value) -> bool:
+    return isinstance(value, (Number, Decimal)) and not isinstance(value, bool)
+
+
+def _to_number(value) -> Optional[float]:
+    """
+    Map an x value onto a numeric axis, or None if it is categorical.
+    """
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return float(value.toordinal() * 86400)
+    if _is_numeric(value):
+        return float(value)
+    if isinstance(value, str) and _ISO_DATE.match(value):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def lttb(points: List[Tuple[float, float]], threshold: int) -> List[int]:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    :param points: (x, y) pairs sorted by x.
+    :param threshold: Number of points to keep; below 1 every point is kept.
+    :return: Indices of the selected points, in order.
+    """
+    length = len(points)
+    if threshold >= length or threshold < 1:
+        return list(range(length))
+    # Too few points to form buckets: keep the ends, or the last (most recent) point alone
+    if threshold == 1:
+        return [length - 1]
+    if threshold == 2:
+        return [0, length - 1]
+
+    selected = [0]
+    bucket_size = (length - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average point of the next bucket, used as the third triangle vertex
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, length)
+        next_bucket = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[a]
+
+        best_area, best_index = -1.0, start
+        for j in range(start, end):
+            bx, by = points[j]
+            area = abs((ax - avg_x) * (by - ay) - (ax - bx) * (avg_y - ay))
+            if area > best_area:
+                best_area, best_index = area, j
+
+        selected.append(best_index)
+        a = best_index
+
+    selected.append(length - 1)
+    return selected
+
+
+def top_n_with_other(points: List[Point], limit: int) -> List[Point]:
+    """
+    Keep the `limit - 1` largest categories and fold the rest into a single "Other" bucket.
+    Points whose value is not numeric are simply truncated.
+    """
+    if len(points) <= limit:
+        return points
+    if limit < 2 or not all(_is_numeric(value) for _, value in points if value is not None):
+        return points[:limit]
+
+    ranked = sorted(range(len(points)), key=lambda i: abs(points[i][1]) if points[i][1] is not None else 0, reverse=True)
+    kept = set(ranked[:limit - 1])
+    other = sum(value for i, (_, value) in enumerate(points) if i not in kept and value is not None)
+    # Preserve the query's own ordering for the categories we keep
+    return [point for i, point in enumerate(points) if i in kept] + [(OTHER_LABEL, other)]
+
+
+def downsample(points: List[Point], max_points: Optional[int]) -> List[Point]:
+    """
+    Reduce a chart series to at most `max_points` points.
+
+    Numeric and time x-axes (including ISO date strings) use LTTB, which keeps the visual shape
+    of the series; the kept points stay in the query's order. Points with a missing x or a
+    non-numeric y cannot be plotted there and are dropped.
+    Categorical x-axes keep the top categories plus an "Other" bucket.
+    """
+    if not max_points or len(points) <= max_points:
+        return points
+
+    sample_x = next((x for x, _ in points if x is not None), None)
+    if _to_number(sample_x) is None:
+        return top_n_with_other(points, max_points)
+
+    numeric = [
+        (_to_number(x), float(y), index)
+        for index, (x, y) in enumerate(points)
+        if x is not None and _is_numeric(y) and _to_number(x) is not None
+    ]
+    if not numeric:
+        return points[:max_points]
+
+    numeric.sort(key=lambda p: p[0])
+    indices = lttb([(x, y) for x, y, _ in numeric], max_points)
+    # LTTB works in x order; hand the points back in the query's order (e.g. ORDER BY day DESC)
+    return [points[index] for index in sorted(numeric[i][2] for i in indices)]
@@ -0,0 +1,210 @@
+import asyncio
+import importlib.util
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from app.core.settings import settings
+from app.utils.crypt import decrypt_string
+
+logger = logging.getLogger("app")
+
+# Async DBAPI driver used for each SQLAlchemy backend
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "mysql": "aiomysql"}
+
+
+class _EngineEntry:
+    def __init__(self, engine: Engine, encrypted_dsn: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.engine = engine
+        self.encrypted_dsn = encrypted_dsn
+        self.loop = loop  # Event loop owning an async engine's connections
+        self.last_used = time.monotonic()
+
+
+class EngineRegistry:
+    """
+    Long-lived, pooled SQLAlchemy engines for external databases, keyed by ExternalDBModel.id.
+
+    Engines are created lazily, reused across requests and evicted either when the
+    registry grows past `max_engines` (least recently used first) or after sitting
+    idle for `idle_seconds`. Decrypted DSNs are cached alongside so Fernet decryption
+    only happens when the stored connection string actually changes.
+    """
+
+    def __init__(self, max_engines: int, idle_seconds: int, use_async: bool = False):
+        self.max_engines = max_engines
+        self.idle_seconds = idle_seconds
+        self.use_async = use_async
+        self._engines: "OrderedDict[str, _EngineEntry]" = OrderedDict()
+        self._dsns: Dict[str, tuple] = {}
+        self._lock = threading.RLock()
+        self._disposals = set()
+
+    def get_engine(self, external_db) -> Engine:
+        """
+        Return the pooled engine for an external database, creating it on first use.
+        """
+        return self.get_engine_for(str(external_db.id), external_db.connection_string)
+
+    def get_engine_for(self, key: str, encrypted_dsn: str) -> Engine:
+        """
+        Return the pooled engine registered under `key` for the given encrypted DSN.
+        A different DSN for the same key replaces the old engine.
+        """
+        with self._lock:
+            self._evict_idle()
+            entry = self._engines.get(key)
+            if entry and entry.encrypted_dsn == encrypted_dsn:
+                entry.last_used = time.monotonic()
+                self._engines.move_to_end(key)
+                return entry.engine
+
+            if entry:
+                logger.info(f"Connection string changed for external DB {key}, rebuilding engine.")
+                self._dispose(key)
+
+            engine = self._create_engine(self._get_dsn(key, encrypted_dsn), self._pool_options(key))
+            self._engines[key] = _EngineEntry(engine, encrypted_dsn, _running_loop() if self.use_async else None)
+            logger.debug(f"Created pooled engine for external DB {key}.")
+
+            while len(self._engines) > self.max_engines:
+                oldest_key = next(iter(self._engines))
+                logger.debug(f"Evicting least recently used engine for external DB {oldest_key}.")
+                self._dispose(oldest_key)
+
+            return engine
+
+    def invalidate(self, external_db_id) -> None:
+        """
+        Dispose every engine and cached DSN belonging to an external database.
+        """
+        prefix = f"{external_db_id}"
+        with self._lock:
+            for key in [k for k in self._engines if k == prefix or k.startswith(f"{prefix}:")]:
+                self._dispose(key)
+            for key in [k for k in self._dsns if k == prefix or k.startswith(f"{prefix}:")]:
+                self._dsns.pop(key, None)
+        logger.info(f"Invalidated pooled engines for external DB {external_db_id}.")
+
+    def dispose_all(self) -> None:
+        with self._lock:
+            for key in list(self._engines):
+                self._dispose(key)
+            self._dsns.clear()
+
+    async def aclose(self) -> None:
+        """
+        Dispose every engine, awaiting async engines so their connections close on the running loop.
+        """
+        with self._lock:
+            entries = list(self._engines.values())
+            self._engines.clear()
+            self._dsns.clear()
+        for entry in entries:
+            if isinstance(entry.engine, AsyncEngine):
+                await entry.engine.dispose()
+            else:
+                entry.engine.dispose()
+
+    def _create_engine(self, dsn: str, options: dict):
+        if not self.use_async:
+            return create_engine(dsn, **options)
+        return create_async_engine(to_async_url(dsn), **options)
+
+    def _get_dsn(self, key: str, encrypted_dsn: str) -> str:
+        cached = self._dsns.get(key)
+        if cached and cached[0] == encrypted_dsn:
+            return cached[1]
+        dsn = decrypt_string(encrypted_dsn)
+        self._dsns[key] = (encrypted_dsn, dsn)
+        return dsn
+
+    def _pool_options(self, key: str) -> dict:
+        options = {
+            "pool_size": settings.EXTERNAL_DB_POOL_SIZE,
+            "max_overflow": settings.EXTERNAL_DB_MAX_OVERFLOW,
+            "pool_recycle": settings.EXTERNAL_DB_POOL_RECYCLE,
+            "pool_pre_ping": True,
+        }
+        override: Optional[dict] = settings.EXTERNAL_DB_POOL_OVERRIDES.get(key.split(":")[0])
+        if override:
+            options.update({k: v for k, v in override.items() if k in options})
+        return options
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, e in self._engines.items() if now - e.last_used > self.idle_seconds]:
+            logger.debug(f"Evicting idle engine for external DB {key}.")
+            self._dispose(key)
+
+    def _dispose(self, key: str) -> None:
+        entry = self._engines.pop(key, None)
+        if entry:
+            if isinstance(entry.engine, AsyncEngine):
+                self._dispose_async(entry)
+            else:
+                entry.engine.dispose()
+
+    def _dispose_async(self, entry: _EngineEntry) -> None:
+        """
+        Close an async engine's pooled connections on the event loop that opened them.
+        """
+        loop = entry.loop
+        if loop is None or loop.is_closed():
+            # The loop is gone and its connections with it; just drop the pool
+            entry.engine.sync_engine.dispose(close=False)
+            return
+        if _running_loop() is loop:
+            task = loop.create_task(entry.engine.dispose())
+            self._disposals.add(task)
+            task.add_done_callback(self._disposals.discard)
+        else:
+            asyncio.run_coroutine_threadsafe(entry.engine.dispose(), loop)
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def to_async_url(dsn: str) -> str:
+    """
+    Rewrite a sync connection string to the async driver of the same backend.
+    """
+    url = make_url(dsn)
+    backend = url.get_backend_name()
+    url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    if backend == "postgresql" and "sslmode" in url.query:
+        # asyncpg takes `ssl` instead of libpq's `sslmode`
+        url = url.update_query_dict({"ssl": url.query["sslmode"]}).difference_update_query(["sslmode"])
+    return url.render_as_string(hide_password=False)
+
+
+def supports_async(external_db) -> bool:
+    """
+    Whether an async engine can be built for this external database in this environment.
+    """
+    if not settings.EXTERNAL_DB_ASYNC_ENABLED:
+        return False
+    provider = (external_db.database_provider or "").lower()
+    backend = "postgresql" if provider.startswith("postgres") else provider
+    driver = ASYNC_DRIVERS.get(backend)
+    return driver is not None and importlib.util.find_spec(driver) is not None
+
+
+engine_registry = EngineRegistry(
+    max_engines=settings.EXTERNAL_DB_MAX_ENGINES,
+    idle_seconds=settings.EXTERNAL_DB_ENGINE_IDLE_SECONDS,
+)
+
+async_engine_registry = EngineRegistry(
+    max_engines=settings.EXTERNAL_DB_MAX_ENGINES,
+    idle_seconds=settings.EXTERNAL_DB_ENGINE_IDLE_SECONDS,
+    use_async=True,
+)
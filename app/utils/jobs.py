@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Hashable, Optional, Set, Tuple
+from uuid import uuid4
+from app.core.settings import settings
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, kind: str, key: Optional[Hashable] = None, params: Any = None, user_id: Optional[Hashable] = None):
+        self.id = str(uuid4())
+        self.kind = kind
+        self.key = key
+        self.params = params  # What the job was started with, to tell apart requests sharing its key
+        self.user_ids: Set[Hashable] = {user_id} if user_id is not None else set()  # Who started or joined it, and may read it
+        self.status = PENDING
+        self.stage: Optional[str] = None
+        self.done = 0
+        self.total: Optional[int] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.updated_at = self.created_at
+        self.finished_at: Optional[float] = None
+        self.version = 0  # Bumped on every change, so pollers can tell whether anything moved
+
+    @property
+    def active(self) -> bool:
+        return self.status in (PENDING, RUNNING)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": {"done": self.done, "total": self.total},
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+            "version": self.version,
+        }
+
+
+class JobRegistry:
+    """
+    In-process registry of background jobs and their progress.
+
+    Jobs are updated from worker threads, so every change goes through the lock. Finished jobs
+    are kept for `ttl_seconds` to be polled, then dropped. State lives in this process only, so
+    with several workers a job is only visible to, and only deduplicated within, its own process.
+    A job started for a user can only be read by that user and those who joined it.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def create(self, kind: str, key: Optional[Hashable] = None, user_id: Optional[Hashable] = None) -> Job:
+        """
+        Register a new job. With a `key`, an active job of the same kind and key is returned instead.
+        """
+        return self.create_or_join(kind, key, user_id=user_id)[0]
+
+    def create_or_join(self, kind: str, key: Optional[Hashable] = None, params: Any = None, user_id: Optional[Hashable] = None) -> Tuple[Job, bool]:
+        """
+        Like create, but also tells whether the job is new, i.e. whether the caller has to start it.
+        A joined job may have been started with other `params`; callers compare `job.params`.
+        `user_id` is allowed to read the job, whether it started or joined it.
+        """
+        with self._lock:
+            self._prune()
+            if key is not None:
+                for job in self._jobs.values():
+                    if job.kind == kind and job.key == key and job.active:
+                        if user_id is not None:
+                            job.user_ids.add(user_id)
+                        return job, False
+            job = Job(kind, key, params, user_id)
+            self._jobs[job.id] = job
+            return job, True
+
+    def get(self, job_id: str, user_id: Optional[Hashable] = None) -> Optional[Job]:
+        """
+        The job, or None if it does not exist or, given a `user_id`, that user may not read it.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (user_id is not None and user_id not in job.user_ids):
+                return None
+            return job
+
+    def progress(self, job_id: str, done: Optional[int] = None, total: Optional[int] = None, stage: Optional[str] = None) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.status = RUNNING
+            if done is not None:
+                job.done = done
+            if total is not None:
+                job.total = total
+            if stage is not None:
+                job.stage = stage
+            self._touch(job)
+
+    def succeed(self, job_id: str, result: Any = None) -> None:
+        self._finish(job_id, SUCCEEDED, result=result)
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, FAILED, error=error)
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.status = status
+            job.result = result
+            job.error = error
+            job.finished_at = time.monotonic()
+            self._touch(job)
+
+    async def watch(self, job_id: str, poll_interval: float, heartbeat: float) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield the job's state whenever it changes, until it finishes. None is yielded after
+        `heartbeat` seconds without a change, so idle connections can be kept alive.
+        """
+        version = None
+        idle = 0.0
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                return
+            if job.version != version:
+                version = job.version
+                idle = 0.0
+                yield job.to_dict()
+                if not job.active:
+                    return
+            elif idle >= heartbeat:
+                idle = 0.0
+                yield None
+            await asyncio.sleep(poll_interval)
+            idle += poll_interval
+
+    def _touch(self, job: Job) -> None:
+        job.updated_at = datetime.utcnow()
+        job.version += 1
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for job_id in [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.ttl_seconds
+        ]:
+            del self._jobs[job_id]
+
+
+job_registry = JobRegistry(ttl_seconds=settings.JOB_TTL_SECONDS)
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+import httpx
+from app.core.settings import settings
+
+try:
+    import h2  # noqa: F401  # HTTP/2 support for httpx
+except ImportError:
+    h2 = None
+
+logger = logging.getLogger("app")
+
+# 504 is left out: the gateway gave up waiting, but the service may still be generating
+_RETRYABLE_STATUS = {429, 502, 503}
+
+# Failures before the request reached the LLM service; read timeouts are not retried,
+# since the service may still be working on the request
+_RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling the LLM service while its circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails calls fast for `reset_seconds`.
+    Then one trial call is let through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed" or not self.failure_threshold:
+            return True
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def abandon_trial(self) -> None:
+        # A trial call that ended without an outcome (cancelled, unexpected error) says nothing
+        # about the service; let the next call try again. No-op once an outcome was recorded.
+        self._trial_running = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_running = False
+        if self.failure_threshold and (self.opened_at is not None or self.failures >= self.failure_threshold):
+            if self.opened_at is None:
+                logger.warning(f"LLM service circuit opened after {self.failures} consecutive failures.")
+            self.opened_at = time.monotonic()
+
+
+class LLMClient:
+    """
+    Shared HTTP client for the LLM service: pooled keep-alive connections (HTTP/2 when enabled
+    and available), per-call timeouts, retries with jittered exponential backoff and a circuit breaker.
+
+    Started and closed by the app lifespan; created lazily on first use otherwise. A `transport`
+    (e.g. httpx.MockTransport or an ASGI app) can be injected to run against a local stub.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.transport = transport
+        self.breaker = CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET_SECONDS)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        if self._client is not None:
+            return
+        http2 = settings.LLM_HTTP2
+        if http2 and h2 is None:
+            logger.warning("LLM_HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1.")
+            http2 = False
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            transport=self.transport,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=httpx.Timeout(settings.LLM_TIMEOUT_QUERIES_SECONDS, connect=settings.LLM_CONNECT_TIMEOUT_SECONDS),
+        )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def post(self, url: str, payload: dict, timeout: float, retries: Optional[int] = None) -> httpx.Response:
+        """
+        POST JSON to the LLM service and return the final response; status checks are left to the caller.
+        Connection errors, 429, 502 and 503 are retried up to `retries` times (LLM_RETRIES by default).
+
+        :raises CircuitOpenError: While the circuit breaker is open.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM service is unavailable, requests are paused after repeated failures.")
+        try:
+            await self.start()
+            return await self._post_with_retries(url, payload, timeout, settings.LLM_RETRIES if retries is None else retries)
+        finally:
+            self.breaker.abandon_trial()
+
+    @asynccontextmanager
+    async def stream(self, url: str, payload: dict, timeout: float) -> AsyncIterator[httpx.Response]:
+        """
+        POST JSON to the LLM service and yield the response while its body is still arriving.
+        Not retried, since partial output may already have been passed on.
+
+        :raises CircuitOpenError: While the circuit breaker is open.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM service is unavailable, requests are paused after repeated failures.")
+        try:
+            await self.start()
+            request_timeout = httpx.Timeout(timeout, connect=settings.LLM_CONNECT_TIMEOUT_SECONDS)
+            async with self._client.stream("POST", url, json=payload, timeout=request_timeout) as response:
+                if response.status_code in _RETRYABLE_STATUS or response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                yield response
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.breaker.abandon_trial()
+
+    async def _post_with_retries(self, url: str, payload: dict, timeout: float, retries: int) -> httpx.Response:
+        request_timeout = httpx.Timeout(timeout, connect=settings.LLM_CONNECT_TIMEOUT_SECONDS)
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.post(url, json=payload, timeout=request_timeout)
+            except _RETRYABLE_ERRORS as e:
+                if attempt >= retries:
+                    self.breaker.record_failure()
+                    raise
+                logger.warning(f"LLM request to {url} failed ({type(e).__name__}), retrying.")
+            except httpx.TransportError:
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in _RETRYABLE_STATUS and response.status_code < 500:
+                    self.breaker.record_success()
+                    return response
+                if response.status_code not in _RETRYABLE_STATUS or attempt >= retries:
+                    self.breaker.record_failure()
+                    return response
+                logger.warning(f"LLM service answered {response.status_code} for {url}, retrying.")
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps retrying callers from hitting a recovering service in lockstep
+        ceiling = min(settings.LLM_RETRY_BACKOFF_MAX_SECONDS, settings.LLM_RETRY_BACKOFF_SECONDS * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+
+llm_client = LLMClient()
@@ -0,0 +1,92 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_SCALAR_END = re.compile(r"[,}\]]")
+
+
+class StreamedJSONFields:
+    """
+    Incrementally extracts top-level fields of a JSON object that arrives in chunks, so the
+    start of a long string value can be shown before the rest of the object has been received.
+
+    feed() returns ("delta", field, text) while a string value is still arriving and
+    ("value", field, value) once a field is complete. Fields are reported in the given order.
+    """
+
+    def __init__(self, fields: List[str]):
+        self.fields = fields
+        self.text = ""
+        self._emitted: Dict[str, int] = {}
+        self._done: Dict[str, Any] = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, Any]]:
+        self.text += chunk
+        events = []
+        for field in self.fields:
+            if field in self._done:
+                continue
+            found = self._scan(field)
+            if found is None:
+                break
+            partial, complete, value = found
+            emitted = self._emitted.get(field, 0)
+            if partial is not None and len(partial) > emitted:
+                events.append(("delta", field, partial[emitted:]))
+                self._emitted[field] = len(partial)
+            if not complete:
+                break
+            self._done[field] = value
+            events.append(("value", field, value))
+        return events
+
+    def result(self) -> dict:
+        """
+        The complete object, once the whole response has been fed.
+        """
+        return json.loads(self.text)
+
+    def finish(self) -> List[Tuple[str, str, Any]]:
+        """
+        ("value", field, value) for the fields not reported yet, once the whole response has been fed.
+        """
+        result = self.result()
+        return [("value", field, result[field]) for field in self.fields if field not in self._done and field in result]
+
+    def _scan(self, field: str) -> Optional[Tuple[Optional[str], bool, Any]]:
+        # (decoded string so far or None for non-strings, whether the value is complete, value)
+        match = re.search(r'"%s"\s*:\s*' % re.escape(field), self.text)
+        if match is None or match.end() >= len(self.text):
+            return None
+        start = match.end()
+        if self.text[start] != '"':
+            end = _SCALAR_END.search(self.text, start)
+            if end is None:
+                return None
+            return None, True, json.loads(self.text[start:end.start()])
+
+        decoded = []
+        index = start + 1
+        while index < len(self.text):
+            char = self.text[index]
+            if char == '"':
+                value = "".join(decoded)
+                return value, True, value
+            if char != "\\":
+                decoded.append(char)
+                index += 1
+                continue
+            # Stop before an escape sequence that has not fully arrived yet
+            if index + 1 >= len(self.text):
+                break
+            escape = self.text[index + 1]
+            if escape == "u":
+                if index + 6 > len(self.text):
+                    break
+                decoded.append(chr(int(self.text[index + 2:index + 6], 16)))
+                index += 6
+            else:
+                decoded.append(_ESCAPES.get(escape, escape))
+                index += 2
+        return "".join(decoded), False, None
@@ -0,0 +1,69 @@
+import re
+from typing import Any, Hashable, Optional
+from app.core.settings import settings
+from app.utils.lru import TTLLRUCache
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+# Filler only: words that can change the meaning of a question (not, no, without, top, by, ...) are kept
+_STOPWORDS = {
+    "a", "an", "the", "please", "show", "me", "give", "get", "list", "display", "find", "tell",
+    "what", "which", "is", "are", "can", "could", "you", "i", "want", "would", "like", "see",
+}
+
+
+def normalize_question(question: str) -> str:
+    """
+    Canonical form of an NL question for cache lookups: lowercase, no punctuation or filler words,
+    single spaces. "Show me the total sales, by region!" and "total sales by region" are equal.
+    """
+    words = _PUNCTUATION.sub(" ", (question or "").lower()).split()
+    return " ".join(word for word in words if word not in _STOPWORDS)
+
+
+class NLQCache:
+    """
+    TTL + LRU cache of NL-to-SQL answers, partitioned per tenant.
+
+    Every tenant gets its own LRU of at most NLQ_CACHE_MAX_ENTRIES_PER_TENANT entries, so one busy
+    tenant cannot evict the others' answers and lookups never cross tenants. The least recently
+    active tenants are dropped past NLQ_CACHE_MAX_TENANTS.
+    """
+
+    def __init__(self, max_tenants: int, max_entries_per_tenant: int, ttl_seconds: float):
+        self.max_entries_per_tenant = max_entries_per_tenant
+        self.ttl_seconds = ttl_seconds
+        self._tenants = TTLLRUCache(max_entries=max_tenants)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tenant: str, key: Hashable) -> Optional[Any]:
+        partition = self._tenants.get(tenant)
+        value = partition.get(key) if partition is not None else None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, tenant: str, key: Hashable, value: Any) -> None:
+        partition = self._tenants.get(tenant)
+        if partition is None:
+            partition = TTLLRUCache(max_entries=self.max_entries_per_tenant, default_ttl=self.ttl_seconds)
+            self._tenants.set(tenant, partition)
+        partition.set(key, value)
+
+    def delete(self, tenant: str, key: Hashable) -> None:
+        partition = self._tenants.get(tenant)
+        if partition is not None:
+            partition.delete(key)
+
+    def invalidate_tenant(self, tenant: str) -> None:
+        self._tenants.delete(tenant)
+
+
+nlq_cache = NLQCache(
+    max_tenants=settings.NLQ_CACHE_MAX_TENANTS,
+    max_entries_per_tenant=settings.NLQ_CACHE_MAX_ENTRIES_PER_TENANT,
+    ttl_seconds=settings.NLQ_CACHE_TTL_SECONDS,
+)
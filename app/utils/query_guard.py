@@ -0,0 +1,438 @@
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import List, Optional
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+from app.core.settings import settings
+from app.utils.concurrency import KeyedSemaphore
+from app.utils.result_cache import sql_fingerprint
+
+logger = logging.getLogger("app")
+
+# Outcome statuses recorded in query_execution_log
+OK = "ok"
+TRUNCATED = "truncated"
+REJECTED = "rejected"
+TIMEOUT = "timeout"
+CANCELLED = "cancelled"
+ERROR = "error"
+
+_TIMEOUT_MARKERS = (
+    "statement timeout",                      # PostgreSQL 57014
+    "maximum statement execution time",       # MySQL 3024
+    "query execution was interrupted",
+)
+
+expensive_query_limiter = KeyedSemaphore(settings.QUERY_EXPENSIVE_CONCURRENCY)
+
+# Outcomes are written off the request path by a single background thread
+_outcome_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-log")
+
+
+class QueryRejectedError(Exception):
+    """
+    Raised when a query's estimated cost is over the admission threshold.
+    """
+
+
+def timeout_statements(dialect: str, timeout_ms: Optional[int] = None) -> List[str]:
+    """
+    Statements that bound the next query's runtime on the server, which also cancels it there.
+    `timeout_ms` defaults to QUERY_STATEMENT_TIMEOUT_MS. The MySQL limit is set on the session;
+    run them through statement_timeout, which restores it before the connection goes back to the pool.
+    """
+    if timeout_ms is None:
+        timeout_ms = settings.QUERY_STATEMENT_TIMEOUT_MS
+    if not timeout_ms:
+        return []
+    if dialect == "postgresql":
+        # Scoped to the current transaction, so it never leaks to other users of the pooled connection
+        return [f"SET LOCAL statement_timeout = {int(timeout_ms)}"]
+    if dialect in ("mysql", "mariadb"):
+        return [f"SET SESSION max_execution_time = {int(timeout_ms)}"]
+    return []
+
+
+def reset_timeout_statements(dialect: str, timeout_ms: Optional[int] = None) -> List[str]:
+    """
+    Statements that undo timeout_statements; only session-level limits need it.
+    """
+    if timeout_ms is None:
+        timeout_ms = settings.QUERY_STATEMENT_TIMEOUT_MS
+    if timeout_ms and dialect in ("mysql", "mariadb"):
+        return ["SET SESSION max_execution_time = DEFAULT"]
+    return []
+
+
+@contextmanager
+def statement_timeout(connection, dialect: str, timeout_ms: Optional[int] = None):
+    """
+    Bound the runtime of the statements run inside the block on a Session or Connection.
+    A session-level limit is put back to the server default afterwards, so it does not carry over
+    to the next user of the pooled connection; if that fails the connection is invalidated instead.
+    """
+    for statement in timeout_statements(dialect, timeout_ms):
+        connection.execute(text(statement))
+    try:
+        yield
+    finally:
+        try:
+            for statement in reset_timeout_statements(dialect, timeout_ms):
+                connection.execute(text(statement))
+        except Exception as e:
+            logger.warning(f"Could not reset the statement timeout, discarding the connection: {str(e)}")
+            connection.invalidate()
+
+
+@asynccontextmanager
+async def statement_timeout_async(connection, dialect: str, timeout_ms: Optional[int] = None):
+    """
+    statement_timeout for an AsyncConnection.
+    """
+    for statement in timeout_statements(dialect, timeout_ms):
+        await connection.execute(text(statement))
+    try:
+        yield
+    finally:
+        try:
+            for statement in reset_timeout_statements(dialect, timeout_ms):
+                await connection.execute(text(statement))
+        except Exception as e:
+            logger.warning(f"Could not reset the statement timeout, discarding the connection: {str(e)}")
+            await connection.invalidate()
+
+
+def snapshot_statements(dialect: str) -> List[str]:
+    """
+    Statements that open a read-only REPEATABLE READ transaction, so every statement that
+    follows on the connection reads from the same snapshot.
+    """
+    if dialect == "postgresql":
+        # Must be the first statement of the transaction
+        return ["SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"]
+    if dialect in ("mysql", "mariadb"):
+        return [
+            "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ",
+            "START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY",
+        ]
+    # SQLite reads inside one transaction already see a single snapshot
+    return []
+
+
+def explain_statement(dialect: str, query: str) -> Optional[str]:
+    if not settings.QUERY_EXPLAIN_ENABLED:
+        return None
+    if settings.QUERY_MAX_EXPLAIN_COST is None and not settings.QUERY_MAX_SCAN_ROWS:
+        return None
+    statement = query.strip().rstrip(";")
+    if dialect == "postgresql":
+        return f"EXPLAIN (FORMAT JSON) {statement}"
+    if dialect in ("mysql", "mariadb"):
+        return f"EXPLAIN FORMAT=JSON {statement}"
+    return None
+
+
+class PlanEstimate:
+    """
+    What the planner expects of a query: total cost, rows returned, and the table read when the
+    whole plan is one unfiltered full scan (its estimate then comes from possibly stale catalog stats).
+    """
+
+    def __init__(self, cost: Optional[float] = None, rows: Optional[float] = None, full_scan_table: Optional[str] = None):
+        self.cost = cost
+        self.rows = rows
+        self.full_scan_table = full_scan_table
+
+
+def _pg_estimate(plan) -> PlanEstimate:
+    root = plan[0]["Plan"]
+    node = root
+    # Parallel scans sit under a Gather that only collects their rows
+    while node.get("Node Type") in ("Gather", "Gather Merge") and len(node.get("Plans", [])) == 1:
+        node = node["Plans"][0]
+    full_scan_table = None
+    if node.get("Node Type") in ("Seq Scan", "Parallel Seq Scan") and "Filter" not in node:
+        relation = node.get("Relation Name")
+        full_scan_table = f"{node['Schema']}.{relation}" if node.get("Schema") else relation
+    return PlanEstimate(float(root["Total Cost"]), float(root["Plan Rows"]), full_scan_table)
+
+
+def _mysql_estimate(plan) -> PlanEstimate:
+    block = plan["query_block"]
+    cost = float(block["cost_info"]["query_cost"])
+    node = block
+    while "ordering_operation" in node:
+        node = node["ordering_operation"]
+    if "grouping_operation" in node or "duplicates_removal" in node:
+        # Grouped output size is not part of MySQL's plan
+        return PlanEstimate(cost)
+    tables = [entry["table"] for entry in node.get("nested_loop", []) if "table" in entry]
+    if "table" in node:
+        tables = [node["table"]]
+    if not tables or "rows_produced_per_join" not in tables[-1]:
+        return PlanEstimate(cost)
+    # MySQL's JSON plan does not reflect LIMIT, so this is the estimate before it applies
+    rows = float(tables[-1]["rows_produced_per_join"])
+    full_scan_table = None
+    if len(tables) == 1 and tables[0].get("access_type") == "ALL" and "attached_condition" not in tables[0]:
+        full_scan_table = tables[0].get("table_name")
+    return PlanEstimate(cost, rows, full_scan_table)
+
+
+def parse_explain(dialect: str, rows) -> PlanEstimate:
+    """
+    Pull the planner's estimates out of an EXPLAIN (FORMAT JSON) result.
+    """
+    try:
+        plan = rows[0][0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        if dialect == "postgresql":
+            return _pg_estimate(plan)
+        return _mysql_estimate(plan)
+    except (IndexError, KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Could not read EXPLAIN estimates: {str(e)}")
+        return PlanEstimate()
+
+
+def is_expensive(cost: Optional[float]) -> bool:
+    threshold = settings.QUERY_MAX_EXPLAIN_COST
+    return cost is not None and threshold is not None and cost > threshold
+
+
+def check_admission(cost: Optional[float]) -> None:
+    if is_expensive(cost) and settings.QUERY_EXPENSIVE_ACTION != "queue":
+        raise QueryRejectedError(
+            f"Query rejected: estimated cost {cost:.0f} exceeds the limit of {settings.QUERY_MAX_EXPLAIN_COST:.0f}."
+        )
+
+
+def needs_profiled_rows(estimate: PlanEstimate) -> bool:
+    return bool(settings.QUERY_MAX_SCAN_ROWS and estimate.full_scan_table)
+
+
+def profiled_rows(external_db_id, estimate: PlanEstimate) -> Optional[int]:
+    """
+    Profiled row count of the table a bare full-scan plan reads. Reads the metadata DB on a cache miss.
+    """
+    # Imported lazily: column_stats builds on this module
+    from app.utils.column_stats import table_sizes
+
+    return table_sizes.rows(external_db_id, estimate.full_scan_table)
+
+
+def check_scan(estimate: PlanEstimate, profiled: Optional[int] = None) -> None:
+    """
+    Reject a query the planner expects to return more than QUERY_MAX_SCAN_ROWS rows. When the plan
+    is a bare full scan the profiled row count of the table is trusted over a lower planner estimate,
+    which may come from missing or stale catalog statistics.
+    """
+    limit = settings.QUERY_MAX_SCAN_ROWS
+    rows = estimate.rows
+    if profiled is not None and (rows is None or profiled > rows):
+        rows = profiled
+    if limit and rows is not None and rows > limit:
+        source = f"full scan of {estimate.full_scan_table}" if estimate.full_scan_table else "query"
+        raise QueryRejectedError(
+            f"Query rejected: {source} is expected to return about {rows:.0f} rows, over the limit of {limit} rows."
+        )
+
+
+def row_cap() -> Optional[int]:
+    return settings.QUERY_MAX_ROWS or None
+
+
+def client_timeout() -> Optional[float]:
+    """
+    Client-side deadline for async executions, slightly past the server-side statement timeout.
+    Cancelling the awaiting task makes the driver cancel the statement on the server.
+    """
+    timeout_ms = settings.QUERY_STATEMENT_TIMEOUT_MS
+    return timeout_ms / 1000 + 5 if timeout_ms else None
+
+
+def classify_error(error: Exception) -> str:
+    if isinstance(error, QueryRejectedError):
+        return REJECTED
+    if isinstance(error, (asyncio.CancelledError, asyncio.TimeoutError)):
+        return CANCELLED if isinstance(error, asyncio.CancelledError) else TIMEOUT
+    message = str(error).lower()
+    return TIMEOUT if any(marker in message for marker in _TIMEOUT_MARKERS) else ERROR
+
+
+class CappedRows(list):
+    """
+    Row tuples of a query, flagged when the row cap cut the result short.
+    """
+
+    def __init__(self, rows=(), truncated: bool = False):
+        super().__init__(rows)
+        self.truncated = truncated
+
+
+# Server-side cursors, so rows are not all buffered on the client before the cap applies. Closing a
+# psycopg2 named cursor drops the rest of the result on the server; PyMySQL's and aiomysql's SSCursor
+# read and discard it instead, so on MySQL the cap is also put into the SQL (see capped_statement)
+CAPPED_EXECUTION_OPTIONS = {"stream_results": True}
+
+
+def capped_statement(dialect: str, query: str) -> str:
+    """
+    The query as executed under the row cap: on MySQL wrapped in LIMIT cap + 1, so the server stops
+    producing rows just past the cap and closing the cursor does not transfer the rest.
+    """
+    cap = row_cap()
+    if cap is None or dialect not in ("mysql", "mariadb"):
+        return query
+    # A derived table's ORDER BY carries over to an outer query that only adds a LIMIT
+    return f"SELECT * FROM ({query.strip().rstrip(';')}) AS _capped LIMIT {int(cap) + 1}"
+
+
+def _capped(rows: list, cap: Optional[int]) -> CappedRows:
+    if cap is None:
+        return CappedRows(rows)
+    return CappedRows(rows[:cap], len(rows) > cap)
+
+
+def fetch_capped(result) -> CappedRows:
+    """
+    Fetch at most QUERY_MAX_ROWS rows of a capped_statement executed with CAPPED_EXECUTION_OPTIONS,
+    then close it.
+    """
+    cap = row_cap()
+    try:
+        fetched = result.fetchall() if cap is None else result.fetchmany(cap + 1)
+        return _capped([tuple(row) for row in fetched], cap)
+    finally:
+        result.close()
+
+
+async def fetch_capped_async(result) -> CappedRows:
+    """
+    fetch_capped for the AsyncResult of AsyncConnection.stream().
+    """
+    cap = row_cap()
+    try:
+        fetched = await (result.fetchall() if cap is None else result.fetchmany(cap + 1))
+        return _capped([tuple(row) for row in fetched], cap)
+    finally:
+        await result.close()
+
+
+class QueryOutcome:
+    """
+    Collects what happened to one guarded execution and records it to query_execution_log.
+    """
+
+    def __init__(self, external_db_id, query: str, query_id=None):
+        self.external_db_id = external_db_id
+        self.query = query
+        self.query_id = query_id
+        self.started = time.monotonic()
+        self.status = OK
+        self.estimated_cost: Optional[float] = None
+        self.row_count: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def failed(self, error: Exception) -> None:
+        self.status = classify_error(error)
+        self.error = str(error)
+
+    def finish(self) -> None:
+        duration_ms = (time.monotonic() - self.started) * 1000
+        if self.status != OK:
+            logger.warning(
+                f"Query on external DB {self.external_db_id} finished with status {self.status} "
+                f"after {duration_ms:.0f} ms (estimated cost {self.estimated_cost}): {self.error}"
+            )
+        if settings.QUERY_LOG_OUTCOMES:
+            _outcome_writer.submit(record_outcome, self, duration_ms)
+
+
+def record_outcome(outcome: QueryOutcome, duration_ms: float) -> None:
+    # Imported lazily: app.core.db pulls in every model at import time
+    from app.core.db import SessionLocal
+    from app.models.post_processing import QueryExecutionLog
+
+    db = SessionLocal()
+    try:
+        db.add(QueryExecutionLog(
+            external_db_id=outcome.external_db_id,
+            query_id=outcome.query_id,
+            query_fingerprint=sql_fingerprint(outcome.query),
+            query_text=outcome.query,
+            status=outcome.status,
+            duration_ms=duration_ms,
+            estimated_cost=outcome.estimated_cost,
+            row_count=outcome.row_count,
+            error=outcome.error,
+        ))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Failed to record query outcome: {str(e)}")
+    finally:
+        db.close()
+
+
+@contextmanager
+def guarded(session, dialect: str, external_db_id, query: str, query_id=None):
+    """
+    Apply the statement timeout and EXPLAIN admission on a sync session, then hand back the
+    QueryOutcome so the caller can execute and fill in the row count. Queries expected to return
+    too many rows raise QueryRejectedError; expensive ones either raise it or wait for a slot in
+    the per-DB expensive-query queue.
+    """
+    outcome = QueryOutcome(external_db_id, query, query_id)
+    try:
+        with statement_timeout(session, dialect):
+            explain = explain_statement(dialect, query)
+            if explain:
+                estimate = parse_explain(dialect, session.execute(text(explain)).fetchall())
+                outcome.estimated_cost = estimate.cost
+                check_scan(estimate, profiled_rows(external_db_id, estimate) if needs_profiled_rows(estimate) else None)
+            check_admission(outcome.estimated_cost)
+            if is_expensive(outcome.estimated_cost):
+                with expensive_query_limiter.acquire(str(external_db_id)):
+                    yield outcome
+            else:
+                yield outcome
+    except Exception as e:
+        outcome.failed(e)
+        raise
+    finally:
+        outcome.finish()
+
+
+@asynccontextmanager
+async def guarded_async(connection, dialect: str, external_db_id, query: str, query_id=None):
+    """
+    Async counterpart of `guarded` for an AsyncConnection.
+    """
+    outcome = QueryOutcome(external_db_id, query, query_id)
+    try:
+        async with statement_timeout_async(connection, dialect):
+            explain = explain_statement(dialect, query)
+            if explain:
+                estimate = parse_explain(dialect, (await connection.execute(text(explain))).fetchall())
+                outcome.estimated_cost = estimate.cost
+                profiled = None
+                if needs_profiled_rows(estimate):
+                    # The metadata DB is read with a sync session
+                    profiled = await run_in_threadpool(profiled_rows, external_db_id, estimate)
+                check_scan(estimate, profiled)
+            check_admission(outcome.estimated_cost)
+            if is_expensive(outcome.estimated_cost):
+                async with expensive_query_limiter.acquire_async(str(external_db_id)):
+                    yield outcome
+            else:
+                yield outcome
+    except BaseException as e:
+        outcome.failed(e)
+        raise
+    finally:
+        outcome.finish()
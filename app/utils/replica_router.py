@@ -0,0 +1,233 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from app.core.settings import settings
+from app.utils.engine_registry import engine_registry
+from app.utils.query_guard import classify_error, TIMEOUT
+
+logger = logging.getLogger("app")
+
+_PG_LAG = text(
+    "SELECT CASE"
+    " WHEN NOT pg_is_in_recovery() THEN 0"
+    # Caught up: replay timestamp would otherwise grow while the primary is idle
+    " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+    " END"
+)
+
+
+class ReplicaUnavailableError(Exception):
+    """
+    Raised when reads must stay off the primary but no replica is healthy and within its lag limit.
+    """
+
+
+class ReadTarget:
+    """
+    A database that can serve chart reads: the primary or one of its read replicas.
+    Registry keys are "<external_db_id>" for the primary and "<external_db_id>:<replica_id>" for replicas.
+    """
+
+    def __init__(self, key: str, encrypted_dsn: str, replica_id: Optional[str] = None, max_lag_seconds: Optional[float] = None):
+        self.key = key
+        self.encrypted_dsn = encrypted_dsn
+        self.replica_id = replica_id
+        self.max_lag_seconds = max_lag_seconds
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+        self.checked_at = 0.0
+        self.last_error: Optional[str] = None
+        self.outstanding = 0
+        self._check_lock = threading.Lock()
+
+    @property
+    def is_primary(self) -> bool:
+        return self.replica_id is None
+
+    def within_lag(self) -> bool:
+        limit = self.max_lag_seconds if self.max_lag_seconds is not None else settings.REPLICA_MAX_LAG_SECONDS
+        return self.lag_seconds is None or self.lag_seconds <= limit
+
+
+def measure_lag(connection, dialect: str) -> Optional[float]:
+    """
+    Replication lag in seconds as reported by the replica itself; None when it cannot tell.
+    """
+    if dialect == "postgresql":
+        lag = connection.execute(_PG_LAG).scalar()
+        return float(lag) if lag is not None else None
+    if dialect in ("mysql", "mariadb"):
+        try:
+            row = connection.execute(text("SHOW REPLICA STATUS")).mappings().first()
+        except DBAPIError:
+            # MySQL before 8.0.22 and MariaDB reject the new syntax (1064, a ProgrammingError)
+            row = connection.execute(text("SHOW SLAVE STATUS")).mappings().first()
+        if row is None:
+            return 0.0  # Not a replica
+        lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        return float(lag) if lag is not None else None
+    connection.execute(text("SELECT 1"))
+    return 0.0
+
+
+class ReplicaRouter:
+    """
+    Routes read-only chart queries of an external database to its read replicas.
+
+    Replicas are health- and lag-checked at most every REPLICA_HEALTH_CHECK_SECONDS; among those
+    that are up and within their lag limit the one with the fewest outstanding requests wins.
+    When none qualifies reads fall back to the primary, unless the database has replicas and is
+    configured to never receive analytics traffic (REPLICA_STRICT / REPLICA_STRICT_DB_IDS).
+    Databases without replicas always read from the primary.
+    """
+
+    def __init__(self):
+        self._replicas: Dict[str, Tuple[float, List[ReadTarget]]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, external_db) -> ReadTarget:
+        db_key = str(external_db.id)
+        replicas = self.replicas_for(db_key)
+        for replica in replicas:
+            self._check(replica)
+
+        with self._lock:
+            eligible = [replica for replica in replicas if replica.healthy and replica.within_lag()]
+            if eligible:
+                fewest = min(replica.outstanding for replica in eligible)
+                target = random.choice([replica for replica in eligible if replica.outstanding == fewest])
+                target.outstanding += 1
+                return target
+
+        if replicas and self.is_strict(db_key):
+            raise ReplicaUnavailableError(f"No healthy read replica within the lag limit for external DB {db_key}.")
+        if replicas:
+            logger.warning(f"No eligible read replica for external DB {db_key}, reading from the primary.")
+        return ReadTarget(db_key, external_db.connection_string)
+
+    def release(self, target: ReadTarget, error: Optional[BaseException] = None) -> None:
+        if target.is_primary:
+            return
+        with self._lock:
+            target.outstanding -= 1
+            if error is not None and is_connection_error(error):
+                # Taken out of rotation until the next health check succeeds
+                target.healthy = False
+                target.last_error = str(error)
+                target.checked_at = time.monotonic()
+                logger.warning(f"Read replica {target.key} marked unhealthy: {str(error)}")
+
+    @contextmanager
+    def route(self, external_db):
+        """
+        Pick a read target for the duration of one query.
+        """
+        target = self.acquire(external_db)
+        try:
+            yield target
+        except BaseException as e:
+            self.release(target, e)
+            raise
+        else:
+            self.release(target)
+
+    def replicas_for(self, db_key: str) -> List[ReadTarget]:
+        with self._lock:
+            cached = self._replicas.get(db_key)
+            if cached and time.monotonic() - cached[0] < settings.REPLICA_LIST_TTL_SECONDS:
+                return cached[1]
+
+        replicas = self._load(db_key, cached[1] if cached else [])
+        with self._lock:
+            self._replicas[db_key] = (time.monotonic(), replicas)
+        return replicas
+
+    def invalidate(self, external_db_id) -> None:
+        with self._lock:
+            self._replicas.pop(str(external_db_id), None)
+
+    def status(self, external_db_id) -> List[dict]:
+        """
+        Health of every enabled replica of an external database, checking stale ones first.
+        """
+        replicas = self.replicas_for(str(external_db_id))
+        for replica in replicas:
+            self._check(replica)
+        return [
+            {
+                "replica_id": replica.replica_id,
+                "healthy": replica.healthy,
+                "lag_seconds": replica.lag_seconds,
+                "within_lag": replica.within_lag(),
+                "outstanding": replica.outstanding,
+                "last_error": replica.last_error,
+            }
+            for replica in replicas
+        ]
+
+    def is_strict(self, db_key: str) -> bool:
+        return settings.REPLICA_STRICT or db_key in settings.REPLICA_STRICT_DB_IDS
+
+    def _load(self, db_key: str, previous: List[ReadTarget]) -> List[ReadTarget]:
+        # Imported lazily: app.core.db pulls in every model at import time
+        from app.core.db import SessionLocal
+        from app.models.pre_processing import ExternalDBReplica
+
+        known = {(target.replica_id, target.encrypted_dsn): target for target in previous}
+        db = SessionLocal()
+        try:
+            rows = db.query(ExternalDBReplica).filter(
+                ExternalDBReplica.external_db_id == UUID(db_key),
+                ExternalDBReplica.enabled == True
+            ).all()
+        except Exception as e:
+            logger.warning(f"Failed to load read replicas for external DB {db_key}: {str(e)}")
+            return previous
+        finally:
+            db.close()
+
+        replicas = []
+        for row in rows:
+            # Keep health state and in-flight counts of replicas that did not change
+            target = known.get((str(row.id), row.connection_string))
+            if target is None:
+                target = ReadTarget(f"{db_key}:{row.id}", row.connection_string, str(row.id))
+            target.max_lag_seconds = row.max_lag_seconds
+            replicas.append(target)
+        return replicas
+
+    def _check(self, target: ReadTarget) -> None:
+        if time.monotonic() - target.checked_at < settings.REPLICA_HEALTH_CHECK_SECONDS:
+            return
+        if not target._check_lock.acquire(blocking=False):
+            return  # Another request is checking it; use the last known state
+        try:
+            engine = engine_registry.get_engine_for(target.key, target.encrypted_dsn)
+            with engine.connect() as connection:
+                target.lag_seconds = measure_lag(connection, engine.dialect.name)
+            target.healthy = True
+            target.last_error = None
+        except Exception as e:
+            target.healthy = False
+            target.last_error = str(e)
+            logger.warning(f"Health check failed for read replica {target.key}: {str(e)}")
+        finally:
+            target.checked_at = time.monotonic()
+            target._check_lock.release()
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """
+    Whether a failure points at the database being unreachable rather than at the query.
+    """
+    return isinstance(error, (OperationalError, InterfaceError)) and classify_error(error) != TIMEOUT
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,85 @@
+import json
+from typing import Dict, List, Optional
+from fastapi import HTTPException, status
+from fastapi.responses import Response
+from app.utils.serialization import dumps_json, json_default
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional
+    pa = None
+
+ROWS_JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.vizai.columnar+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+ROWS = "rows"
+COLUMNAR = "columnar"
+ARROW = "arrow"
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """
+    Pick the chart data format from an Accept header. Row-oriented JSON stays the default.
+    """
+    if not accept:
+        return ROWS
+    media_types = [part.split(";")[0].strip().lower() for part in accept.split(",")]
+    for media_type in media_types:
+        if media_type == ARROW_MEDIA_TYPE:
+            if pa is None:
+                raise HTTPException(
+                    status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                    detail="Arrow output is not available on this server (pyarrow is not installed)."
+                )
+            return ARROW
+        if media_type == COLUMNAR_JSON_MEDIA_TYPE:
+            return COLUMNAR
+    return ROWS
+
+
+def columnar_json_response(payload: dict) -> Response:
+    return Response(content=dumps_json(payload), media_type=COLUMNAR_JSON_MEDIA_TYPE)
+
+
+def arrow_response(columns: Dict[str, List], metadata: Optional[dict] = None) -> Response:
+    """
+    Encode a set of equally long columns as a single Arrow IPC stream.
+    Non-column fields (axes, chart type, ...) travel as JSON-encoded schema metadata.
+    """
+    arrays = {name: _to_arrow_array(values) for name, values in columns.items()}
+    encoded_metadata = {
+        key: json.dumps(value, default=json_default) for key, value in (metadata or {}).items()
+    }
+    table = pa.table(arrays, metadata=encoded_metadata)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(content=sink.getvalue().to_pybytes(), media_type=ARROW_MEDIA_TYPE)
+
+
+def dashboard_arrow_response(chart_data: dict) -> Response:
+    """
+    Flatten every chart of a dashboard into one long-format Arrow table (query_id, label, value);
+    per-chart axes and chart types travel in the schema metadata.
+    """
+    query_ids, labels, values, charts = [], [], [], []
+    for chart in chart_data["chart_data"]:
+        series = chart["result"]
+        query_ids.extend([chart["query_id"]] * len(series["label"]))
+        labels.extend(series["label"])
+        values.extend(series["value"])
+        charts.append({key: value for key, value in chart.items() if key != "result"})
+    return arrow_response(
+        {"query_id": query_ids, "label": labels, "value": values},
+        metadata={"dashboard_id": chart_data["dashboard_id"], "charts": charts}
+    )
+
+
+def _to_arrow_array(values: List):
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed value types in one column; fall back to their string form
+        return pa.array([None if value is None else str(value) for value in values], type=pa.string())
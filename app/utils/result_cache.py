@@ -0,0 +1,220 @@
+import hashlib
+import logging
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from app.core.settings import settings
+from app.utils.lru import TTLLRUCache
+
+logger = logging.getLogger("app")
+
+_QUOTED_OR_PLAIN = re.compile(r"('(?:''|[^'])*'|\"(?:\"\"|[^\"])*\")")
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Normalize SQL text so cosmetic differences (case, whitespace, trailing semicolons)
+    map to the same fingerprint. Quoted literals and identifiers are left untouched.
+    """
+    parts = _QUOTED_OR_PLAIN.split(query.strip().rstrip(";").strip())
+    normalized = []
+    for index, part in enumerate(parts):
+        if index % 2:
+            normalized.append(part)
+        else:
+            normalized.append(re.sub(r"\s+", " ", part.lower()))
+    return "".join(normalized).strip()
+
+
+def sql_fingerprint(query: str) -> str:
+    return hashlib.sha256(normalize_sql(query).encode("utf-8")).hexdigest()
+
+
+def _window_part(value) -> str:
+    if value is None:
+        return ""
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+class SQLiteCacheTier:
+    """
+    Shared cache tier backed by a SQLite file so every uvicorn worker on a host sees the
+    same entries. Failures are logged and treated as misses; this tier is best-effort.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_cache ("
+                " key TEXT PRIMARY KEY, external_db_id TEXT NOT NULL, fingerprint TEXT NOT NULL,"
+                " payload BLOB NOT NULL, size INTEGER NOT NULL, expires_at REAL NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_query_cache_db ON query_cache (external_db_id, fingerprint)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT payload, expires_at FROM query_cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                if row[1] <= time.time():
+                    conn.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+                    return None
+                return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Shared query cache read failed: {str(e)}")
+            return None
+
+    def set(self, key: str, external_db_id: str, fingerprint: str, payload: bytes, ttl: float) -> None:
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, external_db_id, fingerprint, payload, len(payload), now + ttl, now),
+                )
+                conn.execute("DELETE FROM query_cache WHERE expires_at <= ?", (now,))
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM query_cache").fetchone()[0]
+                if total > self.max_bytes:
+                    # Drop oldest entries until we are back under budget
+                    rows = conn.execute("SELECT key, size FROM query_cache ORDER BY created_at").fetchall()
+                    stale = []
+                    for stale_key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((stale_key,))
+                        total -= size
+                    conn.executemany("DELETE FROM query_cache WHERE key = ?", stale)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared query cache write failed: {str(e)}")
+
+    def delete(self, external_db_id: str, fingerprint: Optional[str] = None) -> None:
+        try:
+            with self._connect() as conn:
+                if fingerprint is None:
+                    conn.execute("DELETE FROM query_cache WHERE external_db_id = ?", (external_db_id,))
+                else:
+                    conn.execute(
+                        "DELETE FROM query_cache WHERE external_db_id = ? AND fingerprint = ?",
+                        (external_db_id, fingerprint),
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"Shared query cache invalidation failed: {str(e)}")
+
+
+class QueryResultCache:
+    """
+    Two-tier cache for external query results.
+
+    Entries are keyed by (external DB id, normalized SQL fingerprint, active date window).
+    The first tier is an in-process LRU; the optional second tier is a SQLite file shared
+    between workers. Values are pickled once to measure their size and for the shared tier.
+    """
+
+    def __init__(self):
+        self.enabled = settings.QUERY_CACHE_ENABLED
+        self.default_ttl = settings.QUERY_CACHE_TTL_SECONDS
+        self.max_entry_bytes = settings.QUERY_CACHE_MAX_ENTRY_BYTES
+        self.memory = TTLLRUCache(
+            max_entries=settings.QUERY_CACHE_MAX_ENTRIES,
+            max_bytes=settings.QUERY_CACHE_MAX_BYTES,
+        )
+        self.shared = (
+            SQLiteCacheTier(settings.QUERY_CACHE_SHARED_PATH, settings.QUERY_CACHE_SHARED_MAX_BYTES)
+            if settings.QUERY_CACHE_SHARED_PATH else None
+        )
+        self._counters = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "stores": 0, "oversized": 0}
+        self._counter_lock = threading.Lock()
+
+    def make_key(self, external_db, query: str) -> Tuple[str, str, str]:
+        window = f"{_window_part(external_db.min_date)}/{_window_part(external_db.max_date)}"
+        return str(external_db.id), sql_fingerprint(query), window
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.shared is not None:
+            payload = self.shared.get("|".join(key))
+            if payload is not None:
+                value = pickle.loads(payload)
+                self.memory.set(key, value, size=len(payload), ttl=self.default_ttl)
+                self._count("shared_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key: Tuple[str, str, str], value: Any, ttl: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        ttl = self.default_ttl if ttl is None else ttl
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_entry_bytes:
+            self._count("oversized")
+            return
+        self.memory.set(key, value, size=len(payload), ttl=ttl)
+        if self.shared is not None:
+            self.shared.set("|".join(key), key[0], key[1], payload, ttl)
+        self._count("stores")
+
+    def invalidate_db(self, external_db_id) -> None:
+        """
+        Drop every cached result for an external database (e.g. its connection changed).
+        """
+        db_key = str(external_db_id)
+        removed = self.memory.delete_where(lambda key: key[0] == db_key)
+        if self.shared is not None:
+            self.shared.delete(db_key)
+        logger.info(f"Invalidated {removed} cached results for external DB {db_key}.")
+
+    def invalidate_query(self, external_db_id, query: str) -> None:
+        """
+        Drop cached results of one SQL statement across all date windows.
+        """
+        db_key, fingerprint = str(external_db_id), sql_fingerprint(query)
+        self.memory.delete_where(lambda key: key[0] == db_key and key[1] == fingerprint)
+        if self.shared is not None:
+            self.shared.delete(db_key, fingerprint)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            counters = dict(self._counters)
+        lookups = counters["memory_hits"] + counters["shared_hits"] + counters["misses"]
+        counters.update({
+            "enabled": self.enabled,
+            "hit_ratio": (counters["memory_hits"] + counters["shared_hits"]) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.total_bytes,
+            "memory_evictions": self.memory.evictions,
+            "shared_tier": self.shared is not None,
+        })
+        return counters
+
+    def _count(self, name: str) -> None:
+        with self._counter_lock:
+            self._counters[name] += 1
+
+
+result_cache = QueryResultCache()
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.types import ARRAY
+
+logger = logging.getLogger("app")
+
+_PG_SCHEMAS = text(
+    "SELECT nspname FROM pg_namespace"
+    " WHERE nspname NOT IN ('pg_catalog', 'information_schema')"
+    " AND nspname NOT LIKE 'pg\\_toast%' AND nspname NOT LIKE 'pg\\_temp%'"
+    " ORDER BY nspname"
+)
+
+_PG_COLUMNS = (
+    "SELECT n.nspname, c.relname, a.attname, format_type(a.atttypid, a.atttypmod)"
+    " FROM pg_attribute a"
+    " JOIN pg_class c ON c.oid = a.attrelid"
+    " JOIN pg_namespace n ON n.oid = c.relnamespace"
+    " WHERE c.relkind IN ('r', 'p') AND NOT c.relispartition"
+    " AND a.attnum > 0 AND NOT a.attisdropped AND n.nspname IN :schemas"
+    "{table_filter}"
+    " ORDER BY n.nspname, c.relname, a.attnum"
+)
+
+_PG_PRIMARY_KEYS = (
+    "SELECT n.nspname, c.relname, con.conname, a.attname"
+    " FROM pg_constraint con"
+    " JOIN pg_class c ON c.oid = con.conrelid"
+    " JOIN pg_namespace n ON n.oid = c.relnamespace"
+    " JOIN LATERAL unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord) ON true"
+    " JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = k.attnum"
+    " WHERE con.contype = 'p' AND n.nspname IN :schemas"
+    "{table_filter}"
+    " ORDER BY n.nspname, c.relname, k.ord"
+)
+
+_PG_FOREIGN_KEYS = (
+    "SELECT n.nspname, c.relname, a.attname, rn.nspname, rc.relname"
+    " FROM pg_constraint con"
+    " JOIN pg_class c ON c.oid = con.conrelid"
+    " JOIN pg_namespace n ON n.oid = c.relnamespace"
+    " JOIN pg_class rc ON rc.oid = con.confrelid"
+    " JOIN pg_namespace rn ON rn.oid = rc.relnamespace"
+    " JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = con.conkey[1]"
+    " WHERE con.contype = 'f' AND n.nspname IN :schemas"
+    "{table_filter}"
+    " ORDER BY n.nspname, c.relname, con.conname"
+)
+
+_MYSQL_COLUMNS = (
+    "SELECT c.TABLE_SCHEMA, c.TABLE_NAME, c.COLUMN_NAME, c.COLUMN_TYPE"
+    " FROM information_schema.COLUMNS c"
+    " JOIN information_schema.TABLES t ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME"
+    " WHERE t.TABLE_TYPE = 'BASE TABLE' AND c.TABLE_SCHEMA IN :schemas"
+    "{table_filter}"
+    " ORDER BY c.TABLE_SCHEMA, c.TABLE_NAME, c.ORDINAL_POSITION"
+)
+
+_MYSQL_PRIMARY_KEYS = (
+    "SELECT c.TABLE_SCHEMA, c.TABLE_NAME, c.CONSTRAINT_NAME, c.COLUMN_NAME"
+    " FROM information_schema.KEY_COLUMN_USAGE c"
+    " WHERE c.CONSTRAINT_NAME = 'PRIMARY' AND c.TABLE_SCHEMA IN :schemas"
+    "{table_filter}"
+    " ORDER BY c.TABLE_SCHEMA, c.TABLE_NAME, c.ORDINAL_POSITION"
+)
+
+_MYSQL_FOREIGN_KEYS = (
+    "SELECT c.TABLE_SCHEMA, c.TABLE_NAME, c.COLUMN_NAME, c.REFERENCED_TABLE_SCHEMA, c.REFERENCED_TABLE_NAME"
+    " FROM information_schema.KEY_COLUMN_USAGE c"
+    " WHERE c.REFERENCED_TABLE_NAME IS NOT NULL AND c.ORDINAL_POSITION = 1 AND c.TABLE_SCHEMA IN :schemas"
+    "{table_filter}"
+    " ORDER BY c.TABLE_SCHEMA, c.TABLE_NAME, c.CONSTRAINT_NAME"
+)
+
+# One row per table: a hash of its columns, types and key constraints, computed on the server
+_PG_FINGERPRINTS = text(
+    "SELECT n.nspname, c.relname, md5("
+    " string_agg(a.attname || ':' || format_type(a.atttypid, a.atttypmod), ',' ORDER BY a.attnum)"
+    " || '|' || coalesce((SELECT string_agg(con.contype || ':' || pg_get_constraintdef(con.oid), ',' ORDER BY con.conname)"
+    " FROM pg_constraint con WHERE con.conrelid = c.oid AND con.contype IN ('p', 'f')), ''))"
+    " FROM pg_attribute a"
+    " JOIN pg_class c ON c.oid = a.attrelid"
+    " JOIN pg_namespace n ON n.oid = c.relnamespace"
+    " WHERE c.relkind IN ('r', 'p') AND NOT c.relispartition"
+    " AND a.attnum > 0 AND NOT a.attisdropped AND n.nspname IN :schemas"
+    " GROUP BY n.nspname, c.relname, c.oid"
+    " ORDER BY n.nspname, c.relname"
+).bindparams(bindparam("schemas", expanding=True))
+
+_MYSQL_FINGERPRINTS = text(
+    "SELECT c.TABLE_SCHEMA, c.TABLE_NAME, MD5(CONCAT("
+    " GROUP_CONCAT(CONCAT(c.COLUMN_NAME, ':', c.COLUMN_TYPE, ':', c.COLUMN_KEY) ORDER BY c.ORDINAL_POSITION SEPARATOR ','),"
+    " '|', COALESCE((SELECT GROUP_CONCAT(CONCAT(k.COLUMN_NAME, '>', k.REFERENCED_TABLE_SCHEMA, '.', k.REFERENCED_TABLE_NAME)"
+    " ORDER BY k.CONSTRAINT_NAME, k.ORDINAL_POSITION) FROM information_schema.KEY_COLUMN_USAGE k"
+    " WHERE k.TABLE_SCHEMA = c.TABLE_SCHEMA AND k.TABLE_NAME = c.TABLE_NAME AND k.REFERENCED_TABLE_NAME IS NOT NULL), '')))"
+    " FROM information_schema.COLUMNS c"
+    " JOIN information_schema.TABLES t ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME"
+    " WHERE t.TABLE_TYPE = 'BASE TABLE' AND c.TABLE_SCHEMA IN :schemas"
+    " GROUP BY c.TABLE_SCHEMA, c.TABLE_NAME"
+    " ORDER BY c.TABLE_SCHEMA, c.TABLE_NAME"
+).bindparams(bindparam("schemas", expanding=True))
+
+# format_type / COLUMN_TYPE output: name, optional arguments, trailing words, array brackets
+_CATALOG_TYPE = re.compile(r"^(?P<name>[^(\[]+?)\s*(?:\((?P<args>[^)]*)\)(?P<suffix>[^\[]*?))?\s*(?P<array>(?:\[\])*)$")
+
+# Per dialect: (list schemas, default schema, columns, primary keys, foreign keys, table filter, fingerprints).
+# Column and key queries are templates so they can be narrowed to a set of tables.
+_CATALOG_QUERIES = {
+    "postgresql": (
+        _PG_SCHEMAS, text("SELECT current_schema()"), _PG_COLUMNS, _PG_PRIMARY_KEYS, _PG_FOREIGN_KEYS,
+        " AND c.relname IN :tables", _PG_FINGERPRINTS,
+    ),
+    "mysql": (
+        None, text("SELECT DATABASE()"), _MYSQL_COLUMNS, _MYSQL_PRIMARY_KEYS, _MYSQL_FOREIGN_KEYS,
+        " AND c.TABLE_NAME IN :tables", _MYSQL_FINGERPRINTS,
+    ),
+}
+_CATALOG_QUERIES["mariadb"] = _CATALOG_QUERIES["mysql"]
+
+
+def _catalog_query(template: str, table_filter: str, tables: Optional[List[Tuple[str, str]]]):
+    if not tables:
+        return text(template.format(table_filter="")).bindparams(bindparam("schemas", expanding=True))
+    return text(template.format(table_filter=table_filter)).bindparams(
+        bindparam("schemas", expanding=True), bindparam("tables", expanding=True)
+    )
+
+
+def qualified_name(schema: Optional[str], table: str, default_schema: Optional[str]) -> str:
+    """
+    Tables of the default schema keep their bare name; others are reported as schema.table.
+    """
+    return table if not schema or schema == default_schema else f"{schema}.{table}"
+
+
+def catalog_type_name(dialect, raw: str) -> str:
+    """
+    A catalog type name (PostgreSQL format_type, MySQL COLUMN_TYPE) spelled as str() of the SQLAlchemy
+    type the Inspector reflects it to, so both introspection paths describe columns alike.
+    Types the dialect does not know (domains, user-defined enums) keep their catalog name.
+    """
+    match = _CATALOG_TYPE.match(raw.strip())
+    if not match:
+        return raw
+    # Longest known prefix: "timestamp with time zone", but "int" of "int unsigned"
+    words = f"{match['name']} {match['suffix'] or ''}".lower().split()
+    type_class = next(
+        (dialect.ischema_names[name] for name in (" ".join(words[:n]) for n in range(len(words), 0, -1)) if name in dialect.ischema_names),
+        None,
+    )
+    if type_class is None:
+        return raw
+
+    args = [arg.strip() for arg in (match["args"] or "").split(",") if arg.strip()]
+    try:
+        # Lengths and precisions; ENUM/SET value lists are not part of str() anyway
+        type_ = type_class(*(int(arg) for arg in args))
+    except (TypeError, ValueError):
+        type_ = type_class()
+    if match["array"]:
+        type_ = ARRAY(type_)
+    return str(type_)
+
+
+def resolve_schemas(connection, schemas: Optional[List[str]] = None) -> List[Optional[str]]:
+    """
+    The schemas introspect_tables would cover for `schemas`, so they can be split across connections.
+    None stands for the connection's default schema.
+    """
+    if schemas:
+        return list(schemas)
+    queries = _CATALOG_QUERIES.get(connection.dialect.name)
+    if queries is None:
+        return [None]
+    list_schemas, current_schema = queries[0], queries[1]
+    if list_schemas is None:
+        return [connection.execute(current_schema).scalar()]
+    return [row[0] for row in connection.execute(list_schemas)]
+
+
+def introspect_tables(connection, schemas: Optional[List[str]] = None, tables: Optional[List[Tuple[Optional[str], str]]] = None) -> List[dict]:
+    """
+    Read columns, primary keys and foreign keys of every table in `schemas` and return them in
+    the schema_info["tables"] layout. `tables` narrows the read to those (schema, table) pairs.
+
+    PostgreSQL and MySQL are read with three catalog queries in total, whatever the table count.
+    Other dialects go through SQLAlchemy's multi-table Inspector API, one schema at a time.
+    With no `schemas`, PostgreSQL covers every non-system schema and MySQL the connected database,
+    on either path. Column types are reported as str() of the reflected SQLAlchemy type.
+    """
+    queries = _CATALOG_QUERIES.get(connection.dialect.name)
+    if queries is None:
+        return _inspect_tables(connection, schemas, tables)
+    try:
+        return _read_catalog(connection, queries, schemas, tables)
+    except Exception as e:
+        # e.g. catalog columns missing on old server versions
+        logger.warning(f"Bulk catalog introspection failed, falling back to the Inspector: {str(e)}")
+        connection.rollback()
+        return _inspect_tables(connection, schemas, tables)
+
+
+def _read_catalog(connection, queries: tuple, schemas: Optional[List[str]], only: Optional[List[Tuple[str, str]]]) -> List[dict]:
+    list_schemas, current_schema, columns_sql, pk_sql, fk_sql, table_filter, _ = queries
+    default_schema = connection.execute(current_schema).scalar()
+    if not schemas:
+        schemas = [row[0] for row in connection.execute(list_schemas)] if list_schemas is not None else [default_schema]
+
+    params = {"schemas": schemas}
+    wanted = None
+    if only:
+        wanted = {(schema or default_schema, table) for schema, table in only}
+        params["tables"] = sorted({table for _, table in wanted})
+
+    tables: Dict[Tuple[str, str], dict] = {}
+    for schema, table, column, column_type in connection.execute(_catalog_query(columns_sql, table_filter, only), params):
+        if wanted is not None and (schema, table) not in wanted:
+            continue  # Same table name in another schema
+        entry = tables.get((schema, table))
+        if entry is None:
+            entry = tables[(schema, table)] = {
+                "name": qualified_name(schema, table, default_schema),
+                "columns": [],
+                "primary_keys": {"constrained_columns": [], "name": None},
+                "foreign_keys": [],
+            }
+        entry["columns"].append({"name": column, "type": catalog_type_name(connection.dialect, column_type)})
+
+    for schema, table, constraint, column in connection.execute(_catalog_query(pk_sql, table_filter, only), params):
+        entry = tables.get((schema, table))
+        if entry is not None:
+            entry["primary_keys"]["name"] = constraint
+            entry["primary_keys"]["constrained_columns"].append(column)
+
+    for schema, table, column, referred_schema, referred_table in connection.execute(_catalog_query(fk_sql, table_filter, only), params):
+        entry = tables.get((schema, table))
+        if entry is not None:
+            entry["foreign_keys"].append({
+                "column": column,
+                "references": qualified_name(referred_schema, referred_table, default_schema),
+            })
+
+    logger.info(f"Introspected {len(tables)} tables across {len(schemas)} schema(s) from the catalog.")
+    return list(tables.values())
+
+
+def table_fingerprints(connection, schemas: List[Optional[str]]) -> Optional[Dict[str, Tuple[str, str, str]]]:
+    """
+    Cheap per-table fingerprints (hash of columns, types and key constraints) computed by the
+    server in one query, keyed by qualified table name as (schema, table, fingerprint).
+    None for dialects without a catalog fingerprint query.
+    """
+    queries = _CATALOG_QUERIES.get(connection.dialect.name)
+    if queries is None:
+        return None
+    default_schema = connection.execute(queries[1]).scalar()
+    schemas = [schema or default_schema for schema in schemas]
+    if connection.dialect.name in ("mysql", "mariadb"):
+        # GROUP_CONCAT silently truncates at 1024 bytes by default
+        connection.execute(text("SET SESSION group_concat_max_len = 1048576"))
+    return {
+        qualified_name(schema, table, default_schema): (schema, table, fingerprint)
+        for schema, table, fingerprint in connection.execute(queries[6], {"schemas": schemas})
+    }
+
+
+def structure_fingerprint(table: dict) -> str:
+    """
+    Fingerprint of an already introspected table, for dialects without a catalog fingerprint query.
+    """
+    return hashlib.sha256(json.dumps(table, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def diff_fingerprints(old: Dict[str, str], new: Dict[str, str]) -> Dict[str, List[str]]:
+    return {
+        "added": sorted(new.keys() - old.keys()),
+        "removed": sorted(old.keys() - new.keys()),
+        "changed": sorted(name for name in new.keys() & old.keys() if new[name] != old[name]),
+    }
+
+
+def _inspect_tables(connection, schemas: Optional[List[str]], only: Optional[List[Tuple[Optional[str], str]]] = None) -> List[dict]:
+    inspector = inspect(connection)
+    default_schema = inspector.default_schema_name
+    wanted = {(schema or default_schema, table) for schema, table in only} if only else None
+    names = sorted({table for _, table in only}) if only else None
+    if not schemas and only:
+        schemas = list({schema for schema, _ in wanted})
+    elif not schemas and connection.dialect.name == "postgresql":
+        # Same coverage as the catalog path: every non-system schema
+        schemas = [
+            schema for schema in inspector.get_schema_names()
+            if schema != "information_schema" and not schema.startswith("pg_")
+        ]
+    tables = []
+    for schema in schemas or [None]:
+        columns = inspector.get_multi_columns(schema=schema, filter_names=names)
+        primary_keys = inspector.get_multi_pk_constraint(schema=schema, filter_names=names)
+        foreign_keys = inspector.get_multi_foreign_keys(schema=schema, filter_names=names)
+        for key, table_columns in columns.items():
+            table_schema, table = key
+            if wanted is not None and (table_schema or default_schema, table) not in wanted:
+                continue
+            tables.append({
+                "name": qualified_name(table_schema, table, default_schema),
+                "columns": [{"name": col["name"], "type": str(col["type"])} for col in table_columns],
+                "primary_keys": primary_keys.get(key, {"constrained_columns": [], "name": None}),
+                "foreign_keys": [
+                    {
+                        "column": fk["constrained_columns"][0],
+                        "references": qualified_name(fk.get("referred_schema"), fk["referred_table"], default_schema),
+                    }
+                    for fk in foreign_keys.get(key, [])
+                ],
+            })
+    return tables
@@ -0,0 +1,185 @@
+import json
+import math
+import re
+from collections import Counter, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.core.settings import settings
+from app.utils.lru import TTLLRUCache
+
+_WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+# Field weights: a hit on the table name counts more than on one of its columns
+_NAME_WEIGHT = 3
+_COLUMN_WEIGHT = 1
+_NEIGHBOR_WEIGHT = 1
+_HINT_WEIGHT = 1
+
+_K1 = 1.2
+_B = 0.75
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "by", "each", "for", "from", "get", "how", "in", "is", "list", "many",
+    "me", "much", "of", "on", "or", "per", "show", "the", "to", "what", "which", "who", "with",
+}
+
+
+def tokenize(value: str) -> List[str]:
+    """
+    Split identifiers and prose alike: snake_case, camelCase and dotted names become lowercase words,
+    with a naive plural strip so "orders" matches "order".
+    """
+    tokens = []
+    for word in _WORD.findall(value or ""):
+        word = word.lower()
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def estimate_tokens(value: str) -> int:
+    # Roughly four characters per token for JSON-ish text
+    return len(value) // 4 + 1
+
+
+def compact_json(value) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+class SchemaIndex:
+    """
+    BM25 index over the tables of one external database.
+
+    Each table is a document made of its own name, its column names, the names of the tables it
+    is joined to by foreign keys and the explanations of past queries that read it. The foreign
+    key graph is kept to connect the selected tables with their join paths.
+    """
+
+    def __init__(self, tables: List[dict], query_hints: Iterable[Tuple[str, str]] = ()):
+        self.tables = {table["name"]: table for table in tables}
+        self.graph: Dict[str, set] = {name: set() for name in self.tables}
+        for table in tables:
+            for foreign_key in table.get("foreign_keys", []):
+                referenced = foreign_key.get("references")
+                if referenced in self.graph and referenced != table["name"]:
+                    self.graph[table["name"]].add(referenced)
+                    self.graph[referenced].add(table["name"])
+
+        hints = self._attribute_hints(query_hints)
+        self.documents: Dict[str, Counter] = {}
+        for name, table in self.tables.items():
+            terms = Counter()
+            for token in tokenize(name):
+                terms[token] += _NAME_WEIGHT
+            for column in table.get("columns", []):
+                for token in tokenize(column["name"]):
+                    terms[token] += _COLUMN_WEIGHT
+            for neighbor in self.graph[name]:
+                for token in tokenize(neighbor):
+                    terms[token] += _NEIGHBOR_WEIGHT
+            for token in hints.get(name, []):
+                terms[token] += _HINT_WEIGHT
+            self.documents[name] = terms
+
+        self.lengths = {name: sum(terms.values()) for name, terms in self.documents.items()}
+        self.average_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0.0
+        frequencies = Counter(token for terms in self.documents.values() for token in terms)
+        count = len(self.documents)
+        self.idf = {
+            token: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for token, frequency in frequencies.items()
+        }
+
+    def _attribute_hints(self, query_hints: Iterable[Tuple[str, str]]) -> Dict[str, List[str]]:
+        # A past query's explanation describes every table its SQL mentions
+        names = {}
+        for name in self.tables:
+            names[name.lower()] = name
+            names[name.split(".")[-1].lower()] = name
+        hints: Dict[str, List[str]] = {}
+        for sql, explanation in query_hints:
+            words = set(re.findall(r"[A-Za-z_][A-Za-z0-9_.]*", sql or ""))
+            tokens = tokenize(explanation)
+            for word in words:
+                name = names.get(word.lower())
+                if name is not None:
+                    hints.setdefault(name, []).extend(tokens)
+        return hints
+
+    def score(self, question: str) -> List[Tuple[str, float]]:
+        """
+        Tables ranked by BM25 score against the question, best first; tables with no match are left out.
+        """
+        terms = set(tokenize(question))
+        scores = []
+        for name, document in self.documents.items():
+            norm = _K1 * (1 - _B + _B * self.lengths[name] / self.average_length) if self.average_length else _K1
+            score = 0.0
+            for term in terms:
+                frequency = document.get(term)
+                if frequency:
+                    score += self.idf[term] * frequency * (_K1 + 1) / (frequency + norm)
+            if score > 0:
+                scores.append((name, score))
+        scores.sort(key=lambda item: (-item[1], item[0]))
+        return scores
+
+    def join_path(self, source: str, target: str) -> Optional[List[str]]:
+        """
+        Shortest chain of foreign-key joins from `source` to `target`, both included.
+        """
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            if current == target:
+                path = []
+                while current is not None:
+                    path.append(current)
+                    current = previous[current]
+                return path[::-1]
+            for neighbor in sorted(self.graph[current]):
+                if neighbor not in previous:
+                    previous[neighbor] = current
+                    queue.append(neighbor)
+        return None
+
+    def select(self, question: str, top_k: int) -> List[str]:
+        """
+        The `top_k` best matching tables followed by the tables needed to join them to the best one.
+        """
+        ranked = [name for name, _ in self.score(question)[:top_k]]
+        if not ranked:
+            return []
+        selected = list(ranked)
+        anchor = ranked[0]
+        for name in ranked[1:]:
+            for step in self.join_path(anchor, name) or []:
+                if step not in selected:
+                    selected.append(step)
+        return selected
+
+
+def prune_schema(schema_info: dict, index: SchemaIndex, question: str, top_k: int, token_budget: int) -> dict:
+    """
+    Reduce schema_info to the tables relevant to `question`, in relevance order, within the token budget.
+    Falls back to every table (still within the budget) when nothing in the question matches.
+    """
+    names = index.select(question, top_k) or list(index.tables)
+    pruned = {key: value for key, value in schema_info.items() if key != "tables"}
+    pruned["tables"] = []
+    used = estimate_tokens(compact_json(pruned))
+    for name in names:
+        table = index.tables[name]
+        cost = estimate_tokens(compact_json(table))
+        if token_budget and pruned["tables"] and used + cost > token_budget:
+            break
+        pruned["tables"].append(table)
+        used += cost
+    return pruned
+
+
+# Keyed by (external_db_id, schema hash); expiry is what picks up new query hints
+schema_index_cache = TTLLRUCache(max_entries=settings.NLQ_SCHEMA_INDEX_CACHE_ENTRIES, default_ttl=settings.NLQ_SCHEMA_HINTS_TTL_SECONDS)
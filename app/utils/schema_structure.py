@@ -1,35 +1,122 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
 from sqlalchemy import create_engine, text, inspect
 from sqlalchemy.orm import sessionmaker
 from app.models.pre_processing import ExternalDBModel
 from datetime import datetime, timedelta
-from app.utils.crypt import decrypt_string
+from app.core.settings import settings
+from app.utils.engine_registry import engine_registry
+from app.utils.date_profiler import overall_range, profile_date_ranges
+from app.utils.schema_introspection import (
+    diff_fingerprints, introspect_tables, resolve_schemas, structure_fingerprint, table_fingerprints
+)
 
-def get_schema_structure(connection_string: str, db_type: str):
+logger = logging.getLogger("app")
+
+# Introspections run here instead of on the event loop; each may fan out over catalog_executor
+introspection_executor = ThreadPoolExecutor(max_workers=settings.INTROSPECTION_MAX_WORKERS, thread_name_prefix="introspection")
+catalog_executor = ThreadPoolExecutor(
+    max_workers=settings.INTROSPECTION_MAX_WORKERS * settings.INTROSPECTION_PARALLELISM,
+    thread_name_prefix="catalog"
+)
+
+def get_schema_structure(connection_string: str, db_type: str, schemas: Optional[List[str]] = None, progress: Optional[Callable[..., None]] = None):
+    """
+    Introspect an external database into schema_info. See build_schema_structure.
+    """
+    return build_schema_structure(connection_string, db_type, schemas, progress)[0]
+
+
+def build_schema_structure(
+    connection_string: str,
+    db_type: str,
+    schemas: Optional[List[str]] = None,
+    progress: Optional[Callable[..., None]] = None,
+    previous: Optional[Tuple[dict, Dict[str, str]]] = None,
+):
+    """
+    Introspect an external database into schema_info. When several schemas are covered they are
+    split into up to INTROSPECTION_PARALLELISM groups, each read on its own connection.
+
+    Real min/max dates are profiled from the data (see profile_date_ranges) and returned per
+    column under schema_info["date_ranges"]; today minus DATE_PROFILE_DEFAULT_DAYS is the fallback.
+
+    On PostgreSQL and MySQL a fingerprint of every table is read first. Given the `previous`
+    (schema_info, fingerprints) pair, only added and changed tables are introspected again and
+    the rest is reused as is.
+
+    :param progress: Called as progress(done, total, stage) with the number of schemas (or tables) read so far.
+    :return: (schema_info, fingerprints, diff); fingerprints and diff are None if introspection failed.
+    """
     engine = create_engine(connection_string)
-    inspector = inspect(engine)
+    report = progress or (lambda done, total, stage: None)
 
     schema_info = {"tables": []}
+    fingerprints = None
+    diff = None
+    retry = []
     max_date = datetime.now().date()
-    min_date = max_date - timedelta(days=183) 
+    min_date = max_date - timedelta(days=settings.DATE_PROFILE_DEFAULT_DAYS)
     try:
         with engine.connect() as connection:
-            for table_name in inspector.get_table_names():
-                columns = inspector.get_columns(table_name)
-                primary_keys = inspector.get_pk_constraint(table_name)
-                foreign_keys = [
-                    {"column": fk["constrained_columns"][0], "references": fk["referred_table"]}
-                    for fk in inspector.get_foreign_keys(table_name)
-                ]
-
-                schema_info["tables"].append({
-                    "name": table_name,
-                    "columns": [
-                        {"name": col["name"], "type": str(col["type"])}
-                        for col in columns
-                    ],
-                    "primary_keys": primary_keys,
-                    "foreign_keys": foreign_keys
-                })
+            schema_names = resolve_schemas(connection, schemas or settings.SCHEMA_INTROSPECTION_SCHEMAS)
+            catalog = None
+            try:
+                catalog = table_fingerprints(connection, schema_names)
+            except Exception as e:
+                logger.warning(f"Table fingerprints unavailable, introspecting every table: {str(e)}")
+                connection.rollback()
+
+            if catalog is not None and previous:
+                known = {table["name"]: table for table in previous[0].get("tables", [])}
+                stale = [name for name, (_, _, fingerprint) in catalog.items() if name not in known or previous[1].get(name) != fingerprint]
+                report(0, len(stale), "introspecting changed tables")
+                fresh = {}
+                if stale:
+                    fresh = {
+                        table["name"]: table
+                        for table in introspect_tables(connection, schema_names, [catalog[name][:2] for name in stale])
+                    }
+                retry = [name for name in stale if name not in fresh and name in known]
+                if retry:
+                    logger.warning(f"Re-introspection failed for {len(retry)} changed tables, keeping their previous definition: {retry}")
+                schema_info["tables"] = [fresh.get(name) or known[name] for name in catalog if name in fresh or name in known]
+                report(len(stale), len(stale), "introspected")
+            else:
+                report(0, len(schema_names), "introspecting")
+                groups = [group for group in (schema_names[i::settings.INTROSPECTION_PARALLELISM] for i in range(settings.INTROSPECTION_PARALLELISM)) if group]
+                if len(groups) <= 1:
+                    schema_info["tables"] = introspect_tables(connection, schema_names)
+                else:
+                    futures = [catalog_executor.submit(_introspect_group, engine, group) for group in groups]
+                    done = 0
+                    for future in as_completed(futures):
+                        done += len(groups[futures.index(future)])
+                        report(done, len(schema_names), "introspecting")
+                    schema_info["tables"] = [table for future in futures for table in future.result()]
+                report(len(schema_names), len(schema_names), "introspected")
+
+        if catalog is not None:
+            fingerprints = {table["name"]: catalog[table["name"]][2] for table in schema_info["tables"] if table["name"] in catalog}
+            # A stale definition keeps its previous fingerprint (or none), so the next refresh retries the table
+            for name in retry:
+                if name in previous[1]:
+                    fingerprints[name] = previous[1][name]
+                else:
+                    fingerprints.pop(name, None)
+        else:
+            fingerprints = {table["name"]: structure_fingerprint(table) for table in schema_info["tables"]}
+        diff = diff_fingerprints(previous[1] if previous else {}, fingerprints)
+
+        if settings.DATE_PROFILE_ENABLED:
+            report(0, None, "profiling date ranges")
+            schema_info["date_ranges"] = profile_date_ranges(engine, schema_info["tables"], catalog_executor)
+            profiled = overall_range(schema_info["date_ranges"])
+            if profiled:
+                min_date, max_date = profiled[0].date(), profiled[1].date()
 
         schema_info["min_date"] = min_date.isoformat()
         schema_info["max_date"] = max_date.isoformat()
@@ -39,18 +126,48 @@ def get_schema_structure(connection_string: str, db_type: str):
         print(f"Error fetching schema information: {e}. Returning schema info with default date range.")
         schema_info["min_date"] = None
         schema_info["max_date"] = None
+        fingerprints = None
+        diff = None
+    finally:
+        engine.dispose()
+
+    return schema_info, fingerprints, diff
+
 
-    return schema_info
+def _introspect_group(engine, schemas: List[Optional[str]]) -> List[dict]:
+    with engine.connect() as connection:
+        return introspect_tables(connection, schemas)
 
 
-def get_external_db_session(external_db: ExternalDBModel):
+async def build_schema_structure_async(
+    connection_string: str,
+    db_type: str,
+    progress: Optional[Callable[..., None]] = None,
+    previous: Optional[Tuple[dict, Dict[str, str]]] = None,
+):
     """
-    Creates a dynamic session for an external database.
+    Run build_schema_structure on the bounded introspection pool, keeping the event loop free.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        introspection_executor,
+        partial(build_schema_structure, connection_string, db_type, progress=progress, previous=previous)
+    )
+
+
+def get_external_db_session(external_db: ExternalDBModel, target=None):
+    """
+    Creates a session for an external database on its pooled engine.
+
+    The engine is owned by the engine registry and must not be disposed by the caller.
 
     :param external_db: ExternalDBModel instance containing the DB connection string.
+    :param target: Optional ReadTarget (see replica_router) to connect to instead of the primary.
     :return: SQLAlchemy session and engine
     """
-    decrypt_conn_string = decrypt_string(external_db.connection_string)
-    engine = create_engine(decrypt_conn_string)
+    if target is not None:
+        engine = engine_registry.get_engine_for(target.key, target.encrypted_dsn)
+    else:
+        engine = engine_registry.get_engine(external_db)
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     return SessionLocal(), engine  # Return session and engine
@@ -0,0 +1,46 @@
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Optional
+from uuid import UUID
+
+
+def json_default(value):
+    """
+    `default` hook for json.dumps covering the value types external databases return.
+    Mirrors what FastAPI's jsonable_encoder produces for the same values; bytes are decoded as
+    UTF-8 text like there, with undecodable bytes replaced instead of failing the response.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode("utf-8", errors="replace")
+    return str(value)
+
+
+def dumps_line(payload) -> bytes:
+    """
+    Serialize one NDJSON line.
+    """
+    return json.dumps(payload, default=json_default, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def dumps_event(payload, event: Optional[str] = None) -> bytes:
+    """
+    Serialize one server-sent event carrying a JSON payload.
+    """
+    data = json.dumps(payload, default=json_default, separators=(",", ":"))
+    return (f"event: {event}\n" if event else "").encode("utf-8") + f"data: {data}\n\n".encode("utf-8")
+
+
+def dumps_json(payload) -> bytes:
+    """
+    Serialize a response body directly, skipping FastAPI's per-value jsonable_encoder pass.
+    """
+    return json.dumps(payload, default=json_default, separators=(",", ":")).encode("utf-8")
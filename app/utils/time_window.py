@@ -0,0 +1,250 @@
+import logging
+import re
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import SqlglotError
+except ImportError:  # Without sqlglot every time window is rebound by the LLM service
+    sqlglot = None
+
+logger = logging.getLogger("app")
+
+# database_provider values mapped to sqlglot dialects
+_DIALECTS = {
+    "postgres": "postgres",
+    "postgresql": "postgres",
+    "mysql": "mysql",
+    "mariadb": "mysql",
+    "sqlite": "sqlite",
+    "mssql": "tsql",
+}
+
+_DATE_LITERAL = re.compile(r"^\d{4}-\d{2}-\d{2}(?P<sep>[ T])?(\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$")
+
+LOWER = "lower"
+UPPER = "upper"
+
+
+def parse_bound(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.strip())
+    return parsed.replace(tzinfo=None)
+
+
+def window_edges(min_date: str, max_date: str) -> Tuple[datetime, datetime]:
+    """
+    The dashboard range [min_date, max_date] as a half-open interval [start, stop).
+    A date-only max_date includes that whole day.
+    """
+    start = parse_bound(min_date)
+    stop = parse_bound(max_date)
+    if len(max_date.strip()) == 10:
+        stop += timedelta(days=1)
+    return start, stop
+
+
+def rewrite_time_window(query: str, db_type: str, min_date: str, max_date: str, time_columns: Optional[Iterable[str]] = None) -> Optional[Tuple[str, Dict[str, str]]]:
+    """
+    Rebind the date bounds of a time-based query to the dashboard range without the LLM service.
+
+    Handles `column BETWEEN a AND b` and `column >, >=, <, <= literal` (either way round, the literal
+    optionally cast, and the column optionally wrapped in a function such as DATE()) on the given time
+    columns, or on any column when none are known. Every rebound predicate has to describe the same
+    window: queries comparing periods keep distinct bounds and are left to the LLM service. The new
+    dates are spliced into the original text, so the rest of the query is left exactly as it was.
+
+    :return: The rewritten query and the replaced literal values {old: new}, or None when the query
+        has date literals this cannot rebind and has to go to the LLM service.
+    """
+    try:
+        start, stop = window_edges(min_date, max_date)
+    except ValueError:
+        return None
+    found = _window_bounds(query, db_type, time_columns)
+    if found is None:
+        return None
+    _, bounds = found
+
+    edits: Dict[int, Tuple[int, str, str]] = {}  # literal start offset -> (end offset, old value, new value)
+    for literal, side, inclusive in bounds:
+        edits[literal.meta["start"]] = (literal.meta["end"], literal.this, _bound_literal(literal.this, side, inclusive, start, stop))
+    rewritten = _splice(query, edits)
+    if rewritten is None:
+        return None
+
+    replaced: Dict[str, str] = {}
+    for _, old, new in edits.values():
+        # Old values rebound to different dates are not unambiguous in free text
+        replaced[old] = new if replaced.get(old, new) == new else None
+    return rewritten, {old: new for old, new in replaced.items() if new is not None}
+
+
+def raise_lower_bound(query: str, db_type: str, since: Union[date, datetime], time_columns: Optional[Iterable[str]] = None) -> Optional[str]:
+    """
+    Narrow a time-based query to rows at or after `since` by raising its lower date bounds in place,
+    so the predicate stays on the base time column (and its index) rather than on the output buckets.
+    Upper bounds are left as they are; bounds already past `since` are kept.
+
+    :return: The narrowed query, or None when it has no lower bound to raise, compares several
+        windows, or has a LIMIT/OFFSET or window function, whose result a partial read would change.
+    """
+    if not isinstance(since, datetime):
+        since = datetime(since.year, since.month, since.day)
+    found = _window_bounds(query, db_type, time_columns)
+    if found is None:
+        return None
+    tree, bounds = found
+    if tree.find(exp.Limit, exp.Offset, exp.Fetch, exp.Window):
+        return None
+    lower = [(literal, inclusive) for literal, side, inclusive in bounds if side == LOWER]
+    if not lower:
+        return None
+    if _window_edge(lower[0][0].this, LOWER, lower[0][1]) >= since:
+        return query  # The window starts after `since` already
+
+    edits = {
+        literal.meta["start"]: (literal.meta["end"], literal.this, _bound_literal(literal.this, LOWER, inclusive, since, since))
+        for literal, inclusive in lower
+    }
+    return _splice(query, edits)
+
+
+def _window_bounds(query: str, db_type: str, time_columns: Optional[Iterable[str]]) -> Optional[Tuple["exp.Expression", List[Tuple["exp.Literal", str, bool]]]]:
+    """
+    The parsed query and its date bounds as (literal, side, inclusive), or None when it has no
+    bounds, bounds describing more than one window, or date literals that are not bounds.
+    """
+    if sqlglot is None:
+        return None
+    try:
+        tree = sqlglot.parse_one(query, read=_DIALECTS.get((db_type or "").lower()))
+    except (ValueError, SqlglotError):
+        return None
+    columns = {column.lower() for column in time_columns or []}
+
+    bounds = []
+    edges = {LOWER: set(), UPPER: set()}  # Original window edges, as half-open interval bounds
+    for predicate in tree.find_all(exp.Between, exp.GT, exp.GTE, exp.LT, exp.LTE):
+        for literal, side, inclusive in _predicate_bounds(predicate, columns):
+            if "start" not in literal.meta or "end" not in literal.meta:
+                return None
+            bounds.append((literal, side, inclusive))
+            edges[side].add(_window_edge(literal.this, side, inclusive))
+
+    # Several windows (e.g. comparing 2023 with 2024) cannot all become one range
+    if len(edges[LOWER]) > 1 or len(edges[UPPER]) > 1:
+        return None
+
+    # Any other date literal (equality, IN lists, ...) would keep the old window
+    offsets = {literal.meta["start"] for literal, _, _ in bounds}
+    dated = [
+        literal for literal in tree.find_all(exp.Literal)
+        if literal.is_string and _DATE_LITERAL.match(literal.this) and literal.meta.get("start") not in offsets
+    ]
+    if not bounds or dated:
+        return None
+    return tree, bounds
+
+
+def _splice(query: str, edits: Dict[int, Tuple[int, str, str]]) -> Optional[str]:
+    # New literal values written over the old ones, back to front so offsets stay valid
+    rewritten = query
+    for offset in sorted(edits, reverse=True):
+        end, old, new = edits[offset]
+        quoted = rewritten[offset:end + 1]
+        if len(quoted) < 2 or quoted[0] not in "'\"" or quoted[-1] != quoted[0] or quoted[1:-1] != old:
+            return None
+        rewritten = rewritten[:offset] + quoted[0] + new + quoted[0] + rewritten[end + 1:]
+    return rewritten
+
+
+def rebind_text(text: Optional[str], replaced: Dict[str, str]) -> Optional[str]:
+    """
+    Apply the replaced date values to free text such as a query's explanation.
+    """
+    if not text or not replaced:
+        return text
+    # One pass, so a new value that equals another old value is not replaced again
+    pattern = re.compile("|".join(re.escape(old) for old in sorted(replaced, key=len, reverse=True)))
+    return pattern.sub(lambda match: replaced[match.group(0)], text)
+
+
+def _predicate_bounds(predicate, columns: set) -> List[Tuple["exp.Literal", str, bool]]:
+    if isinstance(predicate, exp.Between):
+        if not _is_time_column(predicate.this, columns):
+            return []
+        low = _date_literal(predicate.args.get("low"))
+        high = _date_literal(predicate.args.get("high"))
+        if low is None or high is None:
+            return []
+        return [(low, LOWER, True), (high, UPPER, True)]
+
+    inclusive = isinstance(predicate, (exp.GTE, exp.LTE))
+    side = LOWER if isinstance(predicate, (exp.GT, exp.GTE)) else UPPER
+    left, right = predicate.this, predicate.expression
+    if _is_time_column(left, columns):
+        literal = _date_literal(right)
+    elif _is_time_column(right, columns):
+        literal = _date_literal(left)
+        side = UPPER if side == LOWER else LOWER
+    else:
+        return []
+    return [(literal, side, inclusive)] if literal is not None else []
+
+
+def _is_time_column(node, columns: set) -> bool:
+    # A column, or a single column wrapped in functions (DATE(created_at), DATE_TRUNC('day', created_at))
+    if node is None or node.find(exp.Subquery, exp.Select):
+        return False
+    found = list(node.find_all(exp.Column))
+    return len(found) == 1 and (not columns or found[0].name.lower() in columns)
+
+
+def _date_literal(node) -> Optional["exp.Literal"]:
+    # A single ISO date string, possibly cast or wrapped in DATE(...); no arithmetic around it
+    if node is None:
+        return None
+    nodes = list(node.walk())
+    if any(isinstance(child, (exp.Column, exp.Binary, exp.Interval, exp.Subquery, exp.Select)) for child in nodes):
+        return None
+    literals = [child for child in nodes if isinstance(child, exp.Literal)]
+    if len(literals) != 1 or not literals[0].is_string or not _DATE_LITERAL.match(literals[0].this):
+        return None
+    return literals[0]
+
+
+def _window_edge(old: str, side: str, inclusive: bool) -> datetime:
+    """
+    The edge of the half-open interval [start, stop) a bound describes, so that e.g. `>= '2024-01-01'`
+    and `> '2023-12-31'` compare equal.
+    """
+    value = parse_bound(old)
+    step = timedelta(days=1) if _DATE_LITERAL.match(old).group("sep") is None else timedelta(seconds=1)
+    if (side == LOWER) != inclusive:
+        value += step
+    return value
+
+
+def _bound_literal(old: str, side: str, inclusive: bool, start: datetime, stop: datetime) -> str:
+    """
+    The new value for a bound, in the same shape as the literal it replaces: whole days for date
+    literals, seconds for timestamps. Inclusive upper and exclusive lower bounds step back one unit.
+    """
+    match = _DATE_LITERAL.match(old)
+    if match.group("sep") is None:
+        first = start.date()
+        after = stop.date() if stop.time() == time.min else stop.date() + timedelta(days=1)
+        step = timedelta(days=1)
+    else:
+        first, after, step = start, stop, timedelta(seconds=1)
+
+    if side == LOWER:
+        value = first if inclusive else first - step
+    else:
+        value = after - step if inclusive else after
+
+    if isinstance(value, datetime):
+        return value.strftime(f"%Y-%m-%d{match.group('sep')}%H:%M:%S")
+    return value.isoformat()
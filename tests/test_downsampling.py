@@ -0,0 +1,68 @@
+from datetime import date, datetime, timedelta
+import pytest
+from app.utils.downsampling import OTHER_LABEL, downsample, lttb, top_n_with_other
+
+SERIES = [(float(i), float((i * 7) % 11)) for i in range(100)]
+
+
+@pytest.mark.parametrize("threshold", [1, 2, 3, 10, 99])
+def test_lttb_never_exceeds_the_threshold(threshold):
+    indices = lttb(SERIES, threshold)
+    assert len(indices) == threshold
+    assert indices == sorted(set(indices))
+
+
+def test_lttb_keeps_the_ends():
+    indices = lttb(SERIES, 10)
+    assert indices[0] == 0 and indices[-1] == len(SERIES) - 1
+    assert lttb(SERIES, 2) == [0, len(SERIES) - 1]
+    assert lttb(SERIES, 1) == [len(SERIES) - 1]
+
+
+@pytest.mark.parametrize("threshold", [0, -1, 100, 500])
+def test_lttb_keeps_everything_when_not_reducing(threshold):
+    assert lttb(SERIES, threshold) == list(range(len(SERIES)))
+
+
+def test_lttb_keeps_a_spike():
+    points = [(float(i), 0.0) for i in range(100)]
+    points[57] = (57.0, 100.0)
+    assert 57 in lttb(points, 10)
+
+
+def test_downsample_time_axis_keeps_the_query_order():
+    start = date(2024, 1, 1)
+    points = [(start + timedelta(days=i), i % 5) for i in reversed(range(60))]
+    reduced = downsample(points, 12)
+    assert len(reduced) == 12
+    labels = [label for label, _ in reduced]
+    assert labels == sorted(labels, reverse=True)
+    assert labels[0] == start + timedelta(days=59) and labels[-1] == start
+
+
+@pytest.mark.parametrize("fmt", ["%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S+00:00"])
+def test_iso_date_strings_are_a_time_axis(fmt):
+    start = datetime(2024, 1, 1)
+    points = [((start + timedelta(days=i)).strftime(fmt), i % 5) for i in range(60)]
+    points[33] = (points[33][0], 100)
+    reduced = downsample(points, 12)
+    assert len(reduced) == 12
+    assert reduced[0] == points[0] and reduced[-1] == points[-1]
+    assert points[33] in reduced and OTHER_LABEL not in dict(reduced)
+
+
+def test_downsample_disabled_or_short_series_is_untouched():
+    points = [(i, i) for i in range(5)]
+    assert downsample(points, 0) is points
+    assert downsample(points, None) is points
+    assert downsample(points, 5) is points
+
+
+def test_categorical_axis_keeps_top_categories_and_other():
+    points = [("a", 1), ("b", 50), ("c", 3), ("d", 40), ("e", 2)]
+    assert downsample(points, 3) == [("b", 50), ("d", 40), (OTHER_LABEL, 6)]
+
+
+def test_categorical_non_numeric_values_are_truncated():
+    points = [("a", "x"), ("b", "y"), ("c", "z")]
+    assert top_n_with_other(points, 2) == [("a", "x"), ("b", "y")]
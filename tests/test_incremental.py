@@ -0,0 +1,85 @@
+from datetime import date, datetime, timedelta
+import pytest
+from app.core.settings import settings
+from app.services.incremental import delta_since, delta_statement, is_incremental_query, merge_rows
+from app.utils.result_cache import sql_fingerprint
+
+pytest.importorskip("sqlglot")
+
+DAILY = (
+    "SELECT date_trunc('day', created_at) AS day, count(*) FROM orders"
+    " WHERE created_at >= '2024-01-01' AND created_at < '2024-07-01' GROUP BY 1 ORDER BY 1"
+)
+
+
+def test_delta_raises_the_lower_bound_on_the_base_column():
+    assert delta_statement(DAILY, "postgresql", date(2024, 5, 9)) == (
+        "SELECT date_trunc('day', created_at) AS day, count(*) FROM orders"
+        " WHERE created_at >= '2024-05-09' AND created_at < '2024-07-01' GROUP BY 1 ORDER BY 1"
+    )
+
+
+def test_delta_keeps_timestamp_literals_and_upper_bounds():
+    query = (
+        "SELECT DATE(created_at), count(*) FROM t"
+        " WHERE created_at BETWEEN '2024-01-01 00:00:00' AND '2024-06-30 23:59:59' GROUP BY 1"
+    )
+    assert delta_statement(query, "mysql", datetime(2024, 5, 9, 6, 30)) == (
+        "SELECT DATE(created_at), count(*) FROM t"
+        " WHERE created_at BETWEEN '2024-05-09 06:30:00' AND '2024-06-30 23:59:59' GROUP BY 1"
+    )
+
+
+def test_exclusive_lower_bound_stays_exclusive():
+    query = "SELECT DATE(ts), count(*) FROM t WHERE ts > '2023-12-31' GROUP BY 1"
+    assert delta_statement(query, "mysql", date(2024, 5, 9)) == (
+        "SELECT DATE(ts), count(*) FROM t WHERE ts > '2024-05-08' GROUP BY 1"
+    )
+
+
+def test_window_starting_after_since_is_unchanged():
+    assert delta_statement(DAILY, "postgresql", date(2023, 12, 1)) == DAILY
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT DATE(created_at), count(*) FROM t GROUP BY 1",
+    "SELECT d, sum(c) OVER (ORDER BY d) FROM t WHERE d >= '2024-01-01'",
+    "SELECT d, c FROM t WHERE d >= '2024-01-01' ORDER BY d DESC LIMIT 30",
+    "SELECT d FROM t WHERE d >= '2024-01-01' UNION ALL SELECT d FROM t WHERE d >= '2023-01-01'",
+])
+def test_queries_that_cannot_be_narrowed_need_a_full_read(query):
+    assert delta_statement(query, "postgresql", date(2024, 5, 9)) is None
+
+
+def test_relative_windows_are_not_incremental():
+    assert not is_incremental_query("SELECT d FROM t WHERE d > NOW() - INTERVAL '7 days'")
+    assert is_incremental_query(DAILY)
+
+
+def test_delta_since_rounds_the_overlap_up_to_whole_days(monkeypatch):
+    monkeypatch.setattr(settings, "INCREMENTAL_OVERLAP_SECONDS", 3600)
+    monkeypatch.setattr(settings, "INCREMENTAL_FULL_REFRESH_SECONDS", 0)
+    state = {"fingerprint": sql_fingerprint(DAILY), "max_label_seen": date(2024, 5, 10), "full_refreshed_at": datetime.utcnow()}
+    assert delta_since(state, DAILY) == date(2024, 5, 9)
+    state["max_label_seen"] = datetime(2024, 5, 10, 12)
+    assert delta_since(state, DAILY) == datetime(2024, 5, 10, 11)
+
+
+def test_delta_since_requires_matching_sql():
+    state = {"fingerprint": "other", "max_label_seen": date(2024, 5, 10), "full_refreshed_at": datetime.utcnow()}
+    assert delta_since(state, DAILY) is None
+
+
+def test_merge_replaces_buckets_from_since_and_keeps_partial_ones():
+    start = date(2024, 4, 1)
+    stored = [(start + timedelta(weeks=i), 10) for i in range(6)]
+    since = date(2024, 5, 1)  # Falls inside the week starting 2024-04-29
+    delta = [(date(2024, 4, 29), 2), (date(2024, 5, 6), 11)]
+    merged = merge_rows(stored, delta, since)
+    assert merged == stored[:5] + [(date(2024, 5, 6), 11)]
+
+
+def test_merge_keeps_descending_order():
+    stored = [(date(2024, 5, day), day) for day in (3, 2, 1)]
+    merged = merge_rows(stored, [(date(2024, 5, 3), 30), (date(2024, 5, 4), 40)], date(2024, 5, 3))
+    assert [row[0].day for row in merged] == [4, 3, 2, 1]
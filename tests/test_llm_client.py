@@ -0,0 +1,121 @@
+import asyncio
+from types import SimpleNamespace
+import httpx
+import pytest
+from app.core.settings import settings
+from app.utils import llm_client as llm_client_module
+from app.utils.llm_client import CircuitBreaker, CircuitOpenError, LLMClient
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Only the breaker's clock; the event loop keeps the real one
+    monkeypatch.setattr(llm_client_module, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_BACKOFF_SECONDS", 0.0)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def client_for(handler, failures=2, reset=10.0):
+    client = LLMClient(httpx.MockTransport(handler))
+    client.breaker = CircuitBreaker(failures, reset)
+    return client
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # Only one trial at a time
+
+
+def test_half_open_success_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_half_open_failure_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock.now += 10
+    assert breaker.allow()
+
+
+def test_disabled_breaker_never_opens(clock):
+    breaker = CircuitBreaker(failure_threshold=0, reset_seconds=10)
+    for _ in range(10):
+        breaker.record_failure()
+    assert breaker.allow()
+
+
+def test_open_circuit_fails_fast(clock):
+    calls = []
+    client = client_for(lambda request: calls.append(request) or httpx.Response(503), failures=1)
+    run(client.post("http://llm/queries/", {}, timeout=1, retries=0))
+    with pytest.raises(CircuitOpenError):
+        run(client.post("http://llm/queries/", {}, timeout=1, retries=0))
+    assert len(calls) == 1
+
+
+def test_unexpected_error_in_trial_does_not_wedge_the_breaker(clock):
+    def handler(request):
+        raise ValueError("broken stub")
+
+    client = client_for(handler, failures=1)
+    client.breaker.record_failure()
+    clock.now += 10
+    with pytest.raises(ValueError):
+        run(client.post("http://llm/queries/", {}, timeout=1))
+    assert client.breaker.state == "half-open"
+    assert client.breaker.allow()
+
+
+def test_retryable_status_is_retried_then_succeeds(clock):
+    responses = iter([httpx.Response(503), httpx.Response(429), httpx.Response(200, json={"ok": True})])
+    client = client_for(lambda request: next(responses), failures=5)
+    response = run(client.post("http://llm/queries/", {}, timeout=1, retries=2))
+    assert response.status_code == 200
+    assert client.breaker.failures == 0
+
+
+def test_gateway_timeout_is_not_retried(clock):
+    calls = []
+    client = client_for(lambda request: calls.append(request) or httpx.Response(504), failures=5)
+    response = run(client.post("http://llm/queries/", {}, timeout=1, retries=3))
+    assert response.status_code == 504
+    assert len(calls) == 1
+    assert client.breaker.failures == 1
@@ -0,0 +1,63 @@
+import json
+import pytest
+from app.utils.llm_stream import StreamedJSONFields
+
+FIELDS = ["explanation", "sql_query", "chart_type"]
+
+
+def feed_in_chunks(text: str, size: int):
+    parser = StreamedJSONFields(FIELDS)
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    events.extend(parser.finish())
+    return events
+
+
+def streamed_text(events, field: str) -> str:
+    return "".join(value for kind, name, value in events if kind == "delta" and name == field)
+
+
+def final_values(events) -> dict:
+    return {name: value for kind, name, value in events if kind == "value"}
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 1000])
+def test_escapes_split_across_chunks(size):
+    explanation = 'Orders "per day"\n\tback\\slash é café ☃'
+    payload = {"explanation": explanation, "sql_query": "SELECT 1", "chart_type": "line"}
+    text = json.dumps(payload)  # \u escapes for non-ASCII, \" \n \t \\ for the rest
+
+    events = feed_in_chunks(text, size)
+
+    assert streamed_text(events, "explanation") == explanation
+    assert final_values(events) == payload
+
+
+def test_unicode_escape_is_held_until_complete():
+    parser = StreamedJSONFields(["explanation"])
+    assert parser.feed('{"explanation": "caf') == [("delta", "explanation", "caf")]
+    assert parser.feed("\\u00") == []
+    assert parser.feed("e9") == [("delta", "explanation", "é")]
+    assert parser.feed('"}') == [("value", "explanation", "café")]
+
+
+def test_backslash_at_chunk_end_is_held():
+    parser = StreamedJSONFields(["explanation"])
+    assert parser.feed('{"explanation": "a\\') == [("delta", "explanation", "a")]
+    assert parser.feed('"b"}') == [("delta", "explanation", '"b'), ("value", "explanation", 'a"b')]
+
+
+def test_scalar_fields_are_reported_once_complete():
+    parser = StreamedJSONFields(["explanation", "is_time_based"])
+    events = parser.feed('{"explanation": "x", "is_time_based": tr')
+    assert events == [("delta", "explanation", "x"), ("value", "explanation", "x")]
+    assert parser.feed("ue}") == [("value", "is_time_based", True)]
+
+
+def test_fields_are_reported_in_order():
+    parser = StreamedJSONFields(["explanation", "sql_query"])
+    events = parser.feed('{"sql_query": "SELECT 1", "explanation": "ones"}')
+    assert [(kind, name) for kind, name, _ in events] == [
+        ("delta", "explanation"), ("value", "explanation"), ("delta", "sql_query"), ("value", "sql_query"),
+    ]
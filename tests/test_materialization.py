@@ -0,0 +1,141 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from uuid import uuid4
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.base import Base
+from app.core.settings import settings
+from app.models.post_processing import DashboardMaterialization
+from app.services import materialization
+from app.services.materialization import claim_due_dashboards, snapshot_serves
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metadata.sqlite'}")
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(settings, "MATERIALIZATION_DEFAULT_INTERVAL_SECONDS", 900)
+    monkeypatch.setattr(settings, "MATERIALIZATION_VIEW_THRESHOLD", None)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def add_config(Session, **fields):
+    dashboard_id = uuid4()
+    with Session() as db:
+        db.add(DashboardMaterialization(dashboard_id=dashboard_id, **{"enabled": True, "view_count": 0, **fields}))
+        db.commit()
+    return dashboard_id
+
+
+def test_only_due_dashboards_are_claimed(sessions):
+    never = add_config(sessions)
+    stale = add_config(sessions, last_refreshed_at=datetime.utcnow() - timedelta(hours=1))
+    add_config(sessions, last_refreshed_at=datetime.utcnow() - timedelta(minutes=1))
+    add_config(sessions, enabled=False)
+    custom = add_config(sessions, refresh_interval_seconds=30, last_refreshed_at=datetime.utcnow() - timedelta(minutes=1))
+    with sessions() as db:
+        assert set(claim_due_dashboards(db)) == {never, stale, custom}
+    with sessions() as db:
+        assert claim_due_dashboards(db) == []
+
+
+def test_popular_dashboards_are_claimed_without_opting_in(sessions, monkeypatch):
+    monkeypatch.setattr(settings, "MATERIALIZATION_VIEW_THRESHOLD", 10)
+    popular = add_config(sessions, enabled=False, view_count=10)
+    add_config(sessions, enabled=False, view_count=9)
+    with sessions() as db:
+        assert claim_due_dashboards(db) == [popular]
+
+
+def test_a_dashboard_is_claimed_by_one_worker_only(sessions):
+    dashboard_id = add_config(sessions)
+    with sessions() as first, sessions() as second:
+        # The second worker read the config before the first one stamped it
+        second.query(DashboardMaterialization).all()
+        assert claim_due_dashboards(first) == [dashboard_id]
+        assert claim_due_dashboards(second) == []
+
+
+def charts(*lengths):
+    return {"chart_data": [{"result": [{"label": i, "value": i} for i in range(length)]} for length in lengths]}
+
+
+def test_snapshot_serves_the_default_cap(monkeypatch):
+    monkeypatch.setattr(settings, "CHART_MAX_POINTS", 100)
+    assert snapshot_serves(charts(100), None)
+    assert snapshot_serves(charts(100), 100)
+
+
+def test_snapshot_serves_a_smaller_cap_only_if_nothing_was_cut(monkeypatch):
+    monkeypatch.setattr(settings, "CHART_MAX_POINTS", 100)
+    assert snapshot_serves(charts(20, 50), 50)
+    assert not snapshot_serves(charts(20, 51), 50)
+
+
+def test_snapshot_cannot_serve_more_than_it_kept(monkeypatch):
+    monkeypatch.setattr(settings, "CHART_MAX_POINTS", 100)
+    # Every row or a larger cap: fine unless a series was downsampled to the default cap
+    assert snapshot_serves(charts(20, 99), 0)
+    assert snapshot_serves(charts(20, 99), 500)
+    assert not snapshot_serves(charts(20, 100), 0)
+    assert not snapshot_serves(charts(100), 500)
+
+
+class Worker:
+    """
+    Stubs the metadata DB and the refresh itself out of run_materialization_worker.
+    """
+
+    def __init__(self, monkeypatch, cycles):
+        self.cycles = list(cycles)
+        self.refreshed = []
+        self.running = 0
+        self.max_running = 0
+        self.stop = None
+        monkeypatch.setattr(materialization, "engine", create_engine("sqlite://"))
+        monkeypatch.setattr(materialization, "SessionLocal", lambda: SimpleNamespace(close=lambda: None))
+        monkeypatch.setattr(materialization, "claim_due_dashboards", self.claim)
+        monkeypatch.setattr(materialization, "refresh_dashboard_snapshot", self.refresh)
+        monkeypatch.setattr(settings, "MATERIALIZATION_POLL_SECONDS", 0.01)
+        monkeypatch.setattr(settings, "MATERIALIZATION_MAX_CONCURRENT", 2)
+
+    def claim(self, db):
+        if not self.cycles:
+            self.loop.call_soon_threadsafe(self.stop.set)
+            return []
+        cycle = self.cycles.pop(0)
+        if isinstance(cycle, Exception):
+            raise cycle
+        return cycle
+
+    def refresh(self, dashboard_id):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        self.refreshed.append(dashboard_id)
+        self.running -= 1
+        return 1
+
+    def run(self):
+        async def main():
+            self.loop = asyncio.get_running_loop()
+            self.stop = asyncio.Event()
+            await asyncio.wait_for(materialization.run_materialization_worker(self.stop), timeout=5)
+        asyncio.run(main())
+
+
+def test_worker_refreshes_what_it_claims_within_the_concurrency_cap(monkeypatch):
+    worker = Worker(monkeypatch, [["a", "b", "c", "d"], [], ["e"]])
+    worker.run()
+    assert sorted(worker.refreshed) == ["a", "b", "c", "d", "e"]
+    assert worker.max_running <= 2
+
+
+def test_worker_survives_a_failed_cycle(monkeypatch):
+    worker = Worker(monkeypatch, [RuntimeError("metadata DB down"), ["a"]])
+    worker.run()
+    assert worker.refreshed == ["a"]
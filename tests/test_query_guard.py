@@ -0,0 +1,142 @@
+import json
+import pytest
+from sqlalchemy import create_engine, text
+from app.core.settings import settings
+from app.utils.query_guard import (
+    CAPPED_EXECUTION_OPTIONS, PlanEstimate, QueryRejectedError, capped_statement, check_scan,
+    fetch_capped, parse_explain, statement_timeout, timeout_statements,
+)
+
+
+class Connection:
+    def __init__(self, fail_on=None):
+        self.statements = []
+        self.fail_on = fail_on
+        self.invalidated = False
+
+    def execute(self, statement):
+        self.statements.append(str(statement))
+        if self.fail_on and self.fail_on in str(statement):
+            raise RuntimeError("connection lost")
+
+    def invalidate(self):
+        self.invalidated = True
+
+
+@pytest.fixture
+def max_rows(monkeypatch):
+    def set_cap(cap):
+        monkeypatch.setattr(settings, "QUERY_MAX_ROWS", cap)
+    return set_cap
+
+
+def test_timeout_statements_per_dialect():
+    assert timeout_statements("postgresql", 1500) == ["SET LOCAL statement_timeout = 1500"]
+    assert timeout_statements("mysql", 1500) == ["SET SESSION max_execution_time = 1500"]
+    assert timeout_statements("sqlite", 1500) == []
+    assert timeout_statements("postgresql", 0) == []
+
+
+def test_postgres_timeout_is_not_reset():
+    connection = Connection()
+    with statement_timeout(connection, "postgresql", 1500):
+        connection.execute("SELECT 1")
+    assert connection.statements == ["SET LOCAL statement_timeout = 1500", "SELECT 1"]
+
+
+def test_mysql_session_timeout_is_reset_even_on_error():
+    connection = Connection()
+    with pytest.raises(ValueError):
+        with statement_timeout(connection, "mysql", 1500):
+            raise ValueError("query failed")
+    assert connection.statements == ["SET SESSION max_execution_time = 1500", "SET SESSION max_execution_time = DEFAULT"]
+    assert not connection.invalidated
+
+
+def test_failed_reset_discards_the_connection():
+    connection = Connection(fail_on="DEFAULT")
+    with statement_timeout(connection, "mysql", 1500):
+        pass
+    assert connection.invalidated
+
+
+PG_PLAN = [{"Plan": {
+    "Node Type": "Gather", "Total Cost": 1234.5, "Plan Rows": 900,
+    "Plans": [{"Node Type": "Parallel Seq Scan", "Relation Name": "orders", "Schema": "sales", "Plan Rows": 300}],
+}}]
+
+
+def test_parse_postgres_plan_sees_through_gather():
+    estimate = parse_explain("postgresql", [(PG_PLAN,)])
+    assert (estimate.cost, estimate.rows, estimate.full_scan_table) == (1234.5, 900.0, "sales.orders")
+
+
+def test_parse_postgres_filtered_scan_is_not_a_full_scan():
+    plan = [{"Plan": {"Node Type": "Seq Scan", "Relation Name": "orders", "Filter": "(id > 5)", "Total Cost": 10, "Plan Rows": 3}}]
+    assert parse_explain("postgresql", [(json.dumps(plan),)]).full_scan_table is None
+
+
+def test_parse_mysql_plan():
+    plan = {"query_block": {
+        "cost_info": {"query_cost": "52.10"},
+        "ordering_operation": {"table": {"table_name": "orders", "access_type": "ALL", "rows_produced_per_join": 480}},
+    }}
+    estimate = parse_explain("mysql", [(json.dumps(plan),)])
+    assert (estimate.cost, estimate.rows, estimate.full_scan_table) == (52.1, 480.0, "orders")
+
+
+def test_parse_mysql_grouped_plan_has_no_row_estimate():
+    plan = {"query_block": {"cost_info": {"query_cost": "9"}, "grouping_operation": {"table": {"table_name": "t"}}}}
+    estimate = parse_explain("mysql", [(json.dumps(plan),)])
+    assert (estimate.cost, estimate.rows) == (9.0, None)
+
+
+def test_unreadable_plan_gives_no_estimate():
+    estimate = parse_explain("postgresql", [("not json",)])
+    assert (estimate.cost, estimate.rows) == (None, None)
+
+
+def test_check_scan_trusts_the_larger_profiled_count(monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_MAX_SCAN_ROWS", 1000)
+    check_scan(PlanEstimate(rows=10, full_scan_table="orders"))
+    with pytest.raises(QueryRejectedError, match="full scan of orders"):
+        check_scan(PlanEstimate(rows=10, full_scan_table="orders"), profiled=50000)
+    with pytest.raises(QueryRejectedError):
+        check_scan(PlanEstimate(rows=5000))
+    # A stale, smaller profile does not hide a larger plan estimate
+    with pytest.raises(QueryRejectedError):
+        check_scan(PlanEstimate(rows=5000, full_scan_table="orders"), profiled=10)
+
+
+def test_check_scan_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_MAX_SCAN_ROWS", None)
+    check_scan(PlanEstimate(rows=10 ** 9))
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE t (n INTEGER)"))
+        connection.execute(text("INSERT INTO t VALUES (1), (2), (3), (4), (5)"))
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("cap, expected, truncated", [(None, 5, False), (5, 5, False), (3, 3, True)])
+def test_fetch_capped(engine, max_rows, cap, expected, truncated):
+    max_rows(cap)
+    with engine.connect() as connection:
+        result = connection.execution_options(**CAPPED_EXECUTION_OPTIONS).execute(text("SELECT n FROM t ORDER BY n"))
+        rows = fetch_capped(result)
+        assert result.closed
+    assert rows == [(n,) for n in range(1, expected + 1)]
+    assert rows.truncated is truncated
+
+
+def test_capped_statement_limits_mysql_in_sql(max_rows):
+    max_rows(100)
+    assert capped_statement("mysql", "SELECT n FROM t ORDER BY n;") == "SELECT * FROM (SELECT n FROM t ORDER BY n) AS _capped LIMIT 101"
+    assert capped_statement("postgresql", "SELECT n FROM t") == "SELECT n FROM t"
+    max_rows(None)
+    assert capped_statement("mysql", "SELECT n FROM t") == "SELECT n FROM t"
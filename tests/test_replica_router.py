@@ -0,0 +1,145 @@
+from collections import Counter
+from types import SimpleNamespace
+from uuid import uuid4
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from app.core.settings import settings
+from app.utils import replica_router as replica_router_module
+from app.utils.replica_router import ReadTarget, ReplicaRouter, ReplicaUnavailableError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(replica_router_module, "time", SimpleNamespace(monotonic=clock))
+    monkeypatch.setattr(settings, "REPLICA_HEALTH_CHECK_SECONDS", 15)
+    monkeypatch.setattr(settings, "REPLICA_MAX_LAG_SECONDS", 30.0)
+    monkeypatch.setattr(settings, "REPLICA_STRICT", False)
+    monkeypatch.setattr(settings, "REPLICA_STRICT_DB_IDS", [])
+    return clock
+
+
+@pytest.fixture
+def engines(monkeypatch):
+    """
+    Engines handed out per registry key; a key without one cannot be reached.
+    """
+    engines = {}
+
+    def get_engine_for(key, dsn):
+        if key not in engines:
+            raise OperationalError("connect", {}, Exception("connection refused"))
+        return engines[key]
+
+    monkeypatch.setattr(replica_router_module, "engine_registry", SimpleNamespace(get_engine_for=get_engine_for))
+    yield engines
+    for engine in engines.values():
+        engine.dispose()
+
+
+def setup(monkeypatch, count):
+    external_db = SimpleNamespace(id=uuid4(), connection_string="primary-dsn")
+    replicas = [ReadTarget(f"{external_db.id}:{i}", f"replica-dsn-{i}", str(i)) for i in range(count)]
+    router = ReplicaRouter()
+    monkeypatch.setattr(router, "_load", lambda db_key, previous: replicas)
+    return router, external_db, replicas
+
+
+def mark(clock, *targets, healthy=True, lag=0.0):
+    for target in targets:
+        target.healthy, target.lag_seconds, target.checked_at = healthy, lag, clock.now
+
+
+def test_least_outstanding_replica_wins(monkeypatch, clock):
+    router, external_db, replicas = setup(monkeypatch, 3)
+    mark(clock, *replicas)
+    picked = [router.acquire(external_db) for _ in range(6)]
+    assert Counter(target.replica_id for target in picked) == {"0": 2, "1": 2, "2": 2}
+    for target in picked[:2]:
+        router.release(target)
+    target = router.acquire(external_db)
+    assert target.replica_id in {picked[0].replica_id, picked[1].replica_id}
+    assert target.outstanding == 2
+
+
+def test_lagging_and_unhealthy_replicas_are_skipped(monkeypatch, clock):
+    router, external_db, replicas = setup(monkeypatch, 3)
+    mark(clock, replicas[0], lag=31)
+    mark(clock, replicas[1], healthy=False)
+    mark(clock, replicas[2], lag=29)
+    assert {router.acquire(external_db).replica_id for _ in range(5)} == {"2"}
+
+
+def test_replica_lag_limit_overrides_the_default(monkeypatch, clock):
+    router, external_db, replicas = setup(monkeypatch, 1)
+    replicas[0].max_lag_seconds = 120
+    mark(clock, replicas[0], lag=60)
+    assert router.acquire(external_db) is replicas[0]
+
+
+def test_falls_back_to_the_primary(monkeypatch, clock):
+    router, external_db, replicas = setup(monkeypatch, 2)
+    mark(clock, *replicas, healthy=False)
+    target = router.acquire(external_db)
+    assert target.is_primary and target.encrypted_dsn == "primary-dsn"
+    router.release(target)
+
+
+def test_strict_mode_refuses_the_primary(monkeypatch, clock):
+    router, external_db, replicas = setup(monkeypatch, 1)
+    mark(clock, *replicas, healthy=False)
+    monkeypatch.setattr(settings, "REPLICA_STRICT_DB_IDS", [str(external_db.id)])
+    with pytest.raises(ReplicaUnavailableError):
+        router.acquire(external_db)
+
+
+def test_strict_mode_does_not_apply_without_replicas(monkeypatch, clock):
+    router, external_db, _ = setup(monkeypatch, 0)
+    monkeypatch.setattr(settings, "REPLICA_STRICT", True)
+    assert router.acquire(external_db).is_primary
+
+
+def test_connection_error_takes_a_replica_out_until_it_checks_healthy(monkeypatch, clock, engines):
+    router, external_db, replicas = setup(monkeypatch, 1)
+    engines[replicas[0].key] = create_engine("sqlite://")
+    with router.route(external_db) as target:
+        assert target is replicas[0] and replicas[0].healthy
+
+    with pytest.raises(OperationalError):
+        with router.route(external_db):
+            raise OperationalError("SELECT 1", {}, Exception("server closed the connection unexpectedly"))
+    assert not replicas[0].healthy and replicas[0].outstanding == 0
+
+    assert router.acquire(external_db).is_primary
+    clock.now += 15
+    assert router.acquire(external_db) is replicas[0]
+
+
+def test_query_errors_and_timeouts_keep_the_replica(monkeypatch, clock):
+    router, external_db, replicas = setup(monkeypatch, 1)
+    mark(clock, *replicas)
+    for error in (ValueError("bad column"), OperationalError("SELECT 1", {}, Exception("canceling statement due to statement timeout"))):
+        with pytest.raises(type(error)):
+            with router.route(external_db):
+                raise error
+    assert replicas[0].healthy and replicas[0].outstanding == 0
+
+
+def test_failed_health_check_marks_the_replica_down(monkeypatch, clock, engines):
+    router, external_db, replicas = setup(monkeypatch, 1)
+    assert router.acquire(external_db).is_primary
+    assert router.status(external_db.id)[0]["healthy"] is False
+    assert "connection refused" in replicas[0].last_error
+
+    engines[replicas[0].key] = create_engine("sqlite://")
+    clock.now += 15
+    assert router.status(external_db.id)[0]["healthy"] is True
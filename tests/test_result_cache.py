@@ -0,0 +1,130 @@
+from datetime import date
+from types import SimpleNamespace
+from uuid import uuid4
+import pytest
+from app.core.settings import settings
+from app.utils import lru as lru_module
+from app.utils import result_cache as result_cache_module
+from app.utils.result_cache import QueryResultCache, normalize_sql, sql_fingerprint
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(lru_module, "time", SimpleNamespace(monotonic=clock))
+    monkeypatch.setattr(result_cache_module, "time", SimpleNamespace(time=clock))
+    return clock
+
+
+@pytest.fixture
+def shared_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache" / "query_cache.sqlite")
+    monkeypatch.setattr(settings, "QUERY_CACHE_SHARED_PATH", path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def cache_settings(monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "QUERY_CACHE_TTL_SECONDS", 60)
+
+
+def external_db(min_date=date(2024, 1, 1), max_date=date(2024, 3, 31), id=None):
+    return SimpleNamespace(id=id or uuid4(), min_date=min_date, max_date=max_date)
+
+
+def test_cosmetic_sql_differences_share_a_fingerprint():
+    assert normalize_sql("  SELECT  a,\n b FROM t ;") == "select a, b from t"
+    assert sql_fingerprint("SELECT a FROM t") == sql_fingerprint("select a\n  from t;")
+
+
+def test_quoted_literals_keep_their_case():
+    assert normalize_sql("SELECT * FROM t WHERE name = 'Bob  SMITH'") == "select * from t where name = 'Bob  SMITH'"
+    assert sql_fingerprint("SELECT 'A'") != sql_fingerprint("SELECT 'a'")
+
+
+def test_key_includes_the_date_window():
+    cache = QueryResultCache()
+    db = external_db()
+    key = cache.make_key(db, "SELECT 1")
+    assert key == (str(db.id), sql_fingerprint("SELECT 1"), "2024-01-01/2024-03-31")
+    moved = external_db(max_date=date(2024, 4, 30), id=db.id)
+    assert cache.make_key(moved, "SELECT 1") != key
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = QueryResultCache()
+    key = cache.make_key(external_db(), "SELECT 1")
+    cache.set(key, {"rows": [1]}, ttl=10)
+    clock.now += 9
+    assert cache.get(key) == {"rows": [1]}
+    clock.now += 2
+    assert cache.get(key) is None
+
+
+def test_disabled_cache_stores_nothing(monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_CACHE_ENABLED", False)
+    cache = QueryResultCache()
+    key = cache.make_key(external_db(), "SELECT 1")
+    cache.set(key, [1])
+    assert cache.get(key) is None
+
+
+def test_invalidate_query_drops_every_window_of_one_statement(shared_path):
+    cache = QueryResultCache()
+    db = external_db()
+    other_window = external_db(min_date=date(2023, 1, 1), id=db.id)
+    keys = [cache.make_key(db, "SELECT 1"), cache.make_key(other_window, "SELECT 1"), cache.make_key(db, "SELECT 2")]
+    for key in keys:
+        cache.set(key, key[2])
+    cache.invalidate_query(db.id, "select 1;")
+    assert [cache.get(key) for key in keys] == [None, None, keys[2][2]]
+    # Gone from the shared tier as well, not only from this worker's memory
+    assert QueryResultCache().get(keys[0]) is None
+
+
+def test_invalidate_db_leaves_other_databases(shared_path):
+    cache = QueryResultCache()
+    first, second = external_db(), external_db()
+    first_key, second_key = cache.make_key(first, "SELECT 1"), cache.make_key(second, "SELECT 1")
+    cache.set(first_key, "first")
+    cache.set(second_key, "second")
+    cache.invalidate_db(first.id)
+    assert cache.get(first_key) is None and cache.get(second_key) == "second"
+    assert QueryResultCache().get(first_key) is None
+
+
+def test_shared_tier_serves_other_workers(shared_path):
+    writer, reader = QueryResultCache(), QueryResultCache()
+    key = writer.make_key(external_db(), "SELECT 1")
+    writer.set(key, {"rows": [(1, "a")]})
+    assert reader.get(key) == {"rows": [(1, "a")]}
+    assert reader.stats()["shared_hits"] == 1
+    # Promoted into the reader's memory tier
+    assert reader.get(key) == {"rows": [(1, "a")]}
+    assert reader.stats()["memory_hits"] == 1
+
+
+def test_shared_tier_expires_entries(shared_path, clock):
+    writer, reader = QueryResultCache(), QueryResultCache()
+    key = writer.make_key(external_db(), "SELECT 1")
+    writer.set(key, [1], ttl=10)
+    clock.now += 11
+    assert reader.get(key) is None
+
+
+def test_oversized_results_are_not_cached(monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_CACHE_MAX_ENTRY_BYTES", 100)
+    cache = QueryResultCache()
+    key = cache.make_key(external_db(), "SELECT 1")
+    cache.set(key, "x" * 1000)
+    assert cache.get(key) is None
+    assert cache.stats()["oversized"] == 1
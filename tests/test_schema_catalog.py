@@ -0,0 +1,118 @@
+import hashlib
+import json
+from uuid import uuid4
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.base import Base
+from app.core import db as _metadata_db  # Registers every model, so foreign keys resolve in create_all
+from app.models.pre_processing import CatalogTable, ExternalDBModel
+from app.services.schema_catalog import (
+    list_catalog_tables, load_schema, load_schema_json, load_tables, schema_content_hash, store_catalog,
+)
+
+TABLES = [
+    {
+        "name": "order_items",
+        "columns": [{"name": "item_no", "type": "INTEGER"}, {"name": "order_id", "type": "INTEGER"}, {"name": "sku", "type": "VARCHAR(32)"}],
+        # Key column order differs from the table's column order
+        "primary_keys": {"constrained_columns": ["order_id", "item_no"], "name": "order_items_pkey"},
+        "foreign_keys": [{"column": "order_id", "references": "orders"}],
+    },
+    {
+        "name": "orders",
+        "columns": [{"name": "id", "type": "INTEGER"}, {"name": "ordered_at", "type": "TIMESTAMP"}],
+        "primary_keys": {"constrained_columns": ["id"], "name": None},
+        "foreign_keys": [],
+    },
+]
+
+
+def schema(tables=TABLES, min_date="2024-01-01", max_date="2024-03-31"):
+    return {
+        "tables": json.loads(json.dumps(tables)),
+        "min_date": min_date,
+        "max_date": max_date,
+        "date_ranges": [{"table": "orders", "column": "ordered_at", "min": min_date, "max": max_date}],
+    }
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metadata.sqlite'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def external_db(db):
+    external_db = ExternalDBModel(user_project_role_id=uuid4(), connection_string="encrypted", schema_structure="{}")
+    db.add(external_db)
+    db.commit()
+    return external_db
+
+
+def test_round_trip_keeps_the_schema_info_layout(db, external_db):
+    store_catalog(db, external_db, schema())
+    db.commit()
+    assert load_schema(db, external_db) == {"tables": TABLES}
+    assert json.loads(load_schema_json(db, external_db)) == {"tables": TABLES}
+    assert load_tables(db, external_db, ["orders", "order_items"]) == TABLES
+    assert load_tables(db, external_db, ["orders"]) == TABLES[1:]
+    assert list(list_catalog_tables(db, external_db)) == ["order_items", "orders"]
+
+
+def test_content_hash_ignores_date_bounds(db, external_db):
+    first = store_catalog(db, external_db, schema())
+    db.commit()
+    assert schema_content_hash(db, external_db) == first
+    moved = store_catalog(db, external_db, schema(min_date="2023-01-01", max_date="2024-06-30"))
+    db.commit()
+    assert moved == first == schema_content_hash(db, external_db)
+
+
+def test_content_hash_follows_the_structure(db, external_db):
+    first = store_catalog(db, external_db, schema())
+    db.commit()
+    changed = json.loads(json.dumps(TABLES))
+    changed[1]["columns"][1]["type"] = "DATE"
+    assert store_catalog(db, external_db, schema(changed)) != first
+    db.commit()
+    assert load_schema(db, external_db)["tables"][1]["columns"][1]["type"] == "DATE"
+
+
+def test_only_changed_tables_are_rewritten(db, external_db):
+    store_catalog(db, external_db, schema())
+    db.commit()
+    ids = {row.name: row.id for row in db.query(CatalogTable).all()}
+
+    changed = json.loads(json.dumps(TABLES[1:]))
+    changed[0]["columns"].append({"name": "status", "type": "TEXT"})
+    store_catalog(db, external_db, schema(changed + [{"name": "customers", "columns": [{"name": "id", "type": "INTEGER"}]}]))
+    db.commit()
+
+    rows = {row.name: row.id for row in db.query(CatalogTable).all()}
+    assert set(rows) == {"orders", "customers"}
+    assert rows["orders"] != ids["orders"]
+    assert list(list_catalog_tables(db, external_db)) == ["orders", "customers"]
+
+
+def test_unchanged_table_keeps_its_row(db, external_db):
+    store_catalog(db, external_db, schema())
+    db.commit()
+    ids = {row.name: row.id for row in db.query(CatalogTable).all()}
+    store_catalog(db, external_db, schema(TABLES + [{"name": "customers", "columns": []}]))
+    db.commit()
+    rows = {row.name: row.id for row in db.query(CatalogTable).all()}
+    assert rows["orders"] == ids["orders"] and rows["order_items"] == ids["order_items"]
+
+
+def test_databases_stored_before_the_catalog(db, external_db):
+    external_db.schema_structure = json.dumps({"tables": TABLES, "min_date": "2024-01-01"})
+    db.commit()
+    assert load_schema(db, external_db)["tables"] == TABLES
+    assert load_tables(db, external_db, ["orders"]) == TABLES[1:]
+    assert schema_content_hash(db, external_db) == hashlib.sha256(external_db.schema_structure.encode("utf-8")).hexdigest()
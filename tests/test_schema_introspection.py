@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy.dialects import mysql, postgresql
+from sqlalchemy.dialects.mysql.reflection import MySQLTableDefinitionParser
+from app.utils.schema_introspection import _CATALOG_QUERIES, _read_catalog, catalog_type_name, diff_fingerprints
+
+PG_TYPES = [
+    "integer", "bigint", "character varying(32)", "character varying", "character(2)", "numeric(10,2)",
+    "double precision", "boolean", "date", "timestamp without time zone", "timestamp with time zone",
+    "timestamp(3) without time zone", "time without time zone", "interval", "jsonb", "uuid", "text[]", "integer[]",
+]
+
+MYSQL_TYPES = [
+    "int", "int unsigned", "bigint(20)", "tinyint(1)", "varchar(255)", "char(2)", "decimal(10,2)", "float(7,3)",
+    "double", "datetime", "datetime(6)", "timestamp", "text", "json", "enum('a','b')", "set('x','y')",
+]
+
+
+@pytest.mark.parametrize("raw", PG_TYPES)
+def test_postgres_types_match_the_inspector(raw):
+    dialect = postgresql.dialect()
+    # The Inspector's own parser of format_type() output
+    reflected = dialect._reflect_type(raw, {}, {}, type_description=raw)
+    assert catalog_type_name(dialect, raw) == str(reflected)
+
+
+def test_mysql_types_match_the_inspector():
+    dialect = mysql.dialect()
+    # The Inspector reads MySQL columns from SHOW CREATE TABLE
+    ddl = "CREATE TABLE `t` (\n" + ",\n".join(f"  `c{i}` {raw} DEFAULT NULL" for i, raw in enumerate(MYSQL_TYPES)) + "\n) ENGINE=InnoDB"
+    state = MySQLTableDefinitionParser(dialect, dialect.identifier_preparer).parse(ddl, "utf8mb4")
+    assert [catalog_type_name(dialect, raw) for raw in MYSQL_TYPES] == [str(column["type"]) for column in state.columns]
+
+
+def test_unknown_types_keep_their_catalog_name():
+    assert catalog_type_name(postgresql.dialect(), "mood") == "mood"
+    assert catalog_type_name(postgresql.dialect(), "public.mood[]") == "public.mood[]"
+
+
+class CatalogConnection:
+    """
+    Answers the PostgreSQL catalog queries of _read_catalog from canned rows.
+    """
+
+    dialect = postgresql.dialect()
+
+    def __init__(self, columns, primary_keys=(), foreign_keys=()):
+        # Key queries join pg_attribute too, so they are matched first
+        self.rows = {"contype = 'p'": primary_keys, "contype = 'f'": foreign_keys, "pg_attribute a": columns}
+        self.params = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        if "current_schema" in sql:
+            return Result([("public",)])
+        self.params.append(params)
+        return Result(next(rows for marker, rows in self.rows.items() if marker in sql))
+
+
+class Result(list):
+    def scalar(self):
+        return self[0][0]
+
+
+def test_only_filter_drops_same_named_tables_in_other_schemas():
+    connection = CatalogConnection(
+        columns=[
+            ("public", "orders", "id", "integer"),
+            ("sales", "orders", "id", "bigint"),
+            ("sales", "orders", "total", "numeric(10,2)"),
+        ],
+        primary_keys=[("public", "orders", "orders_pkey", "id"), ("sales", "orders", "orders_pkey", "id")],
+        foreign_keys=[("public", "orders", "id", "sales", "orders")],
+    )
+    tables = _read_catalog(connection, _CATALOG_QUERIES["postgresql"], ["public", "sales"], [("sales", "orders")])
+    assert tables == [{
+        "name": "sales.orders",
+        "columns": [{"name": "id", "type": "BIGINT"}, {"name": "total", "type": "NUMERIC(10, 2)"}],
+        "primary_keys": {"constrained_columns": ["id"], "name": "orders_pkey"},
+        "foreign_keys": [],
+    }]
+    assert all(params["tables"] == ["orders"] for params in connection.params)
+
+
+def test_only_filter_defaults_to_the_current_schema():
+    connection = CatalogConnection(columns=[("public", "orders", "id", "integer"), ("sales", "orders", "id", "bigint")])
+    tables = _read_catalog(connection, _CATALOG_QUERIES["postgresql"], ["public", "sales"], [(None, "orders")])
+    assert [(table["name"], table["columns"][0]["type"]) for table in tables] == [("orders", "INTEGER")]
+
+
+def test_diff_fingerprints():
+    assert diff_fingerprints({"a": "1", "b": "2", "c": "3"}, {"b": "2", "c": "4", "d": "5"}) == {
+        "added": ["d"], "removed": ["a"], "changed": ["c"],
+    }
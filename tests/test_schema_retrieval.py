@@ -0,0 +1,68 @@
+from app.utils.schema_retrieval import SchemaIndex, prune_schema, tokenize
+
+
+def table(name, columns, references=()):
+    return {
+        "name": name,
+        "columns": [{"name": column, "type": "INTEGER"} for column in columns],
+        "primary_keys": {"constrained_columns": [columns[0]], "name": None},
+        "foreign_keys": [{"column": f"{target}_id", "references": target} for target in references],
+    }
+
+
+TABLES = [
+    table("customers", ["id", "name", "country"]),
+    table("orders", ["id", "customer_id", "ordered_at", "total"], references=["customers"]),
+    table("order_items", ["id", "order_id", "product_id", "quantity"], references=["orders", "products"]),
+    table("products", ["id", "title", "price"]),
+    table("audit_log", ["id", "event", "created_at"]),
+]
+
+
+def test_tokenize_splits_identifiers_and_strips_plurals():
+    assert tokenize("orderItems") == ["order", "item"]
+    assert tokenize("customer_orders.total") == ["customer", "order", "total"]
+    assert tokenize("How many orders per status") == ["order", "status"]
+
+
+def test_table_name_outranks_column_match():
+    index = SchemaIndex(TABLES)
+    ranked = [name for name, _ in index.score("orders by total")]
+    assert ranked[0] == "orders"
+
+
+def test_unrelated_tables_are_not_scored():
+    index = SchemaIndex(TABLES)
+    assert "audit_log" not in dict(index.score("product price"))
+
+
+def test_select_adds_join_path_tables():
+    index = SchemaIndex(TABLES)
+    selected = index.select("customer country and product title", top_k=2)
+    # products and customers only connect through order_items and orders
+    assert set(selected) == {"customers", "products", "order_items", "orders"}
+    assert index.join_path("customers", "products") == ["customers", "orders", "order_items", "products"]
+
+
+def test_query_hints_describe_the_tables_they_read():
+    hints = [("SELECT event, count(*) FROM audit_log GROUP BY event", "Security incidents over time")]
+    assert SchemaIndex(TABLES).score("security incidents") == []
+    assert SchemaIndex(TABLES, hints).score("security incidents")[0][0] == "audit_log"
+
+
+def test_prune_schema_keeps_relevance_order_within_budget():
+    index = SchemaIndex(TABLES)
+    schema_info = {"tables": TABLES, "min_date": "2024-01-01"}
+
+    pruned = prune_schema(schema_info, index, "product price", top_k=3, token_budget=0)
+    assert pruned["min_date"] == "2024-01-01"
+    assert pruned["tables"][0]["name"] == "products"
+
+    tight = prune_schema(schema_info, index, "product price", top_k=3, token_budget=1)
+    assert [entry["name"] for entry in tight["tables"]] == ["products"]
+
+
+def test_prune_schema_falls_back_to_every_table():
+    index = SchemaIndex(TABLES)
+    pruned = prune_schema({"tables": TABLES}, index, "zzz", top_k=2, token_budget=0)
+    assert [entry["name"] for entry in pruned["tables"]] == [entry["name"] for entry in TABLES]
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.utils.single_flight import AsyncSingleFlight, SingleFlight
+
+WAITERS = 8
+
+
+def run_threads(flight, fn, key="q"):
+    with ThreadPoolExecutor(max_workers=WAITERS) as executor:
+        futures = [executor.submit(flight.do, key, fn) for _ in range(WAITERS)]
+        return [future.exception(timeout=5) or future.result() for future in futures]
+
+
+def test_concurrent_threads_share_one_call():
+    calls = []
+    release = threading.Event()
+    flight = SingleFlight()
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return {"rows": [1]}
+
+    # Holds the leader's call open while the other threads arrive
+    threading.Timer(0.2, release.set).start()
+    results = run_threads(flight, work)
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.in_flight() == 0
+
+
+def test_error_reaches_every_thread():
+    release = threading.Event()
+    flight = SingleFlight()
+
+    def work():
+        release.wait(5)
+        raise ValueError("query failed")
+
+    threading.Timer(0.2, release.set).start()
+    results = run_threads(flight, work)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.in_flight() == 0
+
+
+def test_later_calls_run_again():
+    flight = SingleFlight()
+    assert flight.do("q", lambda: 1) == 1
+    assert flight.do("q", lambda: 2) == 2
+
+
+def test_tasks_share_one_call():
+    calls = []
+    flight = AsyncSingleFlight()
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"rows": [1]}
+
+    async def main():
+        return await asyncio.gather(*(flight.do("q", work) for _ in range(WAITERS)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.in_flight() == 0
+
+
+def test_error_reaches_every_task():
+    flight = AsyncSingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        raise ValueError("query failed")
+
+    async def main():
+        return await asyncio.gather(*(flight.do("q", work) for _ in range(WAITERS)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.in_flight() == 0
+
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    flight = AsyncSingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.1)
+        return 42
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("q", work))
+        second = asyncio.ensure_future(flight.do("q", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == 42
+
+
+def test_work_is_cancelled_once_no_waiter_remains():
+    flight = AsyncSingleFlight()
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        waiter = asyncio.ensure_future(flight.do("q", work))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert cancelled == [True]
+    assert flight.in_flight() == 0
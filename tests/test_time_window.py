@@ -0,0 +1,87 @@
+import pytest
+from app.utils.time_window import rebind_text, rewrite_time_window, window_edges
+
+pytest.importorskip("sqlglot")
+
+MIN_DATE = "2024-01-01"
+MAX_DATE = "2024-03-31"
+
+
+def rewrite(query: str, time_columns=None):
+    return rewrite_time_window(query, "postgres", MIN_DATE, MAX_DATE, time_columns)
+
+
+def test_date_only_max_includes_the_whole_day():
+    start, stop = window_edges(MIN_DATE, MAX_DATE)
+    assert (start.isoformat(), stop.isoformat()) == ("2024-01-01T00:00:00", "2024-04-01T00:00:00")
+
+
+@pytest.mark.parametrize("query, expected", [
+    (
+        "SELECT d, c FROM t WHERE d BETWEEN '2023-01-01' AND '2023-12-31'",
+        "SELECT d, c FROM t WHERE d BETWEEN '2024-01-01' AND '2024-03-31'",
+    ),
+    (
+        "SELECT d, c FROM t WHERE d >= '2023-01-01' AND d < '2024-01-01'",
+        "SELECT d, c FROM t WHERE d >= '2024-01-01' AND d < '2024-04-01'",
+    ),
+    (
+        "SELECT d, c FROM t WHERE d > '2022-12-31' AND d <= '2023-12-31'",
+        "SELECT d, c FROM t WHERE d > '2023-12-31' AND d <= '2024-03-31'",
+    ),
+    (
+        "SELECT d, c FROM t WHERE '2023-01-01' <= d AND '2024-01-01' > d",
+        "SELECT d, c FROM t WHERE '2024-01-01' <= d AND '2024-04-01' > d",
+    ),
+])
+def test_bound_inclusivity_is_kept(query, expected):
+    rewritten, _ = rewrite(query)
+    assert rewritten == expected
+
+
+def test_timestamp_literals_keep_their_shape():
+    rewritten, replaced = rewrite(
+        "SELECT ts, c FROM t WHERE ts >= '2023-01-01 00:00:00' AND ts <= '2023-12-31 23:59:59'"
+    )
+    assert rewritten == "SELECT ts, c FROM t WHERE ts >= '2024-01-01 00:00:00' AND ts <= '2024-03-31 23:59:59'"
+    assert replaced == {"2023-01-01 00:00:00": "2024-01-01 00:00:00", "2023-12-31 23:59:59": "2024-03-31 23:59:59"}
+
+
+def test_iso_timestamp_separator_is_kept():
+    rewritten, _ = rewrite("SELECT ts FROM t WHERE ts < '2024-01-01T00:00:00'")
+    assert rewritten == "SELECT ts FROM t WHERE ts < '2024-04-01T00:00:00'"
+
+
+def test_wrapped_column_and_cast_literal():
+    rewritten, _ = rewrite("SELECT 1 FROM t WHERE DATE(created_at) >= CAST('2023-01-01' AS DATE)")
+    assert rewritten == "SELECT 1 FROM t WHERE DATE(created_at) >= CAST('2024-01-01' AS DATE)"
+
+
+def test_distinct_windows_are_left_to_the_llm():
+    query = (
+        "SELECT d FROM t WHERE d >= '2023-01-01' AND d < '2024-01-01'"
+        " UNION ALL SELECT d FROM t WHERE d >= '2022-01-01' AND d < '2023-01-01'"
+    )
+    assert rewrite(query) is None
+
+
+def test_equivalent_bounds_describe_one_window():
+    # >= '2024-01-01' and > '2023-12-31' are the same lower edge on date literals
+    query = "SELECT d FROM t WHERE d >= '2023-01-01' AND d > '2022-12-31'"
+    rewritten, _ = rewrite(query)
+    assert rewritten == "SELECT d FROM t WHERE d >= '2024-01-01' AND d > '2023-12-31'"
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT d FROM t WHERE d = '2023-05-05'",
+    "SELECT d FROM t WHERE d IN ('2023-05-05', '2023-05-06')",
+    "SELECT d FROM t WHERE d >= '2023-01-01' AND other >= '2020-01-01'",
+])
+def test_other_date_literals_prevent_a_rewrite(query):
+    assert rewrite(query, ["d"]) is None
+
+
+def test_rebind_text_is_a_single_pass():
+    replaced = {"2023-01-01": "2024-01-01", "2024-01-01": "2024-04-01"}
+    text = "From 2023-01-01 up to 2024-01-01"
+    assert rebind_text(text, replaced) == "From 2024-01-01 up to 2024-04-01"